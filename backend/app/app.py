@@ -1,12 +1,51 @@
-from fastapi import FastAPI
+import asyncio
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.exception_handlers import http_exception_handler
+from fastapi.responses import JSONResponse, PlainTextResponse
 from fastapi.middleware.cors import CORSMiddleware
 from dotenv import load_dotenv
-from app.routes import completions
+from app.routes import completions, jobs
+from app.config import PREWARM_CATEGORIES, INDEX_HEALTH_INTERVAL
+from app.services.admission import Overloaded, find_overload
+from app.services.jobs import job_pool
+from app.services.vector_store import index_registry
+from app.utils.concurrency import run_blocking
+from app.utils.logger import logger
+from app.utils.metrics import MetricsMiddleware, install_span_handler, render_metrics
 
 load_dotenv()
 
+async def check_indexes_periodically():
+    # Prewarm in the background so startup is not held up by slow vector store connections
+    await run_blocking(index_registry.prewarm, PREWARM_CATEGORIES)
+    while True:
+        await asyncio.sleep(INDEX_HEALTH_INTERVAL)
+        # A failed check must not end the loop; cancellation at shutdown still propagates
+        try:
+            await run_blocking(index_registry.check_health)
+        except Exception:
+            logger.exception("Index health check failed")
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Background ingestion workers live for the lifetime of the app
+    await job_pool.start()
+    index_task = asyncio.create_task(check_indexes_periodically())
+    yield
+    index_task.cancel()
+    await job_pool.stop()
+
+def overloaded_response(error: Overloaded) -> JSONResponse:
+    return JSONResponse(
+        status_code=503,
+        content={"detail": str(error)},
+        headers={"Retry-After": str(error.retry_after)},
+    )
+
 def create_app() -> FastAPI:
-    app = FastAPI(title="RAGnarok API")
+    app = FastAPI(title="RAGnarok API", lifespan=lifespan)
+    install_span_handler()
 
     app.add_middleware(
         CORSMiddleware,
@@ -14,12 +53,35 @@ def create_app() -> FastAPI:
         allow_credentials=True,
         allow_methods=["*"],
         allow_headers=["*"],
+        expose_headers=["X-Request-ID", "Retry-After"],
     )
+    app.add_middleware(MetricsMiddleware)
+
+    @app.exception_handler(Overloaded)
+    async def handle_overloaded(request: Request, exc: Overloaded):
+        return overloaded_response(exc)
+
+    @app.exception_handler(HTTPException)
+    async def handle_http_exception(request: Request, exc: HTTPException):
+        # Handlers wrap failures in 500s; a call shed by admission control still surfaces as a 503
+        overload = find_overload(exc)
+        if overload is not None:
+            return overloaded_response(overload)
+        return await http_exception_handler(request, exc)
 
     @app.get("/health", tags=["health"], summary="Check API health status")
     async def health():
         return {"status": "healthy"}
+
+    @app.get("/health/indexes", tags=["health"], summary="Index registry hit/miss and cold-start metrics")
+    async def index_health():
+        return index_registry.stats()
+
+    @app.get("/metrics", tags=["health"], summary="Per-stage and request latency histograms in the Prometheus text format")
+    async def metrics():
+        return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4")
     
     app.include_router(completions.router)
+    app.include_router(jobs.router)
 
     return app
\ No newline at end of file
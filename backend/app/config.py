@@ -1,3 +1,4 @@
+import json
 import os
 from dotenv import load_dotenv
 
@@ -5,6 +6,16 @@ load_dotenv()
 
 os.environ["TRANSFORMERS_NO_ADVISORY_WARNINGS"] = "1"
 
+# On-disk state lives under backend/data by default. Relative paths resolve against backend/ rather than
+# the working directory, so the ingestion pipeline (run from ingestion-pipeline/) opens the same files
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def data_path(name: str, default: str) -> str:
+    """Path setting from the environment, with relative paths resolved against backend/"""
+    return os.path.normpath(os.path.join(BACKEND_DIR, os.getenv(name, default)))
+
+
 API_KEY = os.getenv("API_KEY")
 ASTRA_DB_APPLICATION_TOKEN = os.getenv("ASTRA_DB_APPLICATION_TOKEN")
 ASTRA_DB_API_ENDPOINT = os.getenv("ASTRA_DB_API_ENDPOINT")
@@ -12,4 +23,162 @@ GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
 GROQ_API_KEY = os.getenv("GROQ_API_KEY")
 OLLAMA_BASE_URL = os.getenv("OLLAMA_BASE_URL", "http://localhost:11434")
 
-PDF_STORAGE_DIR = "./data/pdfs"
+# Uploaded PDFs, stored by content hash in one directory per category
+PDF_STORAGE_DIR = data_path("PDF_STORAGE_DIR", "./data/pdfs")
+
+# Upper bound on threads used to offload blocking client calls off the event loop
+BLOCKING_POOL_SIZE = int(os.getenv("BLOCKING_POOL_SIZE", "8"))
+
+# Response cache: memory:// for an in-process LRU, redis://host:port/db for a shared cache (requires redis),
+# and the query embeddings each process keeps in memory per category for semantic matching
+RESPONSE_CACHE_URL = os.getenv("RESPONSE_CACHE_URL", "memory://")
+RESPONSE_CACHE_TTL = int(os.getenv("RESPONSE_CACHE_TTL", "3600"))
+RESPONSE_CACHE_MAX_ENTRIES = int(os.getenv("RESPONSE_CACHE_MAX_ENTRIES", "2048"))
+RESPONSE_CACHE_SIMILARITY = float(os.getenv("RESPONSE_CACHE_SIMILARITY", "0.95"))
+RESPONSE_CACHE_SEMANTIC_ENTRIES = int(os.getenv("RESPONSE_CACHE_SEMANTIC_ENTRIES", "2048"))
+
+# Persistent embedding cache, shared with the ingestion pipeline
+EMBEDDING_CACHE_PATH = data_path("EMBEDDING_CACHE_PATH", "./data/embeddings.sqlite3")
+
+# PDF parsing process pool: worker count and pages handed to each worker task
+PDF_PARSE_WORKERS = int(os.getenv("PDF_PARSE_WORKERS", str(os.cpu_count() or 1)))
+PDF_PAGES_PER_TASK = int(os.getenv("PDF_PAGES_PER_TASK", "16"))
+
+# Background ingestion jobs: persisted queue location, number of concurrent workers, and the
+# longest wait before retrying a job whose upstream calls were shed by admission control
+JOBS_DB_PATH = data_path("JOBS_DB_PATH", "./data/jobs.sqlite3")
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "2"))
+JOB_RETRY_MAX_DELAY = float(os.getenv("JOB_RETRY_MAX_DELAY", "300"))
+
+# Content hashes of PDFs already ingested into the pdf collection
+PDF_INDEX_PATH = data_path("PDF_INDEX_PATH", "./data/pdf_index.sqlite3")
+
+# Vector store backend: "astra" (AstraDB) or "local" (memory-mapped vectors + IVF index + SQLite metadata)
+VECTOR_STORE_BACKEND = os.getenv("VECTOR_STORE_BACKEND", "astra")
+LOCAL_VECTOR_STORE_PATH = data_path("LOCAL_VECTOR_STORE_PATH", "./data/vectors")
+LOCAL_VECTOR_NPROBE = int(os.getenv("LOCAL_VECTOR_NPROBE", "32"))
+LOCAL_VECTOR_MIN_TRAIN_ROWS = int(os.getenv("LOCAL_VECTOR_MIN_TRAIN_ROWS", "4096"))
+
+# Per-session chat memory: SQLite file path or redis://host:port/db, plus in-process LRU bounds
+SESSION_STORE_URL = os.getenv("SESSION_STORE_URL", os.path.join(BACKEND_DIR, "data", "sessions.sqlite3"))
+SESSION_TTL = int(os.getenv("SESSION_TTL", str(7 * 24 * 3600)))
+SESSION_MAX_ACTIVE = int(os.getenv("SESSION_MAX_ACTIVE", "1024"))
+SESSION_IDLE_SECONDS = int(os.getenv("SESSION_IDLE_SECONDS", "900"))
+SESSION_TOKEN_LIMIT = int(os.getenv("SESSION_TOKEN_LIMIT", "3000"))
+
+# Small model used to condense follow-up questions before retrieval
+CONDENSE_MODEL = os.getenv("CONDENSE_MODEL", "llama-3.1-8b-instant")
+
+# Index registry: max cached category indexes, categories built at startup (comma-separated) and health check period
+INDEX_CACHE_MAX_ENTRIES = int(os.getenv("INDEX_CACHE_MAX_ENTRIES", "64"))
+PREWARM_CATEGORIES = [c.strip() for c in os.getenv("PREWARM_CATEGORIES", "").split(",") if c.strip()]
+INDEX_HEALTH_INTERVAL = int(os.getenv("INDEX_HEALTH_INTERVAL", "60"))
+
+# Hybrid retrieval: BM25 keyword index location, default mode ("hybrid" or "dense"), final top-k,
+# candidates fetched from each retriever before reciprocal rank fusion, and the RRF constant
+BM25_INDEX_PATH = data_path("BM25_INDEX_PATH", "./data/bm25.sqlite3")
+RETRIEVAL_MODE = os.getenv("RETRIEVAL_MODE", "hybrid")
+RETRIEVAL_TOP_K = int(os.getenv("RETRIEVAL_TOP_K", "2"))
+RETRIEVAL_CANDIDATES = int(os.getenv("RETRIEVAL_CANDIDATES", "10"))
+RRF_K = int(os.getenv("RRF_K", "60"))
+# Per-category overrides of the above, e.g. {"medical": {"mode": "hybrid", "top_k": 4}, "pdf": {"mode": "dense"}}
+RETRIEVAL_CATEGORY_CONFIG = json.loads(os.getenv("RETRIEVAL_CATEGORY_CONFIG", "{}"))
+
+# Context compression before the LLM call: on/off, 5-gram Jaccard similarity at which chunks count as
+# duplicates, minimum sentence relevance relative to the best sentence, and token budgets (default and per model)
+CONTEXT_COMPRESSION = os.getenv("CONTEXT_COMPRESSION", "true").lower() == "true"
+CONTEXT_DEDUP_THRESHOLD = float(os.getenv("CONTEXT_DEDUP_THRESHOLD", "0.8"))
+CONTEXT_SENTENCE_THRESHOLD = float(os.getenv("CONTEXT_SENTENCE_THRESHOLD", "0.6"))
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "3000"))
+CONTEXT_TOKEN_BUDGETS = json.loads(os.getenv("CONTEXT_TOKEN_BUDGETS", '{"deepseek-r1-distill-llama-70b": 3000}'))
+
+# Multi-source fan-out: seconds each source (category retrieval or web search) gets before it is skipped
+FANOUT_SOURCE_TIMEOUT = float(os.getenv("FANOUT_SOURCE_TIMEOUT", "10"))
+
+# Batch completions: stored results for resuming, prompts embedded/retrieved per chunk,
+# and the LLM schedule (concurrent calls, requests per minute; both must be positive)
+BATCH_DB_PATH = data_path("BATCH_DB_PATH", "./data/batches.sqlite3")
+BATCH_CHUNK_SIZE = int(os.getenv("BATCH_CHUNK_SIZE", "64"))
+BATCH_LLM_CONCURRENCY = int(os.getenv("BATCH_LLM_CONCURRENCY", "4"))
+BATCH_LLM_RPM = float(os.getenv("BATCH_LLM_RPM", "30"))
+
+# Upstream clients: per-service (concurrency limit, timeout in seconds), retries with jittered
+# exponential backoff on 429/5xx and connection errors, and how long idle pooled connections are kept
+UPSTREAM_LIMITS = {
+    "ollama": (int(os.getenv("OLLAMA_CONCURRENCY", "8")), float(os.getenv("OLLAMA_TIMEOUT", "60"))),
+    "groq": (int(os.getenv("GROQ_CONCURRENCY", "8")), float(os.getenv("GROQ_TIMEOUT", "60"))),
+    "gemini": (int(os.getenv("GEMINI_CONCURRENCY", "4")), float(os.getenv("GEMINI_TIMEOUT", "120"))),
+    "astra": (int(os.getenv("ASTRA_CONCURRENCY", "8")), float(os.getenv("ASTRA_TIMEOUT", "30"))),
+}
+UPSTREAM_MAX_RETRIES = int(os.getenv("UPSTREAM_MAX_RETRIES", "3"))
+UPSTREAM_BACKOFF_SECONDS = float(os.getenv("UPSTREAM_BACKOFF_SECONDS", "0.5"))
+KEEPALIVE_EXPIRY = float(os.getenv("KEEPALIVE_EXPIRY", "30"))
+
+# Observability: log format ("json" or "text"), and per-request profiling enabled by the X-Profile header
+LOG_FORMAT = os.getenv("LOG_FORMAT", "json")
+PROFILING_ENABLED = os.getenv("PROFILING_ENABLED", "false").lower() == "true"
+PROFILE_TOP_N = int(os.getenv("PROFILE_TOP_N", "25"))
+
+# Uploads are streamed from the request body to a spool directory (keep it on the same filesystem as
+# PDF_STORAGE_DIR so stored PDFs are renamed, not copied), written UPLOAD_CHUNK_SIZE bytes at a time,
+# with per-kind size limits
+UPLOAD_SPOOL_DIR = data_path("UPLOAD_SPOOL_DIR", "./data/uploads")
+UPLOAD_CHUNK_SIZE = int(os.getenv("UPLOAD_CHUNK_SIZE", str(1024 * 1024)))
+PDF_MAX_BYTES = int(os.getenv("PDF_MAX_BYTES", str(100 * 1024 * 1024)))
+AUDIO_MAX_BYTES = int(os.getenv("AUDIO_MAX_BYTES", str(200 * 1024 * 1024)))
+IMAGE_MAX_BYTES = int(os.getenv("IMAGE_MAX_BYTES", str(20 * 1024 * 1024)))
+BATCH_MAX_BYTES = int(os.getenv("BATCH_MAX_BYTES", str(20 * 1024 * 1024)))
+# Media up to this size is sent to Gemini inline; larger files go through the Gemini file upload API
+GEMINI_INLINE_MAX_BYTES = int(os.getenv("GEMINI_INLINE_MAX_BYTES", str(8 * 1024 * 1024)))
+
+# Reranking of over-fetched candidates: mode ("none" or "cross-encoder", a small local CPU model that
+# needs sentence-transformers), candidates fetched before reranking down to the retrieval top-k, the
+# cross-encoder model and batch size, and how many (query, node) scores are cached.
+# Mode and candidates can be overridden per category in RETRIEVAL_CATEGORY_CONFIG ("rerank", "rerank_candidates")
+RERANK_MODE = os.getenv("RERANK_MODE", "none")
+RERANK_CANDIDATES = int(os.getenv("RERANK_CANDIDATES", "20"))
+RERANK_MODEL = os.getenv("RERANK_MODEL", "cross-encoder/ms-marco-MiniLM-L-6-v2")
+RERANK_BATCH_SIZE = int(os.getenv("RERANK_BATCH_SIZE", "32"))
+RERANK_CACHE_MAX_ENTRIES = int(os.getenv("RERANK_CACHE_MAX_ENTRIES", "20000"))
+
+# Papers fetched and indexed per (category, title) are remembered this long, so repeat requests skip the fetch
+PAPER_CACHE_TTL = int(os.getenv("PAPER_CACHE_TTL", "3600"))
+PAPER_CACHE_MAX_ENTRIES = int(os.getenv("PAPER_CACHE_MAX_ENTRIES", "256"))
+
+# Admission control for upstream calls: requests per second each upstream's token bucket allows (0 = unlimited),
+# the floor of the adaptive (AIMD) concurrency limit whose ceiling is the upstream's concurrency, the multiplier
+# applied to it on 429/503/timeouts, and the bounded wait queue: its length and how long a call may wait in it.
+# Calls that cannot be queued are rejected with a 503 and Retry-After
+UPSTREAM_RATES = {
+    "ollama": float(os.getenv("OLLAMA_RPS", "0")),
+    "groq": float(os.getenv("GROQ_RPS", "0")),
+    "gemini": float(os.getenv("GEMINI_RPS", "0")),
+    "astra": float(os.getenv("ASTRA_RPS", "0")),
+}
+ADMISSION_MIN_LIMIT = int(os.getenv("ADMISSION_MIN_LIMIT", "1"))
+ADMISSION_BACKOFF_RATIO = float(os.getenv("ADMISSION_BACKOFF_RATIO", "0.5"))
+ADMISSION_QUEUE_SIZE = int(os.getenv("ADMISSION_QUEUE_SIZE", "64"))
+ADMISSION_QUEUE_TIMEOUT = float(os.getenv("ADMISSION_QUEUE_TIMEOUT", "15"))
+
+# Model routing for RAG answers: "auto" sends short, factual queries with confident retrieval (best query/sentence
+# cosine in the context at least ROUTING_MIN_CONFIDENCE, as scored by context compression) to FAST_MODEL and everything
+# else, including uncompressed context or a fast answer that gives up, to the 70B reasoning model; "fast" or "strong"
+# pins every query to one tier
+ROUTING_MODE = os.getenv("ROUTING_MODE", "auto")
+FAST_MODEL = os.getenv("FAST_MODEL", "llama-3.1-8b-instant")
+ROUTING_MAX_FAST_WORDS = int(os.getenv("ROUTING_MAX_FAST_WORDS", "24"))
+ROUTING_MIN_CONFIDENCE = float(os.getenv("ROUTING_MIN_CONFIDENCE", "0.6"))
+
+# Media preprocessing before Gemini: images whose long side exceeds MEDIA_IMAGE_MAX_SIDE pixels, or larger than
+# MEDIA_IMAGE_MAX_BYTES, are downscaled and re-encoded as JPEG (needs Pillow); audio is re-encoded to mono at
+# MEDIA_AUDIO_SAMPLE_RATE (any format with ffmpeg installed, WAV only without it) and recordings longer than
+# MEDIA_AUDIO_CHUNK_SECONDS are split into chunks transcribed in parallel.
+# Gemini's analyses and transcriptions are cached by content hash for MEDIA_CACHE_TTL
+MEDIA_PREPROCESSING = os.getenv("MEDIA_PREPROCESSING", "true").lower() == "true"
+MEDIA_IMAGE_MAX_SIDE = int(os.getenv("MEDIA_IMAGE_MAX_SIDE", "1536"))
+MEDIA_IMAGE_MAX_BYTES = int(os.getenv("MEDIA_IMAGE_MAX_BYTES", str(1024 * 1024)))
+MEDIA_IMAGE_QUALITY = int(os.getenv("MEDIA_IMAGE_QUALITY", "85"))
+MEDIA_AUDIO_SAMPLE_RATE = int(os.getenv("MEDIA_AUDIO_SAMPLE_RATE", "16000"))
+MEDIA_AUDIO_BITRATE = os.getenv("MEDIA_AUDIO_BITRATE", "32k")
+MEDIA_AUDIO_CHUNK_SECONDS = int(os.getenv("MEDIA_AUDIO_CHUNK_SECONDS", "600"))
+MEDIA_CACHE_TTL = int(os.getenv("MEDIA_CACHE_TTL", str(24 * 3600)))
@@ -1,3 +1,4 @@
+from typing import Dict
 from pydantic import BaseModel
 
 class CompletionRequest(BaseModel):
@@ -6,3 +7,10 @@ class CompletionRequest(BaseModel):
 
 class CompletionResponse(BaseModel):
     response: str
+
+class PdfCompletionResponse(CompletionResponse):
+    session_id: str
+
+class FanOutCompletionResponse(CompletionResponse):
+    # Per-source outcome: "ok", "timeout" or "error"
+    sources: Dict[str, str]
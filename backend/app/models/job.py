@@ -0,0 +1,13 @@
+from typing import Optional
+from pydantic import BaseModel
+
+class JobResponse(BaseModel):
+    job_id: str
+    kind: str
+    category: str
+    status: str
+    progress: float
+    message: Optional[str] = None
+    error: Optional[str] = None
+    created_at: float
+    updated_at: float
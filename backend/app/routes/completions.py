@@ -1,35 +1,145 @@
-from fastapi import APIRouter, Depends, HTTPException, UploadFile, File
-from app.models.completion import CompletionResponse
-from app.services.file_processing import process_pdf, perform_pdf_query, cleanup_astra_collection
-from app.services.handlers import analyze_audio, analyze_image, process_query, web_search
+import json
+import uuid
+from typing import List, Optional
+from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi.responses import StreamingResponse
+from app.config import PDF_MAX_BYTES, AUDIO_MAX_BYTES, IMAGE_MAX_BYTES, BATCH_MAX_BYTES
+from app.models.completion import CompletionResponse, PdfCompletionResponse, FanOutCompletionResponse
+from app.services.admission import admit
+from app.services.batch import run_batch, parse_batch, batch_store, visible_result
+from app.services.fanout import fan_out_query, stream_fan_out_query
+from app.services.file_processing import process_pdf, perform_pdf_query, stream_pdf_query, cleanup_astra_collection
+from app.services.clients import gemini_upstream, groq_upstream, ollama_upstream
+from app.services.handlers import analyze_audio, analyze_image, process_query, stream_query, web_search
 from app.services.papers import process_papers, paper_loader
 from app.utils.auth import verify_api_key
+from app.utils.concurrency import run_blocking
 from app.utils.logger import logger
+from app.utils.streaming import to_sse
+from app.utils.uploads import SpooledUpload, UPLOAD_OPENAPI, upload_file
 
 router = APIRouter(prefix="/openai/v1/completions")
 
+# Priority classes: chat and media answers go ahead of ingestion, which goes ahead of batches
+ollama, groq, gemini = ollama_upstream.admission, groq_upstream.admission, gemini_upstream.admission
+interactive_rag = [Depends(admit("interactive", ollama, groq))]
+interactive_media = [Depends(admit("interactive", gemini, groq))]
+ingestion = [Depends(admit("standard", ollama, groq))]
+
+# Uploads are read by these dependencies, after admission and the API key check
+pdf_upload = upload_file(PDF_MAX_BYTES, suffix=".pdf")
+audio_upload = upload_file(AUDIO_MAX_BYTES)
+image_upload = upload_file(IMAGE_MAX_BYTES)
+batch_upload = upload_file(BATCH_MAX_BYTES)
+
 
 # Text completion Endpoint
-@router.post("/text")
-def text_completion(
+@router.post("/text", dependencies=interactive_rag)
+async def text_completion(
     category: str,
     prompt: str, 
+    stream: bool = False,
+    reasoning: bool = False,
     secret: str = Depends(verify_api_key)
 ):
-    """Handle text completion requests"""
+    """
+    Handle text completion requests, optionally streamed as Server-Sent Events
+    Set `reasoning` to keep the reasoning model's <think> output in the answer
+    """
     try:
         logger.info(f"Received text completion request for category: {category}")
 
-        response_text = process_query(category, prompt)
+        if stream:
+            tokens = await stream_query(category, prompt, reasoning)
+            return StreamingResponse(to_sse(tokens), media_type="text/event-stream")
+
+        response_text = await process_query(category, prompt, reasoning)
         return CompletionResponse(response=response_text)
     except Exception as e:
         logger.error(f"Error in text completion: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
 
+# Multi-category / multi-source completion endpoint
+@router.post("/multi", dependencies=interactive_rag)
+async def multi_completion(
+    prompt: str,
+    categories: List[str] = Query(...),
+    web: bool = False,
+    stream: bool = False,
+    reasoning: bool = False,
+    secret: str = Depends(verify_api_key)
+):
+    """
+    Answer one prompt from several categories, and optionally web search, with a single generation
+    Sources are queried concurrently; one that times out or fails is skipped and reported in `sources`.
+    Set `reasoning` to keep the reasoning model's <think> output in the answer
+    """
+    try:
+        logger.info(f"Received multi-source completion request for categories: {categories}")
+
+        if stream:
+            tokens, sources = await stream_fan_out_query(categories, prompt, web, reasoning)
+            return StreamingResponse(
+                to_sse(tokens),
+                media_type="text/event-stream",
+                headers={"X-Sources": json.dumps(sources)},
+            )
+
+        response_text, sources = await fan_out_query(categories, prompt, web, reasoning)
+        return FanOutCompletionResponse(response=response_text, sources=sources)
+    except Exception as e:
+        logger.error(f"Error in multi-source completion: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+# Batch completion endpoint
+@router.post("/batch", dependencies=[Depends(admit("bulk"))], openapi_extra=UPLOAD_OPENAPI)
+async def batch_completion(
+    reasoning: bool = False,
+    secret: str = Depends(verify_api_key),
+    upload: SpooledUpload = Depends(batch_upload)
+):
+    """
+    Answer a JSONL file of {"category": ..., "prompt": ...} lines, streaming one JSON result per line
+    as each completes. Results are stored under the batch ID, the file's SHA-256, so resubmitting
+    an interrupted batch only runs the lines that have not finished.
+    Set `reasoning` to keep the reasoning model's <think> output in the answers
+    """
+    try:
+        try:
+            payload = await run_blocking(upload.read_bytes)
+        finally:
+            await run_blocking(upload.remove)
+        batch_id = upload.sha256
+        items = parse_batch(payload)
+        logger.info(f"Received batch {batch_id} with {len(items)} lines")
+
+        async def ndjson():
+            async for result in run_batch(batch_id, items, reasoning):
+                yield json.dumps(result) + "\n"
+
+        return StreamingResponse(ndjson(), media_type="application/x-ndjson", headers={"X-Batch-ID": batch_id})
+    except Exception as e:
+        logger.error(f"Error in batch completion: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@router.get("/batch/{batch_id}")
+async def batch_results(batch_id: str, reasoning: bool = False, secret: str = Depends(verify_api_key)):
+    """Return the stored results of a batch as JSON lines, ordered by input line"""
+    results = await run_blocking(batch_store.results, batch_id)
+    if not results:
+        raise HTTPException(status_code=404, detail="Batch not found")
+    return StreamingResponse(
+        iter([json.dumps(visible_result(result, reasoning)) + "\n" for result in results.values()]),
+        media_type="application/x-ndjson",
+    )
+
+
 # Web Search completion endpoint
-@router.post("/search")
-def web_search_completion(
+@router.post("/search", dependencies=[Depends(admit("interactive", gemini))])
+async def web_search_completion(
     category: str,
     prompt: str, 
     secret: str = Depends(verify_api_key)
@@ -38,7 +148,7 @@ def web_search_completion(
     try:
         logger.info(f"Received web search request for category: {category}")
 
-        search_response = web_search(category, prompt)
+        search_response = await web_search(category, prompt)
         return CompletionResponse(response=search_response)
     except Exception as e:
         logger.error(f"Error in web search: {str(e)}")
@@ -46,7 +156,7 @@ def web_search_completion(
 
 
 # Research Papers Endpoint
-@router.post("/papers")
+@router.post("/papers", dependencies=ingestion)
 async def paper_completion(
     category: str,
     prompt: str,
@@ -60,40 +170,44 @@ async def paper_completion(
         loader = paper_loader(category)
 
         # Process Papers and add to vector store
-        _ = process_papers(category, paper, loader)
+        _ = await process_papers(category, paper, loader)
         
         # Query the processed content
-        response_text = process_query(category, prompt)
+        response_text = await process_query(category, prompt)
         
         return CompletionResponse(response=response_text)
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Error in research paper completion: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
 
 # Audio completion endpoint
-@router.post("/audio")
+@router.post("/audio", dependencies=interactive_media, openapi_extra=UPLOAD_OPENAPI)
 async def audio_completion(
     category: str,
-    file: UploadFile = File(...),
-    secret: str = Depends(verify_api_key)
+    secret: str = Depends(verify_api_key),
+    upload: SpooledUpload = Depends(audio_upload)
 ):
     """Handle audio completion requests"""
     try:
         logger.info(f"Received audio completion request for category: {category}")
         
-        # Read audio file
-        audio_bytes = await file.read()
-        
         # Get transcription and analysis from Gemini
-        audio_analysis = analyze_audio(audio_bytes, category)
+        try:
+            audio_analysis = await analyze_audio(upload, category)
+        finally:
+            await run_blocking(upload.remove)
         
         # Combine audio analysis with prompt
         combined_prompt = f"User Prompt: {audio_analysis}"
         
         # Process through RAG system
-        response_text = process_query(category, combined_prompt)
+        response_text = await process_query(category, combined_prompt)
         return CompletionResponse(response=response_text)
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Error in audio completion: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
@@ -106,66 +220,81 @@ async def clean_collection(secret: str = Depends(verify_api_key)):
     try:
         logger.info(f"Initiated pdf_collections destruction")
 
-        cleanup_astra_collection()
+        await cleanup_astra_collection()
     except Exception as e:
         logger.error(f"Error in dropping pdf collection: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
 
 # Document endpoint
-@router.post("/pdfs")
+@router.post("/pdfs", dependencies=ingestion, openapi_extra=UPLOAD_OPENAPI)
 async def pdf_completion(
     category: str,
     prompt: str,
-    file: UploadFile = File(...),
-    secret: str = Depends(verify_api_key)
+    stream: bool = False,
+    session_id: Optional[str] = None,
+    reasoning: bool = False,
+    secret: str = Depends(verify_api_key),
+    upload: SpooledUpload = Depends(pdf_upload)
 ):
-    """Handle PDF upload, processing, and querying"""
+    """
+    Handle PDF upload, processing, and querying, optionally streamed as Server-Sent Events
+    Pass the returned session_id on follow-up requests to continue the conversation, and
+    set `reasoning` to keep the reasoning model's <think> output in the answer
+    """
     try:
         logger.info(f"Received PDF completion request for category: {category}")
 
-        if not file.filename.lower().endswith('.pdf'):
-            raise HTTPException(status_code=400, detail="File must be a PDF")
-        
-        # Read PDF file
-        pdf_bytes = await file.read()
-        
+        session_id = session_id or uuid.uuid4().hex
+
         # Process PDF and add to vector store
-        _ = process_pdf(pdf_bytes, category)
+        _ = await process_pdf(upload, category)
         
         # Query the processed content
-        response_text = perform_pdf_query(prompt)
+        if stream:
+            tokens = await stream_pdf_query(prompt, session_id, reasoning)
+            return StreamingResponse(
+                to_sse(tokens),
+                media_type="text/event-stream",
+                headers={"X-Session-ID": session_id},
+            )
+
+        response_text = await perform_pdf_query(prompt, session_id, reasoning)
         
-        return CompletionResponse(response=response_text)
+        return PdfCompletionResponse(response=response_text, session_id=session_id)
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Error in PDF completion: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
 
 # Image completion endpoint
-@router.post("/image")
+@router.post("/image", dependencies=interactive_media, openapi_extra=UPLOAD_OPENAPI)
 async def image_completion(
     category: str,
     prompt: str,
-    file: UploadFile = File(...),
-    secret: str = Depends(verify_api_key)
+    secret: str = Depends(verify_api_key),
+    upload: SpooledUpload = Depends(image_upload)
 ):
     """Handle image completion requests"""
     try:
         logger.info(f"Received image completion request for category: {category}")
         
-        # Read image file
-        image_bytes = await file.read()
-        
         # Get description and analysis from Gemini
-        image_analysis = analyze_image(image_bytes, category, prompt)
+        try:
+            image_analysis = await analyze_image(upload, category, prompt)
+        finally:
+            await run_blocking(upload.remove)
         
         # Combine image analysis with prompt
         combined_prompt = f"Image description: {image_analysis}\nUser prompt: {prompt}"
         
         # Process through RAG system
-        response_text = process_query(category, combined_prompt)
+        response_text = await process_query(category, combined_prompt)
         return CompletionResponse(response=response_text)
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Error in image completion: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
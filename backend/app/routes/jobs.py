@@ -0,0 +1,70 @@
+from fastapi import APIRouter, Depends, HTTPException
+from app.config import PDF_MAX_BYTES
+from app.models.job import JobResponse
+from app.services.file_processing import save_pdf_file
+from app.services.jobs import job_pool
+from app.utils.auth import verify_api_key
+from app.utils.concurrency import run_blocking
+from app.utils.logger import logger
+from app.utils.uploads import SpooledUpload, UPLOAD_OPENAPI, upload_file
+
+router = APIRouter(prefix="/openai/v1/jobs")
+
+pdf_upload = upload_file(PDF_MAX_BYTES, suffix=".pdf")
+
+
+def to_response(job: dict) -> JobResponse:
+    return JobResponse(job_id=job["id"], **{key: job[key] for key in JobResponse.model_fields if key != "job_id"})
+
+
+# PDF ingestion job endpoint
+@router.post("/pdfs", status_code=202, openapi_extra=UPLOAD_OPENAPI)
+async def enqueue_pdf(
+    category: str,
+    secret: str = Depends(verify_api_key),
+    upload: SpooledUpload = Depends(pdf_upload)
+):
+    """Save an uploaded PDF and queue it for ingestion, returning the job ID immediately"""
+    try:
+        logger.info(f"Received PDF ingestion job for category: {category}")
+
+        pdf_path = await run_blocking(save_pdf_file, upload, category)
+
+        job_id = await job_pool.submit("pdf", category, {"path": pdf_path})
+        return to_response(await run_blocking(job_pool.store.get, job_id))
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error queueing PDF ingestion: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+# Research paper ingestion job endpoint
+@router.post("/papers", status_code=202)
+async def enqueue_papers(
+    category: str,
+    paper: str,
+    secret: str = Depends(verify_api_key)
+):
+    """Queue a research paper fetch and ingestion, returning the job ID immediately"""
+    if category not in ("tech", "medical"):
+        raise HTTPException(status_code=400, detail="Papers are only available for tech and medical categories")
+
+    try:
+        logger.info(f"Received research paper ingestion job for category: {category}")
+
+        job_id = await job_pool.submit("papers", category, {"paper": paper})
+        return to_response(await run_blocking(job_pool.store.get, job_id))
+    except Exception as e:
+        logger.error(f"Error queueing paper ingestion: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+# Job status endpoint
+@router.get("/{job_id}")
+async def job_status(job_id: str, secret: str = Depends(verify_api_key)) -> JobResponse:
+    """Get the status and progress of an ingestion job"""
+    job = await run_blocking(job_pool.store.get, job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return to_response(job)
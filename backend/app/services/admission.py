@@ -0,0 +1,231 @@
+"""
+Admission control for upstream calls
+
+Each upstream gets a token bucket (its request rate) and an adaptive concurrency limit:
+the limit grows by one per limit's worth of successful calls and is cut multiplicatively
+when the upstream answers 429/503 or times out (AIMD). Calls beyond the limit wait in a
+bounded queue, served in priority order; once the queue is full, a call is rejected with
+`Overloaded` (a 503 with Retry-After) unless it can displace a lower-priority waiter, and
+a queued call that outlives its deadline is rejected too.
+"""
+import asyncio
+import itertools
+import math
+import time
+from contextlib import asynccontextmanager
+from contextvars import ContextVar
+from typing import AsyncIterator, List, Optional, Tuple
+import httpx
+from app.utils.concurrency import TokenBucket
+from app.utils.logger import logger
+from app.utils.metrics import (
+    admission_in_flight,
+    admission_limit,
+    admission_queue_depth,
+    admission_rejections,
+    admission_wait_seconds,
+)
+
+# Priority classes, most urgent first
+PRIORITIES = ("interactive", "standard", "bulk")
+
+# Priority class of the request being handled; set per route and inherited by tasks it starts
+request_priority: ContextVar[str] = ContextVar("request_priority", default="standard")
+
+
+class Overloaded(Exception):
+    """An upstream call was shed; the client should retry after `retry_after` seconds"""
+
+    def __init__(self, upstream: str, retry_after: int, reason: str):
+        super().__init__(f"{upstream} is overloaded ({reason}), retry in {retry_after}s")
+        self.upstream = upstream
+        self.retry_after = retry_after
+        self.reason = reason
+
+
+def find_overload(error: Optional[BaseException]) -> Optional[Overloaded]:
+    """The Overloaded error behind an exception, if any, following re-raises"""
+    seen = set()
+    while error is not None and id(error) not in seen:
+        if isinstance(error, Overloaded):
+            return error
+        seen.add(id(error))
+        error = error.__cause__ or error.__context__
+    return None
+
+
+def is_overload_signal(error: BaseException) -> bool:
+    """Rate limits, unavailability and timeouts mean the upstream wants less concurrency"""
+    for candidate in (error, error.__cause__):
+        if candidate is None:
+            continue
+        status = getattr(candidate, "status_code", None)
+        if status is None and getattr(candidate, "response", None) is not None:
+            status = getattr(candidate.response, "status_code", None)
+        if status in (429, 503):
+            return True
+        if isinstance(candidate, (TimeoutError, asyncio.TimeoutError, httpx.TimeoutException)):
+            return True
+    return False
+
+
+class AdmissionController:
+    """Token bucket, AIMD concurrency limit and bounded priority queue for one upstream"""
+
+    def __init__(
+        self,
+        name: str,
+        max_limit: int,
+        min_limit: int,
+        rate: float,
+        backoff_ratio: float,
+        queue_size: int,
+        queue_timeout: float,
+    ):
+        self.name = name
+        self.max_limit = max_limit
+        self.min_limit = min(min_limit, max_limit)
+        self.backoff_ratio = backoff_ratio
+        self.queue_size = queue_size
+        self.queue_timeout = queue_timeout
+        self.limit = float(max_limit)
+        self.in_flight = 0
+        self.bucket = TokenBucket(rate, max(1.0, rate)) if rate > 0 else None
+        # (priority rank, arrival order, future); the queue is short, so it is scanned rather than kept as a heap
+        self._waiters: List[Tuple[int, int, asyncio.Future]] = []
+        self._arrivals = itertools.count()
+        self._latency: Optional[float] = None
+        self._last_decrease = 0.0
+        self._publish()
+
+    @property
+    def capacity(self) -> int:
+        return max(self.min_limit, int(self.limit))
+
+    def _publish(self) -> None:
+        admission_queue_depth.set(len(self._waiters), self.name)
+        admission_in_flight.set(self.in_flight, self.name)
+        admission_limit.set(self.limit, self.name)
+
+    def retry_after(self) -> int:
+        """Rough time for the queue ahead to drain, in whole seconds"""
+        ahead = len(self._waiters) + 1
+        seconds = (self._latency or 1.0) * ahead / self.capacity
+        if self.bucket is not None:
+            seconds = max(seconds, ahead / self.bucket.rate)
+        return max(1, math.ceil(seconds))
+
+    def _reject(self, priority: str, reason: str) -> Overloaded:
+        admission_rejections.inc(1, self.name, priority, reason)
+        logger.warning(f"Rejected {priority} {self.name} call: {reason}")
+        return Overloaded(self.name, self.retry_after(), reason)
+
+    def _lowest_waiter(self, rank: int) -> Optional[Tuple[int, int, asyncio.Future]]:
+        """The most recent waiter of the lowest priority below `rank`, which a new call may displace"""
+        candidates = [waiter for waiter in self._waiters if waiter[0] > rank]
+        return max(candidates, key=lambda waiter: (waiter[0], waiter[1])) if candidates else None
+
+    def check(self, priority: Optional[str] = None) -> None:
+        """Raise Overloaded right away if a call of this priority would be rejected now"""
+        priority = priority or request_priority.get()
+        rank = PRIORITIES.index(priority)
+        if (
+            self.in_flight >= self.capacity
+            and len(self._waiters) >= self.queue_size
+            and self._lowest_waiter(rank) is None
+        ):
+            raise self._reject(priority, "queue_full")
+
+    async def acquire(self, priority: Optional[str] = None) -> None:
+        """Wait for a slot (and a rate token) or raise Overloaded"""
+        priority = priority or request_priority.get()
+        rank = PRIORITIES.index(priority)
+        start = time.monotonic()
+
+        if self.in_flight < self.capacity and not self._waiters:
+            self.in_flight += 1
+        else:
+            if len(self._waiters) >= self.queue_size:
+                displaced = self._lowest_waiter(rank)
+                if displaced is None:
+                    raise self._reject(priority, "queue_full")
+                self._waiters.remove(displaced)
+                displaced[2].set_exception(self._reject(PRIORITIES[displaced[0]], "shed"))
+            future = asyncio.get_running_loop().create_future()
+            waiter = (rank, next(self._arrivals), future)
+            self._waiters.append(waiter)
+            self._publish()
+            try:
+                await asyncio.wait_for(future, self.queue_timeout)
+            except BaseException as e:
+                if future.done() and not future.cancelled() and future.exception() is None:
+                    # The slot was granted just as this call gave up, so hand it on
+                    self.release()
+                elif waiter in self._waiters:
+                    self._waiters.remove(waiter)
+                    self._publish()
+                if isinstance(e, asyncio.TimeoutError):
+                    raise self._reject(priority, "timeout") from None
+                raise
+
+        if self.bucket is not None:
+            remaining = self.queue_timeout - (time.monotonic() - start)
+            try:
+                await asyncio.wait_for(self.bucket.acquire(), max(0.0, remaining))
+            except BaseException as e:
+                self.release()
+                if isinstance(e, asyncio.TimeoutError):
+                    raise self._reject(priority, "rate") from None
+                raise
+        admission_wait_seconds.observe(time.monotonic() - start, self.name, priority)
+        self._publish()
+
+    def release(self, error: Optional[BaseException] = None, latency: Optional[float] = None) -> None:
+        """Free a slot, adapting the limit to how the call went, and wake the next waiters"""
+        self.in_flight -= 1
+        now = time.monotonic()
+        if error is not None and is_overload_signal(error):
+            # Calls already in flight fail together; cut once per round trip, not once per failure
+            if now - self._last_decrease > (self._latency or 1.0):
+                self.limit = max(float(self.min_limit), self.limit * self.backoff_ratio)
+                self._last_decrease = now
+                logger.warning(f"{self.name} is overloaded ({error!r}), concurrency limit cut to {self.limit:.1f}")
+        elif error is None and latency is not None:
+            self.limit = min(float(self.max_limit), self.limit + 1 / self.limit)
+            self._latency = latency if self._latency is None else 0.8 * self._latency + 0.2 * latency
+
+        while self._waiters and self.in_flight < self.capacity:
+            waiter = min(self._waiters, key=lambda waiter: (waiter[0], waiter[1]))
+            self._waiters.remove(waiter)
+            if not waiter[2].done():
+                self.in_flight += 1
+                waiter[2].set_result(None)
+        self._publish()
+
+    @asynccontextmanager
+    async def slot(self, priority: Optional[str] = None) -> AsyncIterator[None]:
+        """Hold a slot for the duration of a call"""
+        await self.acquire(priority)
+        start = time.monotonic()
+        try:
+            yield
+        except BaseException as e:
+            self.release(e)
+            raise
+        self.release(latency=time.monotonic() - start)
+
+
+def admit(priority: str, *controllers: AdmissionController):
+    """
+    Route dependency that puts the request in a priority class and rejects it before any
+    work is done when one of the upstreams it needs could not queue it
+    """
+    if priority not in PRIORITIES:
+        raise ValueError(f"Unknown priority class: {priority}")
+
+    async def dependency() -> None:
+        request_priority.set(priority)
+        for controller in controllers:
+            controller.check(priority)
+
+    return dependency
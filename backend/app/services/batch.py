@@ -0,0 +1,147 @@
+import asyncio
+import json
+import sqlite3
+import threading
+from pathlib import Path
+from typing import Any, AsyncIterator, Dict, List
+from llama_index.core import QueryBundle
+from app.config import BATCH_DB_PATH, BATCH_CHUNK_SIZE, BATCH_LLM_CONCURRENCY, BATCH_LLM_RPM
+from app.services.hybrid import build_query_engine
+from app.services.response_cache import response_cache, RAG_NAMESPACE
+from app.services.routing import visible_answer
+from app.services.vector_store import get_vector_store, doc_llm, embed_model
+from app.utils.concurrency import run_blocking, TokenBucket
+from app.utils.logger import logger
+
+
+class BatchStore:
+    """Completed batch results in SQLite, so a resubmitted batch only runs its unfinished lines"""
+
+    def __init__(self, path: str):
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS batch_results (
+                batch_id TEXT NOT NULL,
+                line INTEGER NOT NULL,
+                result TEXT NOT NULL,
+                PRIMARY KEY (batch_id, line)
+            )
+            """
+        )
+        self._conn.commit()
+
+    def results(self, batch_id: str) -> Dict[int, Dict[str, Any]]:
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT line, result FROM batch_results WHERE batch_id = ? ORDER BY line", (batch_id,)
+            ).fetchall()
+        return {line: json.loads(result) for line, result in rows}
+
+    def add(self, batch_id: str, line: int, result: Dict[str, Any]) -> None:
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO batch_results (batch_id, line, result) VALUES (?, ?, ?)",
+                (batch_id, line, json.dumps(result)),
+            )
+            self._conn.commit()
+
+
+batch_store = BatchStore(BATCH_DB_PATH)
+
+# Shared by every running batch so together they stay within the LLM rate limit
+llm_bucket = TokenBucket(rate=BATCH_LLM_RPM / 60, capacity=BATCH_LLM_CONCURRENCY)
+llm_slots = asyncio.Semaphore(BATCH_LLM_CONCURRENCY)
+
+
+def parse_batch(payload: bytes) -> List[Dict[str, Any]]:
+    """One item per non-empty JSONL line: {"category": ..., "prompt": ...}; malformed lines carry an error"""
+    items = []
+    for line, raw in enumerate(payload.decode("utf-8").splitlines()):
+        if not raw.strip():
+            continue
+        try:
+            record = json.loads(raw)
+            items.append({"line": line, "category": str(record["category"]), "prompt": str(record["prompt"])})
+        except (ValueError, KeyError, TypeError) as e:
+            items.append({"line": line, "error": f"Invalid batch line: {str(e)}"})
+    return items
+
+
+async def answer(item: Dict[str, Any], embedding: List[float]) -> Dict[str, Any]:
+    """Retrieve concurrently with other items, then wait for an LLM slot and the rate limit to generate"""
+    category, prompt = item["category"], item["prompt"]
+    result = {"line": item["line"], "category": category, "prompt": prompt}
+
+    cached = await response_cache.get(RAG_NAMESPACE, category, prompt, embedding)
+    if cached is not None:
+        return {**result, "response": cached}
+
+    index = await run_blocking(get_vector_store, category)
+    query_engine = build_query_engine(index, category, doc_llm)
+    query_bundle = QueryBundle(query_str=prompt, embedding=embedding)
+    nodes = await query_engine.aretrieve(query_bundle)
+
+    async with llm_slots:
+        await llm_bucket.acquire()
+        response = await query_engine.asynthesize(query_bundle, nodes)
+
+    await response_cache.set(RAG_NAMESPACE, category, prompt, str(response.response), embedding)
+    return {**result, "response": str(response.response)}
+
+
+def visible_result(result: Dict[str, Any], reasoning: bool) -> Dict[str, Any]:
+    """A result as returned to the client; the store keeps the raw answer, so either form can be replayed"""
+    if "response" not in result:
+        return result
+    return {**result, "response": visible_answer(result["response"], reasoning)}
+
+
+async def safe_answer(item: Dict[str, Any], embedding: List[float]) -> Dict[str, Any]:
+    try:
+        return await answer(item, embedding)
+    except Exception as e:
+        logger.error(f"Error answering batch line {item['line']}: {str(e)}")
+        return {"line": item["line"], "category": item["category"], "prompt": item["prompt"], "error": str(e)}
+
+
+async def run_batch(batch_id: str, items: List[Dict[str, Any]], reasoning: bool = False) -> AsyncIterator[Dict[str, Any]]:
+    """
+    Answer a batch, yielding results as they complete
+    Lines already answered under this batch ID are replayed from the store instead of re-run;
+    failed lines are not stored, so resubmitting the batch retries them. Answers have their
+    <think> reasoning stripped unless `reasoning` is set
+    """
+    done = await run_blocking(batch_store.results, batch_id)
+    for result in done.values():
+        yield visible_result(result, reasoning)
+
+    pending = [item for item in items if item["line"] not in done]
+    for item in pending:
+        if "error" in item:
+            yield item
+    pending = [item for item in pending if "error" not in item]
+    logger.info(f"Batch {batch_id}: {len(done)} lines already done, {len(pending)} to run")
+
+    for start in range(0, len(pending), BATCH_CHUNK_SIZE):
+        chunk = pending[start:start + BATCH_CHUNK_SIZE]
+
+        # One embedding request for the whole chunk
+        embeddings = await embed_model.aget_query_embedding_batch([item["prompt"] for item in chunk])
+
+        tasks = [asyncio.create_task(safe_answer(item, embedding)) for item, embedding in zip(chunk, embeddings)]
+        try:
+            for task in asyncio.as_completed(tasks):
+                result = await task
+                if "error" not in result:
+                    await run_blocking(batch_store.add, batch_id, result["line"], result)
+                yield visible_result(result, reasoning)
+        finally:
+            # The client went away: stop work that can no longer be delivered
+            for task in tasks:
+                task.cancel()
+
+    logger.info(f"Batch {batch_id} finished")
@@ -0,0 +1,224 @@
+import heapq
+import json
+import math
+import re
+import sqlite3
+import threading
+from collections import Counter, defaultdict
+from pathlib import Path
+from typing import Dict, List, Sequence, Tuple
+from llama_index.core.schema import BaseNode, MetadataMode
+from llama_index.core.storage.docstore.utils import doc_to_json, json_to_doc
+from app.config import BM25_INDEX_PATH
+from app.utils.logger import logger
+
+
+# Keeps identifiers such as "2301.01234", "x-17b" or "ace-inhibitor" as single tokens
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+(?:[._\-/][a-z0-9]+)*")
+TOKEN_SEPARATORS = re.compile(r"[._\-/]")
+
+STOPWORDS = frozenset(
+    "a an and are as at be but by for from has have in is it its of on or that the this to was were "
+    "what when where which who why how with do does did can could should would will not no".split()
+)
+
+
+def tokenize(text: str) -> List[str]:
+    """Lowercased terms without stopwords; compound identifiers also contribute their parts"""
+    tokens = []
+    for token in TOKEN_PATTERN.findall(text.lower()):
+        if token in STOPWORDS:
+            continue
+        tokens.append(token)
+        parts = TOKEN_SEPARATORS.split(token)
+        if len(parts) > 1:
+            tokens.extend(part for part in parts if part not in STOPWORDS)
+    return tokens
+
+
+def indexed_text(node: BaseNode) -> str:
+    return node.get_content(metadata_mode=MetadataMode.EMBED)
+
+
+class BM25Index:
+    """
+    Incrementally updated BM25 inverted index, one logical index per category, stored in SQLite
+    Postings are clustered by term, and document frequencies are kept alongside so
+    very common terms can be skipped without reading their posting lists
+    """
+
+    def __init__(self, path: str, k1: float = 1.2, b: float = 0.75, max_df_ratio: float = 0.5):
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        self.k1 = k1
+        self.b = b
+        self.max_df_ratio = max_df_ratio
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS bm25_docs (
+                category TEXT NOT NULL,
+                node_id TEXT NOT NULL,
+                ref_doc_id TEXT,
+                length INTEGER NOT NULL,
+                node TEXT NOT NULL,
+                PRIMARY KEY (category, node_id)
+            ) WITHOUT ROWID;
+            CREATE INDEX IF NOT EXISTS bm25_docs_ref ON bm25_docs (category, ref_doc_id);
+            CREATE TABLE IF NOT EXISTS bm25_postings (
+                category TEXT NOT NULL,
+                term TEXT NOT NULL,
+                node_id TEXT NOT NULL,
+                tf INTEGER NOT NULL,
+                PRIMARY KEY (category, term, node_id)
+            ) WITHOUT ROWID;
+            CREATE TABLE IF NOT EXISTS bm25_terms (
+                category TEXT NOT NULL,
+                term TEXT NOT NULL,
+                df INTEGER NOT NULL,
+                PRIMARY KEY (category, term)
+            ) WITHOUT ROWID;
+            CREATE TABLE IF NOT EXISTS bm25_stats (
+                category TEXT PRIMARY KEY,
+                doc_count INTEGER NOT NULL,
+                total_length INTEGER NOT NULL
+            );
+            """
+        )
+        self._conn.commit()
+
+    def _remove(self, category: str, node_id: str) -> None:
+        row = self._conn.execute(
+            "SELECT length, node FROM bm25_docs WHERE category = ? AND node_id = ?", (category, node_id)
+        ).fetchone()
+        if row is None:
+            return
+        length, node_json = row
+        terms = set(tokenize(indexed_text(json_to_doc(json.loads(node_json)))))
+        self._conn.executemany(
+            "DELETE FROM bm25_postings WHERE category = ? AND term = ? AND node_id = ?",
+            [(category, term, node_id) for term in terms],
+        )
+        self._conn.executemany(
+            "UPDATE bm25_terms SET df = df - 1 WHERE category = ? AND term = ?",
+            [(category, term) for term in terms],
+        )
+        self._conn.execute("DELETE FROM bm25_terms WHERE category = ? AND df <= 0", (category,))
+        self._conn.execute("DELETE FROM bm25_docs WHERE category = ? AND node_id = ?", (category, node_id))
+        self._conn.execute(
+            "UPDATE bm25_stats SET doc_count = doc_count - 1, total_length = total_length - ? WHERE category = ?",
+            (length, category),
+        )
+
+    def add(self, category: str, nodes: Sequence[BaseNode]) -> None:
+        """Insert or replace nodes (by node ID) in a category's index"""
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR IGNORE INTO bm25_stats (category, doc_count, total_length) VALUES (?, 0, 0)", (category,)
+            )
+            for node in nodes:
+                self._remove(category, node.node_id)
+
+                counts = Counter(tokenize(indexed_text(node)))
+                length = sum(counts.values())
+                stored = node.model_copy()
+                stored.embedding = None
+                self._conn.execute(
+                    "INSERT INTO bm25_docs (category, node_id, ref_doc_id, length, node) VALUES (?, ?, ?, ?, ?)",
+                    (category, node.node_id, node.ref_doc_id, length, json.dumps(doc_to_json(stored))),
+                )
+                self._conn.executemany(
+                    "INSERT INTO bm25_postings (category, term, node_id, tf) VALUES (?, ?, ?, ?)",
+                    [(category, term, node.node_id, tf) for term, tf in counts.items()],
+                )
+                self._conn.executemany(
+                    "INSERT INTO bm25_terms (category, term, df) VALUES (?, ?, 1) "
+                    "ON CONFLICT (category, term) DO UPDATE SET df = df + 1",
+                    [(category, term) for term in counts],
+                )
+                self._conn.execute(
+                    "UPDATE bm25_stats SET doc_count = doc_count + 1, total_length = total_length + ? WHERE category = ?",
+                    (length, category),
+                )
+            self._conn.commit()
+
+    def delete(self, category: str, ref_doc_id: str) -> None:
+        """Remove every node that came from a source document"""
+        with self._lock:
+            node_ids = [
+                row[0] for row in self._conn.execute(
+                    "SELECT node_id FROM bm25_docs WHERE category = ? AND ref_doc_id = ?", (category, ref_doc_id)
+                )
+            ]
+            for node_id in node_ids:
+                self._remove(category, node_id)
+            self._conn.commit()
+
+    def clear(self, category: str) -> None:
+        with self._lock:
+            for table in ("bm25_docs", "bm25_postings", "bm25_terms", "bm25_stats"):
+                self._conn.execute(f"DELETE FROM {table} WHERE category = ?", (category,))
+            self._conn.commit()
+
+    def search(self, category: str, query: str, top_k: int) -> List[Tuple[BaseNode, float]]:
+        """Top-k nodes by BM25 score for a query"""
+        terms = sorted(set(tokenize(query)))
+        if not terms:
+            return []
+
+        with self._lock:
+            stats = self._conn.execute(
+                "SELECT doc_count, total_length FROM bm25_stats WHERE category = ?", (category,)
+            ).fetchone()
+            if stats is None or stats[0] <= 0:
+                return []
+            doc_count, total_length = stats
+            avg_length = total_length / doc_count
+
+            placeholders = ",".join("?" * len(terms))
+            document_frequency: Dict[str, int] = dict(
+                self._conn.execute(
+                    f"SELECT term, df FROM bm25_terms WHERE category = ? AND term IN ({placeholders})",
+                    [category, *terms],
+                ).fetchall()
+            )
+            # Terms present in most documents barely move the ranking but have the longest posting lists
+            selective = [term for term, df in document_frequency.items() if df <= self.max_df_ratio * doc_count]
+            terms = selective or list(document_frequency)
+            if not terms:
+                return []
+
+            placeholders = ",".join("?" * len(terms))
+            postings = self._conn.execute(
+                f"""
+                SELECT p.term, p.node_id, p.tf, d.length
+                FROM bm25_postings p JOIN bm25_docs d ON d.category = p.category AND d.node_id = p.node_id
+                WHERE p.category = ? AND p.term IN ({placeholders})
+                """,
+                [category, *terms],
+            ).fetchall()
+
+            scores: Dict[str, float] = defaultdict(float)
+            for term, node_id, tf, length in postings:
+                df = document_frequency[term]
+                idf = math.log(1 + (doc_count - df + 0.5) / (df + 0.5))
+                norm = self.k1 * (1 - self.b + self.b * length / avg_length)
+                scores[node_id] += idf * tf * (self.k1 + 1) / (tf + norm)
+
+            best = heapq.nlargest(top_k, scores.items(), key=lambda item: item[1])
+            if not best:
+                return []
+            placeholders = ",".join("?" * len(best))
+            nodes = dict(
+                self._conn.execute(
+                    f"SELECT node_id, node FROM bm25_docs WHERE category = ? AND node_id IN ({placeholders})",
+                    [category, *[node_id for node_id, _ in best]],
+                ).fetchall()
+            )
+
+        logger.debug(f"BM25 scored {len(scores)} nodes for category {category} using terms {terms}")
+        return [(json_to_doc(json.loads(nodes[node_id])), score) for node_id, score in best]
+
+
+keyword_index = BM25Index(BM25_INDEX_PATH)
@@ -0,0 +1,291 @@
+"""
+Shared clients for the upstream services (Ollama, Groq, Gemini, AstraDB)
+
+Each upstream has one keep-alive connection pool where the SDK allows it, admission
+control (rate limit, adaptive concurrency limit and a bounded priority queue) for
+async calls, a timeout, and retries with jittered exponential backoff on 429/5xx
+responses and connection errors. Both the API and the ingestion scripts
+build their clients here; the Gemini client, which only the API uses, lives in
+app/services/gemini.py so the ingestion scripts do not need google-genai.
+"""
+import asyncio
+import random
+import threading
+import time
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Sequence, Tuple, TypeVar
+import httpx
+import ollama
+from astrapy import DataAPIClient
+from llama_index.core.base.llms.types import ChatMessage, ChatResponse, ChatResponseAsyncGen
+from llama_index.core.schema import BaseNode
+from llama_index.core.vector_stores.types import VectorStoreQuery, VectorStoreQueryResult
+from llama_index.embeddings.ollama import OllamaEmbedding
+from llama_index.llms.groq import Groq
+from llama_index.vector_stores.astra_db import AstraDBVectorStore
+from app.config import (
+    ASTRA_DB_APPLICATION_TOKEN,
+    ASTRA_DB_API_ENDPOINT,
+    GROQ_API_KEY,
+    OLLAMA_BASE_URL,
+    UPSTREAM_LIMITS,
+    UPSTREAM_RATES,
+    UPSTREAM_MAX_RETRIES,
+    UPSTREAM_BACKOFF_SECONDS,
+    KEEPALIVE_EXPIRY,
+    ADMISSION_MIN_LIMIT,
+    ADMISSION_BACKOFF_RATIO,
+    ADMISSION_QUEUE_SIZE,
+    ADMISSION_QUEUE_TIMEOUT,
+)
+from app.services.admission import AdmissionController
+from app.utils.concurrency import run_blocking
+from app.utils.logger import logger
+from app.utils.metrics import stage
+
+T = TypeVar("T")
+
+
+def is_retryable(error: Exception) -> bool:
+    """Rate limits, server errors, timeouts and dropped connections are worth retrying"""
+    status = getattr(error, "status_code", None)
+    if status is None:
+        status = getattr(error, "code", None)
+    if status is None and getattr(error, "response", None) is not None:
+        status = getattr(error.response, "status_code", None)
+    if isinstance(status, int):
+        return status == 429 or status >= 500
+    return isinstance(error, (httpx.TransportError, ConnectionError, TimeoutError, asyncio.TimeoutError))
+
+
+class Upstream:
+    """
+    Concurrency limit, timeout and retry policy for one upstream service
+    Async calls go through admission control, whose adaptive limit stays at or below `concurrency`
+    """
+
+    def __init__(self, name: str, concurrency: int, timeout: float, retries: int, backoff: float, admission: AdmissionController):
+        self.name = name
+        self.concurrency = concurrency
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.admission = admission
+        self._sync_slots = threading.BoundedSemaphore(concurrency)
+
+    @property
+    def limits(self) -> httpx.Limits:
+        return httpx.Limits(
+            max_connections=self.concurrency,
+            max_keepalive_connections=self.concurrency,
+            keepalive_expiry=KEEPALIVE_EXPIRY,
+        )
+
+    @property
+    def httpx_timeout(self) -> httpx.Timeout:
+        # Waiting for a free pooled connection is bounded by the concurrency limit, not the timeout
+        return httpx.Timeout(self.timeout, pool=None)
+
+    def _delay(self, attempt: int, error: Exception) -> Optional[float]:
+        if attempt >= self.retries or not is_retryable(error):
+            return None
+        delay = self.backoff * 2 ** attempt * random.uniform(0.5, 1.5)
+        logger.warning(f"{self.name} call failed ({error!r}), retry {attempt + 1}/{self.retries} in {delay:.2f}s")
+        return delay
+
+    async def call(self, func: Callable[..., Awaitable[T]], *args: Any, **kwargs: Any) -> T:
+        """
+        Await an upstream call once admitted, within the timeout, retrying transient failures
+        Raises Overloaded, without retrying, when admission control sheds the call
+        """
+        attempt = 0
+        while True:
+            try:
+                async with self.admission.slot():
+                    with stage(self.name):
+                        return await asyncio.wait_for(func(*args, **kwargs), self.timeout)
+            except Exception as e:
+                delay = self._delay(attempt, e)
+                if delay is None:
+                    raise
+            await asyncio.sleep(delay)
+            attempt += 1
+
+    def call_sync(self, func: Callable[..., T], *args: Any, **kwargs: Any) -> T:
+        """Blocking variant of `call`; the timeout is left to the client"""
+        attempt = 0
+        while True:
+            try:
+                with self._sync_slots, stage(self.name):
+                    return func(*args, **kwargs)
+            except Exception as e:
+                delay = self._delay(attempt, e)
+                if delay is None:
+                    raise
+            time.sleep(delay)
+            attempt += 1
+
+
+def create_upstream(name: str) -> Upstream:
+    concurrency, timeout = UPSTREAM_LIMITS[name]
+    admission = AdmissionController(
+        name,
+        max_limit=concurrency,
+        min_limit=ADMISSION_MIN_LIMIT,
+        rate=UPSTREAM_RATES[name],
+        backoff_ratio=ADMISSION_BACKOFF_RATIO,
+        queue_size=ADMISSION_QUEUE_SIZE,
+        queue_timeout=ADMISSION_QUEUE_TIMEOUT,
+    )
+    return Upstream(name, concurrency, timeout, UPSTREAM_MAX_RETRIES, UPSTREAM_BACKOFF_SECONDS, admission)
+
+
+ollama_upstream = create_upstream("ollama")
+groq_upstream = create_upstream("groq")
+gemini_upstream = create_upstream("gemini")
+astra_upstream = create_upstream("astra")
+
+
+# Ollama
+
+_ollama_clients: Dict[str, Tuple[ollama.Client, ollama.AsyncClient]] = {}
+_ollama_lock = threading.Lock()
+
+def ollama_clients(base_url: str) -> Tuple[ollama.Client, ollama.AsyncClient]:
+    """One pooled sync/async client pair per Ollama server"""
+    with _ollama_lock:
+        if base_url not in _ollama_clients:
+            options = {"timeout": ollama_upstream.httpx_timeout, "limits": ollama_upstream.limits}
+            _ollama_clients[base_url] = (
+                ollama.Client(host=base_url, **options),
+                ollama.AsyncClient(host=base_url, **options),
+            )
+        return _ollama_clients[base_url]
+
+
+class BatchOllamaEmbedding(OllamaEmbedding):
+    """
+    Ollama embedding that sends a whole batch in one /api/embed request over the shared pool
+    The upstream class issues one request per text
+    """
+
+    def _get_text_embeddings(self, texts: List[str]) -> List[List[float]]:
+        response = ollama_upstream.call_sync(
+            self._client.embed, model=self.model_name, input=texts, options=self.ollama_additional_kwargs
+        )
+        return response["embeddings"]
+
+    async def _aget_text_embeddings(self, texts: List[str]) -> List[List[float]]:
+        response = await ollama_upstream.call(
+            self._async_client.embed, model=self.model_name, input=texts, options=self.ollama_additional_kwargs
+        )
+        return response["embeddings"]
+
+    # Ollama embeds queries and documents the same way
+    def _get_text_embedding(self, text: str) -> List[float]:
+        return self._get_text_embeddings([text])[0]
+
+    async def _aget_text_embedding(self, text: str) -> List[float]:
+        return (await self._aget_text_embeddings([text]))[0]
+
+    def _get_query_embedding(self, query: str) -> List[float]:
+        return self._get_text_embeddings([query])[0]
+
+    async def _aget_query_embedding(self, query: str) -> List[float]:
+        return (await self._aget_text_embeddings([query]))[0]
+
+    async def aget_query_embedding_batch(self, queries: List[str]) -> List[List[float]]:
+        return await self._aget_text_embeddings(queries)
+
+
+def create_ollama_embedding(model_name: str = "nomic-embed-text", base_url: str = OLLAMA_BASE_URL, **kwargs: Any) -> BatchOllamaEmbedding:
+    embed_model = BatchOllamaEmbedding(model_name=model_name, base_url=base_url, **kwargs)
+    embed_model._client, embed_model._async_client = ollama_clients(base_url)
+    return embed_model
+
+
+# Groq
+
+groq_http_client = httpx.Client(limits=groq_upstream.limits, timeout=groq_upstream.httpx_timeout)
+groq_async_http_client = httpx.AsyncClient(limits=groq_upstream.limits, timeout=groq_upstream.httpx_timeout)
+
+class AdmittedGroq(Groq):
+    """
+    Groq LLM whose async calls wait for admission to the Groq upstream
+    A streamed call holds its slot until the stream is exhausted or closed; sync calls (used
+    by the ingestion scripts) are not admission-controlled
+    """
+
+    async def _achat(self, messages: Sequence[ChatMessage], **kwargs: Any) -> ChatResponse:
+        async with groq_upstream.admission.slot():
+            return await super()._achat(messages, **kwargs)
+
+    async def _astream_chat(self, messages: Sequence[ChatMessage], **kwargs: Any) -> ChatResponseAsyncGen:
+        parent = super()._astream_chat
+
+        async def gen() -> ChatResponseAsyncGen:
+            async with groq_upstream.admission.slot():
+                async for response in await parent(messages, **kwargs):
+                    yield response
+
+        return gen()
+
+
+def create_groq(model: str, api_key: Optional[str] = GROQ_API_KEY, **kwargs: Any) -> AdmittedGroq:
+    """
+    Groq LLM over the shared connection pool
+    The OpenAI-compatible SDK retries 429/5xx itself with jittered backoff, honouring Retry-After
+    """
+    return AdmittedGroq(
+        model=model,
+        api_key=api_key,
+        timeout=groq_upstream.timeout,
+        max_retries=groq_upstream.retries,
+        http_client=groq_http_client,
+        async_http_client=groq_async_http_client,
+        **kwargs,
+    )
+
+
+# AstraDB
+
+_astra_client: Optional[DataAPIClient] = None
+
+def astra_client() -> DataAPIClient:
+    global _astra_client
+    if _astra_client is None:
+        _astra_client = DataAPIClient(ASTRA_DB_APPLICATION_TOKEN)
+    return _astra_client
+
+def astra_async_database():
+    return astra_client().get_async_database(ASTRA_DB_API_ENDPOINT)
+
+
+class AsyncAstraDBVectorStore(AstraDBVectorStore):
+    """
+    AstraDB vector store with retried calls within the Astra concurrency limit
+    The upstream store only implements sync calls, so the async methods run them on the bounded
+    thread pool instead of blocking the event loop
+    """
+
+    def add(self, nodes: Sequence[BaseNode], **add_kwargs: Any) -> List[str]:
+        # Node IDs are content hashes, so a retried insert overwrites rather than duplicates
+        return astra_upstream.call_sync(super().add, nodes, **add_kwargs)
+
+    def delete(self, ref_doc_id: str, **delete_kwargs: Any) -> None:
+        astra_upstream.call_sync(super().delete, ref_doc_id, **delete_kwargs)
+
+    def query(self, query: VectorStoreQuery, **kwargs: Any) -> VectorStoreQueryResult:
+        return astra_upstream.call_sync(super().query, query, **kwargs)
+
+    async def async_add(self, nodes: Sequence[BaseNode], **add_kwargs: Any) -> List[str]:
+        return await run_blocking(self.add, nodes, **add_kwargs)
+
+    async def adelete(self, ref_doc_id: str, **delete_kwargs: Any) -> None:
+        await run_blocking(self.delete, ref_doc_id, **delete_kwargs)
+
+    async def aquery(self, query: VectorStoreQuery, **kwargs: Any) -> VectorStoreQueryResult:
+        return await run_blocking(self.query, query, **kwargs)
+
+    def ping(self) -> None:
+        """Cheap round trip used by the index registry health check"""
+        self._collection.find_one({}, projection={"_id": True})
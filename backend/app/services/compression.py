@@ -0,0 +1,179 @@
+import re
+from typing import Dict, List, Optional, Tuple
+import numpy as np
+from llama_index.core import QueryBundle
+from llama_index.core.base.base_retriever import BaseRetriever
+from llama_index.core.schema import MetadataMode, NodeWithScore
+from llama_index.core.utils import get_tokenizer
+from app.config import (
+    CONTEXT_DEDUP_THRESHOLD,
+    CONTEXT_SENTENCE_THRESHOLD,
+    CONTEXT_TOKEN_BUDGET,
+    CONTEXT_TOKEN_BUDGETS,
+)
+from app.services.vector_store import embed_model
+from app.utils.logger import logger
+
+
+SENTENCE_BOUNDARY = re.compile(r"(?<=[.!?])\s+|\n{2,}")
+# Metadata key holding a packed chunk's best query/sentence cosine, kept out of embeddings and prompts
+QUERY_SIMILARITY_KEY = "query_similarity"
+
+
+def count_tokens(text: str) -> int:
+    return len(get_tokenizer()(text))
+
+
+def token_budget(model_name: Optional[str]) -> int:
+    """Context token budget for a model, from CONTEXT_TOKEN_BUDGETS or the default"""
+    return CONTEXT_TOKEN_BUDGETS.get(model_name, CONTEXT_TOKEN_BUDGET)
+
+
+def shingles(text: str, size: int = 5) -> set:
+    words = re.findall(r"\w+", text.lower())
+    return {tuple(words[i:i + size]) for i in range(max(len(words) - size + 1, 1))}
+
+
+def deduplicate(nodes: List[NodeWithScore], threshold: float) -> List[NodeWithScore]:
+    """Drop chunks whose word 5-gram Jaccard similarity to a higher-ranked chunk reaches the threshold"""
+    kept: List[Tuple[NodeWithScore, set]] = []
+    for node in nodes:
+        node_shingles = shingles(node.node.get_content(metadata_mode=MetadataMode.NONE))
+        if any(
+            len(node_shingles & other) / max(len(node_shingles | other), 1) >= threshold
+            for _, other in kept
+        ):
+            continue
+        kept.append((node, node_shingles))
+    return [node for node, _ in kept]
+
+
+def split_sentences(text: str) -> List[str]:
+    return [sentence.strip() for sentence in SENTENCE_BOUNDARY.split(text) if sentence.strip()]
+
+
+def pack(
+    nodes: List[NodeWithScore],
+    sentences: List[List[str]],
+    similarities: List[np.ndarray],
+    sentence_threshold: float,
+    budget: int,
+) -> List[NodeWithScore]:
+    """
+    Keep the sentences most similar to the query within the token budget
+    Sentences scoring below `sentence_threshold` times the best score are dropped first;
+    survivors are packed best-first and then put back in their original order, and each
+    chunk records its best kept score under QUERY_SIMILARITY_KEY
+    """
+    best = max((float(scores.max()) for scores in similarities if len(scores)), default=0.0)
+    cutoff = sentence_threshold * best if best > 0 else float("-inf")
+    candidates = [
+        (float(score), node_index, sentence_index)
+        for node_index, scores in enumerate(similarities)
+        for sentence_index, score in enumerate(scores)
+        if score >= cutoff
+    ]
+    candidates.sort(reverse=True)
+
+    selected: Dict[int, List[int]] = {}
+    used = 0
+    for _, node_index, sentence_index in candidates:
+        tokens = count_tokens(sentences[node_index][sentence_index])
+        if used + tokens > budget:
+            continue
+        used += tokens
+        selected.setdefault(node_index, []).append(sentence_index)
+
+    if not selected and candidates:
+        # Not even the best sentence fits: keep a proportional prefix of it
+        _, node_index, sentence_index = candidates[0]
+        sentence = sentences[node_index][sentence_index]
+        sentences[node_index][sentence_index] = sentence[: len(sentence) * budget // count_tokens(sentence)]
+        selected[node_index] = [sentence_index]
+
+    packed = []
+    for node_index, node in enumerate(nodes):
+        if node_index not in selected:
+            continue
+        compressed = node.node.model_copy(deep=True)
+        compressed.set_content(" ".join(sentences[node_index][i] for i in sorted(selected[node_index])))
+        compressed.metadata[QUERY_SIMILARITY_KEY] = max(float(similarities[node_index][i]) for i in selected[node_index])
+        for excluded in (compressed.excluded_embed_metadata_keys, compressed.excluded_llm_metadata_keys):
+            if QUERY_SIMILARITY_KEY not in excluded:
+                excluded.append(QUERY_SIMILARITY_KEY)
+        packed.append(NodeWithScore(node=compressed, score=node.score))
+    return packed
+
+
+def normalized(vectors) -> np.ndarray:
+    vectors = np.asarray(vectors, dtype=np.float32)
+    return vectors / np.maximum(np.linalg.norm(vectors, axis=-1, keepdims=True), 1e-12)
+
+
+class CompressingRetriever(BaseRetriever):
+    """
+    Post-retrieval context compression: near-duplicate chunks are dropped, sentences are
+    scored against the query embedding, and the best ones are packed into a token budget
+    """
+
+    def __init__(
+        self,
+        retriever: BaseRetriever,
+        budget: int,
+        dedup_threshold: float = CONTEXT_DEDUP_THRESHOLD,
+        sentence_threshold: float = CONTEXT_SENTENCE_THRESHOLD,
+    ):
+        super().__init__()
+        self._retriever = retriever
+        self._budget = budget
+        self._dedup_threshold = dedup_threshold
+        self._sentence_threshold = sentence_threshold
+
+    def _compress(self, nodes: List[NodeWithScore], sentences: List[List[str]], query_embedding, sentence_embeddings):
+        query = normalized(query_embedding)
+        matrix = normalized(sentence_embeddings) if sentence_embeddings else np.zeros((0, len(query)), np.float32)
+        scores = matrix @ query
+
+        similarities, offset = [], 0
+        for node_sentences in sentences:
+            similarities.append(scores[offset:offset + len(node_sentences)])
+            offset += len(node_sentences)
+        return pack(nodes, sentences, similarities, self._sentence_threshold, self._budget)
+
+    def _log(self, retrieved: List[NodeWithScore], packed: List[NodeWithScore]) -> None:
+        before = sum(count_tokens(node.node.get_content(metadata_mode=MetadataMode.NONE)) for node in retrieved)
+        after = sum(count_tokens(node.node.get_content(metadata_mode=MetadataMode.NONE)) for node in packed)
+        logger.info(
+            f"Context compression: {len(retrieved)} -> {len(packed)} chunks, "
+            f"{before} -> {after} tokens ({before - after} saved, budget {self._budget})"
+        )
+
+    def _prepare(self, retrieved: List[NodeWithScore]) -> Tuple[List[NodeWithScore], List[List[str]]]:
+        nodes = deduplicate(retrieved, self._dedup_threshold)
+        sentences = [split_sentences(node.node.get_content(metadata_mode=MetadataMode.NONE)) for node in nodes]
+        return nodes, sentences
+
+    def _retrieve(self, query_bundle: QueryBundle) -> List[NodeWithScore]:
+        retrieved = self._retriever.retrieve(query_bundle)
+        if not retrieved:
+            return retrieved
+        nodes, sentences = self._prepare(retrieved)
+
+        query_embedding = query_bundle.embedding or embed_model.get_query_embedding(query_bundle.query_str)
+        sentence_embeddings = embed_model.get_text_embedding_batch([s for group in sentences for s in group])
+        packed = self._compress(nodes, sentences, query_embedding, sentence_embeddings)
+        self._log(retrieved, packed)
+        return packed
+
+    async def _aretrieve(self, query_bundle: QueryBundle) -> List[NodeWithScore]:
+        retrieved = await self._retriever.aretrieve(query_bundle)
+        if not retrieved:
+            return retrieved
+        nodes, sentences = self._prepare(retrieved)
+
+        # Sentence embeddings go through the embedding cache, so repeat chunks cost a lookup
+        query_embedding = query_bundle.embedding or await embed_model.aget_query_embedding(query_bundle.query_str)
+        sentence_embeddings = await embed_model.aget_text_embedding_batch([s for group in sentences for s in group])
+        packed = self._compress(nodes, sentences, query_embedding, sentence_embeddings)
+        self._log(retrieved, packed)
+        return packed
@@ -0,0 +1,144 @@
+import asyncio
+import hashlib
+import sqlite3
+import threading
+from pathlib import Path
+from typing import Dict, List, Sequence
+import numpy as np
+from llama_index.core.base.embeddings.base import BaseEmbedding
+from llama_index.core.bridge.pydantic import PrivateAttr
+from app.utils.concurrency import run_blocking
+from app.utils.logger import logger
+
+
+def text_hash(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+class EmbeddingStore:
+    """
+    On-disk embedding store keyed by (model name, kind, text hash)
+    Vectors are kept as float32 blobs in SQLite so the backend and ingestion pipeline can share one file
+    """
+
+    def __init__(self, path: str):
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS embeddings (
+                model TEXT NOT NULL,
+                kind TEXT NOT NULL,
+                text_hash TEXT NOT NULL,
+                vector BLOB NOT NULL,
+                PRIMARY KEY (model, kind, text_hash)
+            )
+            """
+        )
+        self._conn.commit()
+
+    def get_many(self, model: str, kind: str, hashes: Sequence[str]) -> Dict[str, List[float]]:
+        found = {}
+        with self._lock:
+            # Stay under SQLite's bound-parameter limit
+            for start in range(0, len(hashes), 500):
+                batch = list(hashes[start:start + 500])
+                rows = self._conn.execute(
+                    f"SELECT text_hash, vector FROM embeddings WHERE model = ? AND kind = ? "
+                    f"AND text_hash IN ({','.join('?' * len(batch))})",
+                    [model, kind, *batch],
+                ).fetchall()
+                found.update({row[0]: np.frombuffer(row[1], dtype=np.float32).tolist() for row in rows})
+        return found
+
+    def put_many(self, model: str, kind: str, items: Dict[str, List[float]]) -> None:
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO embeddings (model, kind, text_hash, vector) VALUES (?, ?, ?, ?)",
+                [(model, kind, digest, np.asarray(vector, dtype=np.float32).tobytes()) for digest, vector in items.items()],
+            )
+            self._conn.commit()
+
+
+class CachedEmbedding(BaseEmbedding):
+    """Embedding model wrapper that serves repeated texts from an EmbeddingStore"""
+
+    _inner: BaseEmbedding = PrivateAttr()
+    _store: EmbeddingStore = PrivateAttr()
+    _hits: int = PrivateAttr(default=0)
+    _misses: int = PrivateAttr(default=0)
+
+    def __init__(self, inner: BaseEmbedding, store: EmbeddingStore, **kwargs):
+        super().__init__(model_name=inner.model_name, embed_batch_size=inner.embed_batch_size, **kwargs)
+        self._inner = inner
+        self._store = store
+
+    @classmethod
+    def class_name(cls) -> str:
+        return "CachedEmbedding"
+
+    def stats(self) -> Dict[str, float]:
+        """Hit/miss counters since startup"""
+        total = self._hits + self._misses
+        return {"hits": self._hits, "misses": self._misses, "hit_rate": self._hits / total if total else 0.0}
+
+    def log_stats(self) -> None:
+        stats = self.stats()
+        logger.info(
+            f"Embedding cache: {stats['hits']} hits, {stats['misses']} misses ({stats['hit_rate']:.1%} hit rate)"
+        )
+
+    def _lookup(self, kind: str, texts: List[str]) -> tuple[List[str], Dict[str, List[float]], List[str]]:
+        hashes = [text_hash(text) for text in texts]
+        cached = self._store.get_many(self.model_name, kind, hashes)
+        missing = list(dict.fromkeys(text for text, digest in zip(texts, hashes) if digest not in cached))
+        hits = sum(digest in cached for digest in hashes)
+        self._hits += hits
+        self._misses += len(texts) - hits
+        return hashes, cached, missing
+
+    def _merge(self, kind: str, hashes: List[str], cached: Dict[str, List[float]], missing: List[str], computed: List[List[float]]) -> List[List[float]]:
+        fresh = {text_hash(text): vector for text, vector in zip(missing, computed)}
+        if fresh:
+            self._store.put_many(self.model_name, kind, fresh)
+        cached.update(fresh)
+        return [cached[digest] for digest in hashes]
+
+    def _get_text_embeddings(self, texts: List[str]) -> List[List[float]]:
+        hashes, cached, missing = self._lookup("text", texts)
+        computed = self._inner.get_text_embedding_batch(missing) if missing else []
+        return self._merge("text", hashes, cached, missing, computed)
+
+    async def _aget_text_embeddings(self, texts: List[str]) -> List[List[float]]:
+        hashes, cached, missing = await run_blocking(self._lookup, "text", texts)
+        computed = await self._inner.aget_text_embedding_batch(missing) if missing else []
+        return await run_blocking(self._merge, "text", hashes, cached, missing, computed)
+
+    def _get_text_embedding(self, text: str) -> List[float]:
+        return self._get_text_embeddings([text])[0]
+
+    async def _aget_text_embedding(self, text: str) -> List[float]:
+        return (await self._aget_text_embeddings([text]))[0]
+
+    def _get_query_embedding(self, query: str) -> List[float]:
+        hashes, cached, missing = self._lookup("query", [query])
+        computed = [self._inner.get_query_embedding(query)] if missing else []
+        return self._merge("query", hashes, cached, missing, computed)[0]
+
+    async def _aget_query_embedding(self, query: str) -> List[float]:
+        hashes, cached, missing = await run_blocking(self._lookup, "query", [query])
+        computed = [await self._inner.aget_query_embedding(query)] if missing else []
+        return (await run_blocking(self._merge, "query", hashes, cached, missing, computed))[0]
+
+    async def aget_query_embedding_batch(self, queries: List[str]) -> List[List[float]]:
+        """Embed many queries, computing the misses in one batch when the inner model supports it"""
+        hashes, cached, missing = await run_blocking(self._lookup, "query", queries)
+        if not missing:
+            computed = []
+        elif hasattr(self._inner, "aget_query_embedding_batch"):
+            computed = await self._inner.aget_query_embedding_batch(missing)
+        else:
+            computed = await asyncio.gather(*(self._inner.aget_query_embedding(query) for query in missing))
+        return await run_blocking(self._merge, "query", hashes, cached, missing, computed)
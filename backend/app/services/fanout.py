@@ -0,0 +1,125 @@
+import asyncio
+import time
+from functools import partial
+from typing import AsyncIterator, Awaitable, Callable, Dict, List, Tuple
+from fastapi import HTTPException
+from llama_index.core import QueryBundle
+from llama_index.core.async_utils import asyncio_run
+from llama_index.core.base.base_retriever import BaseRetriever
+from llama_index.core.query_engine import RetrieverQueryEngine
+from llama_index.core.schema import NodeWithScore, TextNode
+from app.config import FANOUT_SOURCE_TIMEOUT, RRF_K, CONTEXT_COMPRESSION
+from app.services.handlers import web_search, log_stream
+from app.services.hybrid import build_retriever, compressed, reciprocal_rank_fusion
+from app.services.routing import visible_answer, visible_stream
+from app.services.vector_store import get_vector_store, doc_llm, embed_model
+from app.utils.concurrency import run_blocking
+from app.utils.logger import logger
+
+# Retrieves ranked nodes for a query from one source
+Source = Callable[[QueryBundle], Awaitable[List[NodeWithScore]]]
+
+
+async def retrieve_from_category(category: str, query_bundle: QueryBundle) -> List[NodeWithScore]:
+    index = await run_blocking(get_vector_store, category)
+    return await build_retriever(index, category).aretrieve(query_bundle)
+
+
+async def retrieve_from_web(label: str, query_bundle: QueryBundle) -> List[NodeWithScore]:
+    answer = await web_search(label, query_bundle.query_str)
+    return [NodeWithScore(node=TextNode(text=answer, metadata={"source": "web search"}), score=1.0)]
+
+
+class FanOutRetriever(BaseRetriever):
+    """
+    Queries several sources concurrently and fuses their rankings by reciprocal rank
+    Each source gets its own timeout; sources that time out or fail are skipped and
+    recorded in `status` instead of failing the whole request
+    """
+
+    def __init__(self, sources: Dict[str, Source], timeout: float, rrf_k: int):
+        super().__init__()
+        self._sources = sources
+        self._timeout = timeout
+        self._rrf_k = rrf_k
+        self.status: Dict[str, str] = {}
+
+    async def _run(self, name: str, source: Source, query_bundle: QueryBundle) -> List[NodeWithScore]:
+        start = time.perf_counter()
+        try:
+            results = await asyncio.wait_for(source(query_bundle), self._timeout)
+        except asyncio.TimeoutError:
+            logger.warning(f"Fan-out source {name} timed out after {self._timeout}s")
+            self.status[name] = "timeout"
+            return []
+        except Exception as e:
+            logger.error(f"Fan-out source {name} failed: {str(e)}")
+            self.status[name] = "error"
+            return []
+        logger.info(f"Fan-out source {name} returned {len(results)} nodes in {time.perf_counter() - start:.3f}s")
+        self.status[name] = "ok"
+        return results
+
+    async def _aretrieve(self, query_bundle: QueryBundle) -> List[NodeWithScore]:
+        rankings = await asyncio.gather(
+            *(self._run(name, source, query_bundle) for name, source in self._sources.items())
+        )
+        if "ok" not in self.status.values():
+            raise RuntimeError(f"Every source failed: {self.status}")
+        return reciprocal_rank_fusion(
+            [[result.node for result in ranking] for ranking in rankings],
+            top_k=sum(len(ranking) for ranking in rankings),
+            rrf_k=self._rrf_k,
+        )
+
+    def _retrieve(self, query_bundle: QueryBundle) -> List[NodeWithScore]:
+        return asyncio_run(self._aretrieve(query_bundle))
+
+
+def fan_out_engine(categories: List[str], include_web: bool, **kwargs) -> Tuple[RetrieverQueryEngine, FanOutRetriever]:
+    sources: Dict[str, Source] = {category: partial(retrieve_from_category, category) for category in categories}
+    if include_web:
+        sources["web"] = partial(retrieve_from_web, "+".join(categories))
+
+    fan_out = FanOutRetriever(sources, FANOUT_SOURCE_TIMEOUT, RRF_K)
+    retriever = compressed(fan_out, doc_llm) if CONTEXT_COMPRESSION else fan_out
+    return RetrieverQueryEngine.from_args(retriever, llm=doc_llm, **kwargs), fan_out
+
+async def fan_out_query(
+    categories: List[str], query: str, include_web: bool = False, reasoning: bool = False
+) -> Tuple[str, Dict[str, str]]:
+    """
+    Answer one prompt from several categories (and optionally web search) with a single generation
+    Returns the answer and the status of each source; <think> reasoning is stripped unless `reasoning` is set
+    """
+    try:
+        logger.info(f"Processing fan-out query for categories: {categories}, web search: {include_web}")
+
+        # One query embedding serves every category
+        embedding = await embed_model.aget_query_embedding(query)
+        query_engine, fan_out = fan_out_engine(categories, include_web)
+
+        response = await query_engine.aquery(QueryBundle(query_str=query, embedding=embedding))
+
+        logger.info(f"Successfully processed fan-out query, sources: {fan_out.status}")
+        return visible_answer(str(response.response), reasoning), fan_out.status
+    except Exception as e:
+        logger.error(f"Error processing fan-out query: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+async def stream_fan_out_query(
+    categories: List[str], query: str, include_web: bool = False, reasoning: bool = False
+) -> Tuple[AsyncIterator[str], Dict[str, str]]:
+    """Streaming variant of fan_out_query; retrieval finishes before this returns"""
+    try:
+        start = time.perf_counter()
+        embedding = await embed_model.aget_query_embedding(query)
+        query_engine, fan_out = fan_out_engine(categories, include_web, streaming=True)
+
+        response = await query_engine.aquery(QueryBundle(query_str=query, embedding=embedding))
+    except Exception as e:
+        logger.error(f"Error processing fan-out query: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+    tokens = log_stream(response.response_gen, start, f"fan-out: {'+'.join(categories)}")
+    return visible_stream(tokens, reasoning), fan_out.status
@@ -1,86 +1,172 @@
-import datetime
-from astrapy import DataAPIClient
-import hashlib
+import shutil
+import sqlite3
+import threading
+import time
+from typing import AsyncIterator, Awaitable, Callable, Optional
 from pathlib import Path
 from fastapi import HTTPException
-from llama_index.vector_stores.astra_db import AstraDBVectorStore
-from llama_index.core import SimpleDirectoryReader, VectorStoreIndex, StorageContext
+from llama_index.core import QueryBundle, VectorStoreIndex
 from app.utils.logger import logger
-from app.config import PDF_STORAGE_DIR, ASTRA_DB_APPLICATION_TOKEN, ASTRA_DB_API_ENDPOINT
-from app.services.vector_store import vector_stores, embed_model, get_vector_store, chat_memory, doc_llm
-from llama_index.core.llms import ChatMessage, MessageRole
+from app.utils.concurrency import run_blocking, SingleFlight
+from app.utils.uploads import SpooledUpload
+from app.config import PDF_STORAGE_DIR, PDF_INDEX_PATH, VECTOR_STORE_BACKEND
+from app.services.vector_store import index_registry, get_vector_store, create_vector_store, index_documents
+from app.services.clients import astra_async_database
+from app.services.handlers import log_stream
+from app.services.routing import routed_query, timed_stream, visible_answer, visible_stream
+from app.services.bm25 import keyword_index
+from app.services.pdf_parser import aiter_pdf_pages, count_pdf_pages
+from app.services.response_cache import response_cache
+from app.services.sessions import session_store, condense_question
 
 
-def save_pdf_file(file_data: bytes, category: str) -> str:
+class IngestedPdfIndex:
     """
-    Save PDF file to local storage with a unique name
-    Returns the path to the saved file
+    Record of PDF content hashes that are already in the vector store
+    Every upload is indexed into the one pdf collection whatever its category, so a hash is
+    ingested once; the category it first arrived with is kept for reference only
+    """
+
+    def __init__(self, path: str):
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS ingested_pdfs (
+                category TEXT NOT NULL,
+                sha256 TEXT NOT NULL,
+                pages INTEGER NOT NULL,
+                ingested_at REAL NOT NULL,
+                PRIMARY KEY (category, sha256)
+            )
+            """
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS ingested_pdfs_sha256 ON ingested_pdfs (sha256)")
+        self._conn.commit()
+
+    def contains(self, digest: str) -> bool:
+        with self._lock:
+            row = self._conn.execute("SELECT 1 FROM ingested_pdfs WHERE sha256 = ?", (digest,)).fetchone()
+        return row is not None
+
+    def clear(self) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM ingested_pdfs")
+            self._conn.commit()
+
+    def add(self, category: str, digest: str, pages: int) -> None:
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO ingested_pdfs VALUES (?, ?, ?, ?)", (category, digest, pages, time.time())
+            )
+            self._conn.commit()
+
+ingested_pdfs = IngestedPdfIndex(PDF_INDEX_PATH)
+
+def pdf_digest(pdf_path: str) -> str:
+    """Content hash of a stored PDF, which is its file name"""
+    return Path(pdf_path).stem
+
+def save_pdf_file(upload: SpooledUpload, category: str) -> str:
+    """
+    Move a spooled PDF upload into content-addressed local storage
+    Returns the path to the saved file, named by the SHA-256 of its contents
     """
     try:
         # Create category subdirectory if it doesn't exist
         category_dir = Path(PDF_STORAGE_DIR) / category
-        category_dir.mkdir(exist_ok=True)
+        category_dir.mkdir(parents=True, exist_ok=True)
 
-        # Generate unique filename using timestamp and content hash
-        timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
-        content_hash = hashlib.md5(file_data).hexdigest()[:8]
-        filename = f"{timestamp}_{content_hash}.pdf"
+        # Identical uploads map to the same file
+        file_path = category_dir / f"{upload.sha256}.pdf"
+        if file_path.exists():
+            logger.info(f"PDF already stored: {file_path}")
+            upload.remove()
+            return str(file_path)
         
-        # Save file
-        file_path = category_dir / filename
-        with open(file_path, 'wb') as f:
-            f.write(file_data)
+        # The spool file is complete, so moving it in never exposes a partial file;
+        # on the same filesystem this is a rename rather than a copy
+        shutil.move(upload.path, file_path)
         
         logger.info(f"Saved PDF file: {file_path}")
         return str(file_path)
     
     except Exception as e:
         logger.error(f"Error saving PDF file: {str(e)}")
+        upload.remove()
         raise HTTPException(status_code=500, detail=f"Failed to save PDF file: {str(e)}")
 
-def cleanup_astra_collection() -> None:
+async def cleanup_astra_collection() -> None:
     """Clear the contents of an AstraDB collection"""
     try:
-        client = DataAPIClient(ASTRA_DB_APPLICATION_TOKEN)
-        db = client.get_database(ASTRA_DB_API_ENDPOINT)
+        if VECTOR_STORE_BACKEND == "local":
+            await run_blocking(create_vector_store("pdf_collections").clear)
+        else:
+            await astra_async_database().drop_collection("pdf_collections")
 
-        pdfs = db.get_collection("pdf_collections")
-        pdfs.drop()
+        # Forget what was ingested so the same PDFs can be uploaded again
+        await run_blocking(ingested_pdfs.clear)
+        await run_blocking(keyword_index.clear, "pdf")
+        index_registry.pop("pdf")
+        await response_cache.invalidate("pdf")
         
-        logger.info(f"Successfully cleared collection")
+        logger.info("Successfully cleared collection")
         
     except Exception as e:
         logger.error(f"Error clearing collection: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Collection cleanup failed: {str(e)}")
 
-def process_pdf(pdf_data: bytes, category: str) -> tuple[int, VectorStoreIndex]:
+# Receives the fraction of work done and a short status message
+ProgressCallback = Callable[[float, str], Awaitable[None]]
+
+async def process_pdf(upload: SpooledUpload, category: str) -> VectorStoreIndex:
     """Process PDF and add to vector store"""
+    pdf_path = await run_blocking(save_pdf_file, upload, category)
+    return await ingest_pdf(pdf_path, category)
+
+# Concurrent uploads of the same PDF content share one ingest, whatever their categories
+pdf_flights = SingleFlight("pdf ingest")
+
+async def ingest_pdf(pdf_path: str, category: str, on_progress: Optional[ProgressCallback] = None) -> VectorStoreIndex:
+    """Parse a saved PDF and add it to the vector store, once across concurrent uploads of the same content"""
+    return await pdf_flights.do(pdf_digest(pdf_path), index_pdf, pdf_path, category, on_progress)
+
+async def index_pdf(pdf_path: str, category: str, on_progress: Optional[ProgressCallback] = None) -> VectorStoreIndex:
+    """Parse a saved PDF and add it to the vector store, reporting progress per page range"""
     try:
-        # Read PDF
-        pdf_path = save_pdf_file(pdf_data, category)
-        
-        # Read PDF using SimpleDirectoryReader
-        documents = SimpleDirectoryReader(input_files=[pdf_path]).load_data()
-                
-        # Get vector store for category
-        astra_db_store = AstraDBVectorStore(
-            token=ASTRA_DB_APPLICATION_TOKEN,
-            api_endpoint=ASTRA_DB_API_ENDPOINT,
-            collection_name=f"pdf_collections",
-            embedding_dimension=768
-        )
+        # A repeat upload skips parsing, embedding and insertion entirely
+        digest = pdf_digest(pdf_path)
+        if await run_blocking(ingested_pdfs.contains, digest):
+            logger.info(f"PDF {digest} already ingested")
+            if on_progress is not None:
+                await on_progress(1.0, "Already ingested")
+            return await run_blocking(get_vector_store, "pdf")
 
-        storage_context = StorageContext.from_defaults(vector_store=astra_db_store)
-        
-        # Create or update index
-        index = VectorStoreIndex.from_documents(
-            documents,
-            storage_context=storage_context,
-            embed_model=embed_model
-        )
+        # Reuse the registry's store so repeat uploads keep its open connection
+        astra_db_store = (await run_blocking(get_vector_store, "pdf")).vector_store
+
+        # Parse page ranges on the process pool and index each range as it arrives,
+        # so embedding overlaps with parsing of the remaining pages
+        total_pages = await run_blocking(count_pdf_pages, pdf_path)
+        indexed_pages = 0
+        index = None
+        async for documents in aiter_pdf_pages(pdf_path):
+            index = await index_documents(documents, astra_db_store, "pdf")
+            indexed_pages += len(documents)
+            if on_progress is not None:
+                await on_progress(indexed_pages / total_pages, f"Indexed {indexed_pages}/{total_pages} pages")
+        if index is None:
+            raise ValueError("PDF has no pages")
+
+        await run_blocking(ingested_pdfs.add, category, digest, total_pages)
         
-        # Update cache
-        vector_stores[category] = index
+        # Uploads always land in the pdf collection, whatever the request category
+        index_registry.put("pdf", index)
+
+        # Cached answers for this category no longer reflect the indexed documents
+        await response_cache.invalidate(category)
+        await response_cache.invalidate("pdf")
         
         return index
     
@@ -88,25 +174,48 @@ def process_pdf(pdf_data: bytes, category: str) -> tuple[int, VectorStoreIndex]:
         logger.error(f"Error processing PDF: {str(e)}")
         raise HTTPException(status_code=500, detail=f"PDF processing failed: {str(e)}")
 
-def perform_pdf_query(query: str) -> str:
-    """Process a query using the appropriate vector store"""
+async def perform_pdf_query(query: str, session_id: str, reasoning: bool = False) -> str:
+    """
+    Answer a question about uploaded PDFs within a chat session
+    The model's <think> reasoning is stripped unless `reasoning` is set
+    """
     try:
-        index = get_vector_store("pdf")
+        index = await run_blocking(get_vector_store, "pdf")
 
-        chat_history = chat_memory.get()
-        
-        chat_memory.put(ChatMessage(role=MessageRole.USER, content=query))
+        # Retrieval sees a standalone question, not the whole conversation
+        memory = await session_store.get(session_id)
+        standalone_query = await condense_question(memory, query)
 
-        query_engine = index.as_query_engine(llm=doc_llm)
+        response, _ = await routed_query(index, "pdf", QueryBundle(query_str=standalone_query))
 
-        full_query = "\n".join([msg.content for msg in chat_history]) + "\n" + query
-        
-        response = query_engine.query(full_query)
+        await session_store.add_turn(session_id, query, response.response)
 
-        chat_memory.put(ChatMessage(role=MessageRole.ASSISTANT, content=response.response))
+        logger.info(f"Successfully processed query for PDF in session {session_id}")
+        return visible_answer(str(response.response), reasoning)
+    except Exception as e:
+        logger.error(f"Error processing query: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+async def stream_pdf_query(query: str, session_id: str, reasoning: bool = False) -> AsyncIterator[str]:
+    """Answer a question about uploaded PDFs within a chat session, streaming the answer"""
+    try:
+        start = time.perf_counter()
+        index = await run_blocking(get_vector_store, "pdf")
 
-        logger.info(f"Successfully processed query for PDF")
-        return str(response.response)
+        memory = await session_store.get(session_id)
+        standalone_query = await condense_question(memory, query)
+
+        response, tier = await routed_query(index, "pdf", QueryBundle(query_str=standalone_query), streaming=True)
     except Exception as e:
         logger.error(f"Error processing query: {str(e)}")
-        raise HTTPException(status_code=500, detail=str(e))
\ No newline at end of file
+        raise HTTPException(status_code=500, detail=str(e))
+
+    async def tokens() -> AsyncIterator[str]:
+        answer = []
+        async for token in log_stream(timed_stream(response.response_gen, tier), start, "PDF"):
+            answer.append(token)
+            yield token
+
+        await session_store.add_turn(session_id, query, "".join(answer))
+
+    return visible_stream(tokens(), reasoning)
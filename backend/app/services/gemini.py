@@ -0,0 +1,18 @@
+"""
+Gemini client
+
+Kept apart from app/services/clients.py, which the ingestion scripts import, so that only the
+API needs google-genai installed
+"""
+from google.genai import Client
+from app.config import GEMINI_API_KEY
+from app.services.clients import gemini_upstream
+
+
+def create_gemini_client() -> Client:
+    """
+    Gemini client with the configured timeout
+    Calls should go through gemini_upstream.call for the concurrency limit and retries; this SDK
+    version opens a new HTTP session per request, so its connections cannot be pooled
+    """
+    return Client(api_key=GEMINI_API_KEY, http_options={"timeout": int(gemini_upstream.timeout * 1000)})
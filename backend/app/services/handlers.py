@@ -1,53 +1,125 @@
+import asyncio
+import hashlib
+import time
+from contextlib import asynccontextmanager
+from typing import AsyncIterator
 from fastapi import HTTPException
-from google.genai import Client, types
-from app.config import GEMINI_API_KEY
+from google.genai import types
 from app.utils.logger import logger
-from google.genai import types, Client
 from google.genai.types import Tool, GenerateContentConfig, GoogleSearch
-from app.services.vector_store import get_vector_store, doc_llm
+from llama_index.core import QueryBundle
+from app.services.vector_store import get_vector_store, embed_model
+from app.services.clients import gemini_upstream
+from app.services.gemini import create_gemini_client
+from app.services.routing import routed_query, timed_stream, visible_answer, visible_stream
+from app.services.response_cache import response_cache, normalize_prompt, RAG_NAMESPACE, SEARCH_NAMESPACE
+from app.services.media import prepare_audio, prepare_image
+from app.config import GEMINI_INLINE_MAX_BYTES, MEDIA_CACHE_TTL
+from app.utils.concurrency import run_blocking, SingleFlight
+from app.utils.uploads import SpooledUpload
 
-gemini_client = Client(api_key=GEMINI_API_KEY)
+gemini_client = create_gemini_client()
 search_tool = Tool(google_search=GoogleSearch())
 
-def analyze_audio(audio_data: bytes, category: str) -> str:
+@asynccontextmanager
+async def gemini_media_part(upload: SpooledUpload, mime_type: str) -> AsyncIterator[types.Part]:
     """
-    Analyze audio using Gemini's multimodal capabilities
+    Gemini content part for a spooled upload
+    Small files are sent inline; larger ones go through the Gemini file API straight from
+    disk (never fully in memory) and are deleted from Gemini once the caller is done
     """
+    if upload.size <= GEMINI_INLINE_MAX_BYTES:
+        yield types.Part.from_bytes(data=await run_blocking(upload.read_bytes), mime_type=mime_type)
+        return
+
+    uploaded = await gemini_upstream.call(
+        gemini_client.aio.files.upload, file=upload.path, config={"mime_type": mime_type}
+    )
     try:
-        logger.info(f"Processing audio for category: {category}")
-                
-        # Create prompt for Gemini
-        gemini_prompt = f"""
-        Task: Analyze this audio and provide a detailed and accurate transcription.
-        Context: This is for the category: {category}
-        Please provide a comprehensive response.
-        """
-        
-        # Call Gemini API with audio
-        response = gemini_client.models.generate_content(
+        # Audio and video are processed before they can be referenced
+        while uploaded.state == "PROCESSING":
+            await asyncio.sleep(1)
+            uploaded = await gemini_upstream.call(gemini_client.aio.files.get, name=uploaded.name)
+        logger.info(f"Uploaded {upload.size} bytes to Gemini as {uploaded.name}")
+        yield types.Part.from_uri(file_uri=uploaded.uri, mime_type=mime_type)
+    finally:
+        try:
+            await gemini_client.aio.files.delete(name=uploaded.name)
+        except Exception as e:
+            logger.warning(f"Failed to delete Gemini file {uploaded.name}: {str(e)}")
+
+def media_cache_key(kind: str, upload: SpooledUpload, category: str, prompt: str = "") -> str:
+    """Cache key for Gemini's analysis of a media upload: its content hash, category and prompt"""
+    prompt_hash = hashlib.sha256(normalize_prompt(prompt).encode("utf-8")).hexdigest()[:16]
+    return f"media:{kind}:{category}:{upload.sha256}:{prompt_hash}"
+
+async def transcribe_part(part: SpooledUpload, number: int, total: int, category: str) -> str:
+    # Create prompt for Gemini
+    gemini_prompt = f"""
+    Task: Analyze this audio and provide a detailed and accurate transcription.
+    Context: This is for the category: {category}
+    Please provide a comprehensive response.
+    """
+    if total > 1:
+        gemini_prompt += f"This is part {number + 1} of {total} of a longer recording; cover this part only.\n"
+
+    # Call Gemini API with audio
+    async with gemini_media_part(part, part.content_type) as media_part:
+        response = await gemini_upstream.call(
+            gemini_client.aio.models.generate_content,
             model="gemini-2.0-flash",
             contents=[
                 gemini_prompt,
-                types.Part.from_bytes(
-                data=audio_data,
-                mime_type="audio/mpeg"
-                )
+                media_part
             ]
         )
-        
-        logger.info("Successfully processed audio with Gemini")
-        return response.text
+    return response.text
+
+async def analyze_audio(upload: SpooledUpload, category: str) -> str:
+    """
+    Analyze audio using Gemini's multimodal capabilities
+    Long recordings are transcribed in chunks in parallel; repeat uploads reuse the cached transcription
+    """
+    try:
+        logger.info(f"Processing audio for category: {category}")
+
+        key = media_cache_key("audio", upload, category)
+        cached = await response_cache.backend.get(key)
+        if cached is not None:
+            logger.info(f"Reusing cached transcription of audio {upload.sha256[:12]}")
+            return cached
+
+        media = await prepare_audio(upload)
+        try:
+            transcripts = await asyncio.gather(*(
+                transcribe_part(part, number, len(media.parts), category)
+                for number, part in enumerate(media.parts)
+            ))
+        finally:
+            await run_blocking(media.remove)
+        text = "\n\n".join(transcripts)
+
+        await response_cache.backend.set(key, text, MEDIA_CACHE_TTL)
+        logger.info(f"Successfully processed audio with Gemini in {len(media.parts)} parts")
+        return text
         
     except Exception as e:
         logger.error(f"Error in audio analysis: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Audio analysis failed: {str(e)}")
 
-def analyze_image(image_data: bytes, category: str, prompt: str) -> str:
+async def analyze_image(upload: SpooledUpload, category: str, prompt: str) -> str:
     """
     Analyze image using Gemini's multimodal capabilities
+    Repeat uploads with the same prompt reuse the cached analysis
     """
     try:
         logger.info(f"Processing image for category: {category}")
+
+        key = media_cache_key("image", upload, category, prompt)
+        cached = await response_cache.backend.get(key)
+        if cached is not None:
+            logger.info(f"Reusing cached analysis of image {upload.sha256[:12]}")
+            return cached
         
         # Create prompt for Gemini
         gemini_prompt = f"""
@@ -58,17 +130,22 @@ def analyze_image(image_data: bytes, category: str, prompt: str) -> str:
         """
         
         # Call Gemini API with image
-        response = gemini_client.models.generate_content(
-            model="gemini-2.0-flash",
-            contents=[
-                gemini_prompt,
-                types.Part.from_bytes(
-                data=image_data,
-                mime_type="image/jpeg"
+        media = await prepare_image(upload)
+        try:
+            image = media.parts[0]
+            async with gemini_media_part(image, image.content_type) as part:
+                response = await gemini_upstream.call(
+                    gemini_client.aio.models.generate_content,
+                    model="gemini-2.0-flash",
+                    contents=[
+                        gemini_prompt,
+                        part
+                    ]
                 )
-            ]
-        )
-        
+        finally:
+            await run_blocking(media.remove)
+
+        await response_cache.backend.set(key, response.text, MEDIA_CACHE_TTL)
         logger.info("Successfully processed image with Gemini")
         return response.text
         
@@ -76,12 +153,17 @@ def analyze_image(image_data: bytes, category: str, prompt: str) -> str:
         logger.error(f"Error in image analysis: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Image analysis failed: {str(e)}")
 
-def web_search(category: str, prompt: str) -> str:
+async def web_search(category: str, prompt: str) -> str:
     """
     Perform Web Search using Gemini's multimodal capabilities
     """
     try:
         logger.info(f"Performing web search for category: {category}")
+
+        embedding = await embed_model.aget_query_embedding(prompt)
+        cached = await response_cache.get(SEARCH_NAMESPACE, category, prompt, embedding)
+        if cached is not None:
+            return cached
         
         config = GenerateContentConfig(
             system_instruction=(f"""
@@ -95,33 +177,101 @@ def web_search(category: str, prompt: str) -> str:
         )
         
         # Call Gemini API with to perform web search with Google Search Engine
-        response = gemini_client.models.generate_content(
+        response = await gemini_upstream.call(
+            gemini_client.aio.models.generate_content,
             model="gemini-2.0-flash", 
             config=config,
             contents=prompt
         )
         
         logger.info("Successfully searched the web with Gemini")
+        await response_cache.set(SEARCH_NAMESPACE, category, prompt, response.text, embedding)
         return response.text
         
     except Exception as e:
         logger.error(f"Error in web search: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Web Search failed: {str(e)}")
 
-def process_query(category: str, query: str) -> str:
+# Identical concurrent queries share one retrieval and generation
+query_flights = SingleFlight("query")
+
+async def process_query(category: str, query: str, reasoning: bool = False) -> str:
+    """
+    Process a query, once across concurrent identical queries (same category and normalized prompt)
+    The model's <think> reasoning is stripped unless `reasoning` is set
+    """
+    answer = await query_flights.do((category, normalize_prompt(query)), answer_query, category, query)
+    return visible_answer(answer, reasoning)
+
+async def answer_query(category: str, query: str) -> str:
     """Process a query using the appropriate vector store"""
     try:
         logger.info(f"Processing query for category: {category}")
-        index = get_vector_store(category)
 
-        logger.info(f"Using vector store for category: {category}")
-        query_engine = index.as_query_engine(llm=doc_llm)
+        # Embed once and reuse it for both the semantic cache lookup and retrieval
+        embedding = await embed_model.aget_query_embedding(query)
+        cached = await response_cache.get(RAG_NAMESPACE, category, query, embedding)
+        if cached is not None:
+            return cached
+
+        index = await run_blocking(get_vector_store, category)
 
         logger.info(f"Querying vector store for category: {category}")
-        response = query_engine.query(query)
+        response, _ = await routed_query(index, category, QueryBundle(query_str=query, embedding=embedding))
 
         logger.info(f"Successfully processed query for category: {category}")
+        await response_cache.set(RAG_NAMESPACE, category, query, str(response.response), embedding)
         return str(response.response)
     except Exception as e:
         logger.error(f"Error processing query: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
+
+async def stream_query(category: str, query: str, reasoning: bool = False) -> AsyncIterator[str]:
+    """
+    Process a query using the appropriate vector store, streaming the answer
+    Retrieval runs before this returns, so lookup errors surface as HTTP errors
+    """
+    try:
+        start = time.perf_counter()
+        logger.info(f"Processing streaming query for category: {category}")
+
+        embedding = await embed_model.aget_query_embedding(query)
+        cached = await response_cache.get(RAG_NAMESPACE, category, query, embedding)
+        if cached is not None:
+            return replay(visible_answer(cached, reasoning))
+
+        index = await run_blocking(get_vector_store, category)
+
+        logger.info(f"Querying vector store for category: {category}")
+        response, tier = await routed_query(
+            index, category, QueryBundle(query_str=query, embedding=embedding), streaming=True
+        )
+    except Exception as e:
+        logger.error(f"Error processing query: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+    async def tokens() -> AsyncIterator[str]:
+        # The full answer, reasoning included, is cached; callers only see what they asked for
+        answer = []
+        async for token in log_stream(timed_stream(response.response_gen, tier), start, f"category: {category}"):
+            answer.append(token)
+            yield token
+
+        await response_cache.set(RAG_NAMESPACE, category, query, "".join(answer), embedding)
+
+    return visible_stream(tokens(), reasoning)
+
+async def replay(text: str) -> AsyncIterator[str]:
+    """Stream a cached answer as a single chunk"""
+    yield text
+
+async def log_stream(tokens: AsyncIterator[str], start: float, label: str) -> AsyncIterator[str]:
+    """Pass tokens through while logging time-to-first-token and total time"""
+    first_token_at = None
+    async for token in tokens:
+        if first_token_at is None:
+            first_token_at = time.perf_counter()
+            logger.info(f"Time to first token for {label}: {first_token_at - start:.3f}s")
+        yield token
+
+    logger.info(f"Successfully streamed query for {label} in {time.perf_counter() - start:.3f}s")
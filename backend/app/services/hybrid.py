@@ -0,0 +1,119 @@
+import asyncio
+from typing import Any, Dict, List, Tuple
+from llama_index.core import QueryBundle, VectorStoreIndex
+from llama_index.core.base.base_retriever import BaseRetriever
+from llama_index.core.query_engine import RetrieverQueryEngine
+from llama_index.core.schema import BaseNode, NodeWithScore
+from app.config import RETRIEVAL_MODE, RETRIEVAL_TOP_K, RETRIEVAL_CANDIDATES, RRF_K, RETRIEVAL_CATEGORY_CONFIG, CONTEXT_COMPRESSION, RERANK_MODE, RERANK_CANDIDATES
+from app.services.bm25 import BM25Index, keyword_index
+from app.services.compression import CompressingRetriever, token_budget
+from app.services.rerank import RerankingRetriever, get_scorer
+from app.utils.concurrency import run_blocking
+
+
+def retrieval_settings(category: str) -> Dict[str, Any]:
+    """Retrieval mode and depths for a category, with per-category overrides from RETRIEVAL_CATEGORY_CONFIG"""
+    settings = {
+        "mode": RETRIEVAL_MODE,
+        "top_k": RETRIEVAL_TOP_K,
+        "candidates": RETRIEVAL_CANDIDATES,
+        "rrf_k": RRF_K,
+        "compression": CONTEXT_COMPRESSION,
+        "rerank": RERANK_MODE,
+        "rerank_candidates": RERANK_CANDIDATES,
+    }
+    settings.update(RETRIEVAL_CATEGORY_CONFIG.get(category, {}))
+    return settings
+
+
+def reciprocal_rank_fusion(rankings: List[List[BaseNode]], top_k: int, rrf_k: int) -> List[NodeWithScore]:
+    """Merge ranked node lists by summing 1 / (rrf_k + rank) per node"""
+    scores: Dict[str, float] = {}
+    nodes: Dict[str, BaseNode] = {}
+    for ranking in rankings:
+        for rank, node in enumerate(ranking, start=1):
+            scores[node.node_id] = scores.get(node.node_id, 0.0) + 1.0 / (rrf_k + rank)
+            nodes.setdefault(node.node_id, node)
+
+    best = sorted(scores.items(), key=lambda item: item[1], reverse=True)[:top_k]
+    return [NodeWithScore(node=nodes[node_id], score=score) for node_id, score in best]
+
+
+class HybridRetriever(BaseRetriever):
+    """Dense retrieval from the vector store fused with BM25 keyword retrieval by reciprocal rank"""
+
+    def __init__(
+        self,
+        vector_retriever: BaseRetriever,
+        keyword_index: BM25Index,
+        category: str,
+        top_k: int,
+        candidates: int,
+        rrf_k: int,
+    ):
+        super().__init__()
+        self._vector_retriever = vector_retriever
+        self._keyword_index = keyword_index
+        self._category = category
+        self._top_k = top_k
+        self._candidates = candidates
+        self._rrf_k = rrf_k
+
+    def _fuse(self, dense: List[NodeWithScore], sparse: List[Tuple[BaseNode, float]]) -> List[NodeWithScore]:
+        return reciprocal_rank_fusion(
+            [[result.node for result in dense], [node for node, _ in sparse]], self._top_k, self._rrf_k
+        )
+
+    def _retrieve(self, query_bundle: QueryBundle) -> List[NodeWithScore]:
+        dense = self._vector_retriever.retrieve(query_bundle)
+        sparse = self._keyword_index.search(self._category, query_bundle.query_str, self._candidates)
+        return self._fuse(dense, sparse)
+
+    async def _aretrieve(self, query_bundle: QueryBundle) -> List[NodeWithScore]:
+        dense, sparse = await asyncio.gather(
+            self._vector_retriever.aretrieve(query_bundle),
+            run_blocking(self._keyword_index.search, self._category, query_bundle.query_str, self._candidates),
+        )
+        return self._fuse(dense, sparse)
+
+
+def build_retriever(index: VectorStoreIndex, category: str) -> BaseRetriever:
+    """
+    Retriever for a category using its configured retrieval mode ("dense" or "hybrid")
+    With reranking on, it over-fetches `rerank_candidates` and reranks them down to `top_k`
+    """
+    settings = retrieval_settings(category)
+    rerank = settings["rerank"] != "none"
+    top_k = max(settings["rerank_candidates"], settings["top_k"]) if rerank else settings["top_k"]
+
+    if settings["mode"] == "hybrid":
+        retriever = HybridRetriever(
+            index.as_retriever(similarity_top_k=max(settings["candidates"], top_k)),
+            keyword_index,
+            category,
+            top_k=top_k,
+            candidates=max(settings["candidates"], top_k),
+            rrf_k=settings["rrf_k"],
+        )
+    else:
+        retriever = index.as_retriever(similarity_top_k=top_k)
+
+    if rerank:
+        retriever = RerankingRetriever(retriever, get_scorer(settings["rerank"]), settings["top_k"])
+    return retriever
+
+
+def compressed(retriever: BaseRetriever, llm) -> BaseRetriever:
+    """Wrap a retriever so its context is compressed into the LLM's token budget"""
+    return CompressingRetriever(retriever, token_budget(getattr(llm, "model", None)))
+
+
+def build_query_engine(index: VectorStoreIndex, category: str, llm, **kwargs: Any) -> RetrieverQueryEngine:
+    """
+    Query engine for a category using its configured retrieval mode,
+    with retrieved context compressed into the LLM's token budget unless disabled
+    """
+    retriever = build_retriever(index, category)
+    if retrieval_settings(category)["compression"]:
+        retriever = compressed(retriever, llm)
+    return RetrieverQueryEngine.from_args(retriever, llm=llm, **kwargs)
@@ -0,0 +1,211 @@
+import asyncio
+import json
+import random
+import sqlite3
+import threading
+import time
+import uuid
+from pathlib import Path
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+from app.config import JOBS_DB_PATH, JOB_WORKERS, JOB_RETRY_MAX_DELAY
+from app.services.admission import find_overload, request_priority
+from app.services.file_processing import ingest_pdf
+from app.services.papers import paper_loader, process_papers
+from app.utils.concurrency import run_blocking
+from app.utils.logger import logger
+
+
+class JobStore:
+    """
+    SQLite-backed job queue; jobs survive restarts and are picked up oldest first
+    A deferred job stays queued but is not picked up before its `available_at` time
+    """
+
+    COLUMNS = (
+        "id", "kind", "category", "payload", "status", "progress", "message", "error",
+        "attempts", "available_at", "created_at", "updated_at",
+    )
+
+    def __init__(self, path: str):
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS jobs (
+                id TEXT PRIMARY KEY,
+                kind TEXT NOT NULL,
+                category TEXT NOT NULL,
+                payload TEXT NOT NULL,
+                status TEXT NOT NULL,
+                progress REAL NOT NULL DEFAULT 0,
+                message TEXT,
+                error TEXT,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                available_at REAL NOT NULL DEFAULT 0,
+                created_at REAL NOT NULL,
+                updated_at REAL NOT NULL
+            )
+            """
+        )
+        # Queues created before jobs could be deferred lack the retry columns
+        existing = {row[1] for row in self._conn.execute("PRAGMA table_info(jobs)")}
+        for column in ("attempts INTEGER NOT NULL DEFAULT 0", "available_at REAL NOT NULL DEFAULT 0"):
+            if column.split()[0] not in existing:
+                self._conn.execute(f"ALTER TABLE jobs ADD COLUMN {column}")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, created_at)")
+        self._conn.commit()
+
+    def _row_to_job(self, row) -> Dict[str, Any]:
+        job = dict(zip(self.COLUMNS, row))
+        job["payload"] = json.loads(job["payload"])
+        return job
+
+    def enqueue(self, kind: str, category: str, payload: Dict[str, Any]) -> str:
+        job_id = uuid.uuid4().hex
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO jobs (id, kind, category, payload, status, created_at, updated_at) "
+                "VALUES (?, ?, ?, ?, 'queued', ?, ?)",
+                (job_id, kind, category, json.dumps(payload), now, now),
+            )
+            self._conn.commit()
+        return job_id
+
+    def claim_next(self) -> Optional[Dict[str, Any]]:
+        """Mark the oldest queued job that is due as running and return it"""
+        with self._lock:
+            row = self._conn.execute(
+                f"SELECT {', '.join(self.COLUMNS)} FROM jobs WHERE status = 'queued' AND available_at <= ? "
+                "ORDER BY created_at LIMIT 1",
+                (time.time(),),
+            ).fetchone()
+            if row is None:
+                return None
+            self._conn.execute(
+                "UPDATE jobs SET status = 'running', updated_at = ? WHERE id = ?", (time.time(), row[0])
+            )
+            self._conn.commit()
+        job = self._row_to_job(row)
+        job["status"] = "running"
+        return job
+
+    def update(self, job_id: str, **fields: Any) -> None:
+        fields["updated_at"] = time.time()
+        assignments = ", ".join(f"{name} = ?" for name in fields)
+        with self._lock:
+            self._conn.execute(f"UPDATE jobs SET {assignments} WHERE id = ?", (*fields.values(), job_id))
+            self._conn.commit()
+
+    def defer(self, job_id: str, delay: float, message: str) -> None:
+        """Put a job back in the queue, to be picked up again after `delay` seconds"""
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "UPDATE jobs SET status = 'queued', attempts = attempts + 1, available_at = ?, message = ?, updated_at = ? "
+                "WHERE id = ?",
+                (now + delay, message, now, job_id),
+            )
+            self._conn.commit()
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            row = self._conn.execute(
+                f"SELECT {', '.join(self.COLUMNS)} FROM jobs WHERE id = ?", (job_id,)
+            ).fetchone()
+        return None if row is None else self._row_to_job(row)
+
+    def requeue_running(self) -> int:
+        """Put jobs interrupted by a restart back in the queue"""
+        with self._lock:
+            cursor = self._conn.execute(
+                "UPDATE jobs SET status = 'queued', updated_at = ? WHERE status = 'running'", (time.time(),)
+            )
+            self._conn.commit()
+        return cursor.rowcount
+
+
+async def run_pdf_job(job: Dict[str, Any], on_progress) -> None:
+    await ingest_pdf(job["payload"]["path"], job["category"], on_progress)
+
+async def run_papers_job(job: Dict[str, Any], on_progress) -> None:
+    loader = paper_loader(job["category"])
+    await process_papers(job["category"], job["payload"]["paper"], loader, on_progress)
+
+JOB_HANDLERS: Dict[str, Callable[..., Awaitable[None]]] = {
+    "pdf": run_pdf_job,
+    "papers": run_papers_job,
+}
+
+
+class JobWorkerPool:
+    """Fixed number of asyncio workers draining the job store"""
+
+    def __init__(self, store: JobStore, concurrency: int):
+        self.store = store
+        self.concurrency = concurrency
+        self._wakeup = asyncio.Event()
+        self._tasks: List[asyncio.Task] = []
+
+    async def submit(self, kind: str, category: str, payload: Dict[str, Any]) -> str:
+        job_id = await run_blocking(self.store.enqueue, kind, category, payload)
+        self._wakeup.set()
+        logger.info(f"Queued {kind} ingestion job {job_id} for category: {category}")
+        return job_id
+
+    async def start(self) -> None:
+        requeued = await run_blocking(self.store.requeue_running)
+        if requeued:
+            logger.info(f"Requeued {requeued} interrupted ingestion jobs")
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.concurrency)]
+
+    async def stop(self) -> None:
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    async def _worker(self) -> None:
+        # Background ingestion yields upstream capacity to requests someone is waiting on
+        request_priority.set("bulk")
+        while True:
+            # Clear before claiming so a submit between the two is never missed
+            self._wakeup.clear()
+            job = await run_blocking(self.store.claim_next)
+            if job is None:
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=5)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            await self._run(job)
+
+    async def _run(self, job: Dict[str, Any]) -> None:
+        job_id = job["id"]
+        logger.info(f"Running {job['kind']} ingestion job {job_id}")
+
+        async def on_progress(progress: float, message: str) -> None:
+            await run_blocking(self.store.update, job_id, progress=progress, message=message)
+
+        try:
+            await JOB_HANDLERS[job["kind"]](job, on_progress)
+            await run_blocking(self.store.update, job_id, status="succeeded", progress=1.0)
+            logger.info(f"Finished ingestion job {job_id}")
+        except Exception as e:
+            overload = find_overload(e)
+            if overload is not None:
+                # Shedding bulk work is expected under load; the job waits its turn instead of failing
+                delay = min(JOB_RETRY_MAX_DELAY, overload.retry_after * 2 ** job["attempts"] * random.uniform(1.0, 1.5))
+                logger.warning(f"Ingestion job {job_id} deferred for {delay:.0f}s: {str(overload)}")
+                await run_blocking(
+                    self.store.defer, job_id, delay, f"Waiting for {overload.upstream} capacity, retrying in {delay:.0f}s"
+                )
+                asyncio.get_running_loop().call_later(delay, self._wakeup.set)
+                return
+            detail = getattr(e, "detail", str(e))
+            logger.error(f"Ingestion job {job_id} failed: {detail}")
+            await run_blocking(self.store.update, job_id, status="failed", error=str(detail))
+
+
+job_pool = JobWorkerPool(JobStore(JOBS_DB_PATH), JOB_WORKERS)
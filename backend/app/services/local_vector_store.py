@@ -0,0 +1,427 @@
+import fcntl
+import json
+import os
+import sqlite3
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Tuple
+import numpy as np
+from llama_index.core.bridge.pydantic import PrivateAttr
+from llama_index.core.schema import BaseNode
+from llama_index.core.storage.docstore.utils import doc_to_json, json_to_doc
+from llama_index.core.vector_stores.types import (
+    BasePydanticVectorStore,
+    FilterOperator,
+    MetadataFilters,
+    VectorStoreQuery,
+    VectorStoreQueryResult,
+)
+from app.config import LOCAL_VECTOR_STORE_PATH, LOCAL_VECTOR_NPROBE, LOCAL_VECTOR_MIN_TRAIN_ROWS
+from app.utils.concurrency import run_blocking
+from app.utils.logger import logger
+
+
+def normalize(vectors: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return vectors / np.maximum(norms, 1e-12)
+
+
+def kmeans(vectors: np.ndarray, clusters: int, iterations: int = 10, seed: int = 0) -> np.ndarray:
+    """Spherical k-means on unit vectors; returns unit-norm centroids"""
+    rng = np.random.default_rng(seed)
+    centroids = vectors[rng.choice(len(vectors), size=clusters, replace=False)].copy()
+    for _ in range(iterations):
+        assignments = np.argmax(vectors @ centroids.T, axis=1)
+        for cluster in range(clusters):
+            members = vectors[assignments == cluster]
+            # Re-seed empty clusters from a random point
+            centroids[cluster] = members.sum(axis=0) if len(members) else vectors[rng.integers(len(vectors))]
+        centroids = normalize(centroids)
+    return centroids
+
+
+class LocalVectorIndex:
+    """
+    On-disk vector index shared by every collection stored under one directory
+
+    Vectors live in a memory-mapped float32 file (one row per node, unit-normalized),
+    node text and metadata in SQLite, and an IVF index (k-means centroids plus a
+    per-row list assignment) narrows each search to the `nprobe` closest lists.
+    Below `min_train_rows` rows, search is exact.
+
+    The API and the ingestion scripts may share one directory. Writers hold a file lock
+    and allocate rows inside a SQLite transaction, and each process catches up with the
+    others' commits before it searches or adds.
+    """
+
+    def __init__(self, path: str, dim: int = 768, nprobe: int = 32, min_train_rows: int = 4096):
+        self.path = Path(path)
+        self.path.mkdir(parents=True, exist_ok=True)
+        self.dim = dim
+        self.nprobe = nprobe
+        self.min_train_rows = min_train_rows
+        self._lock = threading.RLock()
+        self._lock_file = open(self.path / "lock", "a+b")
+
+        # Autocommit mode, so that write transactions can be opened with BEGIN IMMEDIATE
+        self._conn = sqlite3.connect(self.path / "meta.sqlite3", check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+
+        self._size = 0
+        self._capacity = 0
+        self._collections: Dict[str, int] = {}
+        self._collection_of = np.empty(0, dtype=np.int32)
+        self._list_of = np.empty(0, dtype=np.int32)
+        self._alive = np.empty(0, dtype=bool)
+        self._vectors: Optional[np.memmap] = None
+        self._centroids: Optional[np.ndarray] = None
+        self._trained_rows = 0
+        self._data_version: Optional[int] = None
+        self._generation: Optional[int] = None
+
+        with self._writing():
+            self._conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS nodes (
+                    row INTEGER PRIMARY KEY,
+                    collection TEXT NOT NULL,
+                    node_id TEXT NOT NULL,
+                    ref_doc_id TEXT,
+                    node TEXT NOT NULL,
+                    list_id INTEGER NOT NULL DEFAULT -1,
+                    deleted INTEGER NOT NULL DEFAULT 0,
+                    UNIQUE (collection, node_id)
+                )
+                """
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS nodes_ref_doc ON nodes (collection, ref_doc_id)")
+            # Counters shared by every process: `generation` changes whenever existing rows are
+            # deleted or reassigned to lists, `trained_rows` records the size at the last training
+            self._conn.execute("CREATE TABLE IF NOT EXISTS state (key TEXT PRIMARY KEY, value INTEGER NOT NULL)")
+            self._grow(1024, extend=True)
+        with self._lock:
+            self._refresh()
+
+    @contextmanager
+    def _writing(self) -> Iterator[None]:
+        """Exclusive write access across threads and processes, within one SQLite transaction"""
+        with self._lock:
+            fcntl.flock(self._lock_file, fcntl.LOCK_EX)
+            try:
+                self._conn.execute("BEGIN IMMEDIATE")
+                try:
+                    yield
+                except BaseException:
+                    self._conn.execute("ROLLBACK")
+                    raise
+                self._conn.execute("COMMIT")
+            finally:
+                fcntl.flock(self._lock_file, fcntl.LOCK_UN)
+
+    def _state(self, key: str) -> int:
+        row = self._conn.execute("SELECT value FROM state WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else 0
+
+    def _set_state(self, key: str, value: int) -> None:
+        self._conn.execute("INSERT OR REPLACE INTO state (key, value) VALUES (?, ?)", (key, value))
+
+    def _bump_generation(self) -> None:
+        self._generation = self._state("generation") + 1
+        self._set_state("generation", self._generation)
+
+    def _collection_code(self, collection: str) -> int:
+        return self._collections.setdefault(collection, len(self._collections))
+
+    def _grow(self, needed: int, extend: bool = False) -> None:
+        """
+        Map at least `needed` rows of the vector file; only writers, holding the file lock,
+        may extend it, and readers map the rows other processes have already extended it to
+        """
+        if needed <= self._capacity:
+            return
+        capacity = max(needed, self._capacity * 2)
+        vectors_path = self.path / "vectors.f32"
+        row_bytes = self.dim * 4
+        with open(vectors_path, "ab") as f:
+            if not extend:
+                capacity = max(needed, min(capacity, f.tell() // row_bytes))
+            elif f.tell() < capacity * row_bytes:
+                f.truncate(capacity * row_bytes)
+        if self._vectors is not None:
+            self._vectors.flush()
+        self._vectors = np.memmap(vectors_path, dtype=np.float32, mode="r+", shape=(capacity, self.dim))
+
+        for name in ("_collection_of", "_list_of"):
+            grown = np.full(capacity, -1, dtype=np.int32)
+            grown[: self._capacity] = getattr(self, name)
+            setattr(self, name, grown)
+        alive = np.zeros(capacity, dtype=bool)
+        alive[: self._capacity] = self._alive
+        self._alive = alive
+        self._capacity = capacity
+
+    def _refresh(self) -> None:
+        """Catch up with rows, deletions and retraining committed by other processes"""
+        version = self._conn.execute("PRAGMA data_version").fetchone()[0]
+        if version == self._data_version:
+            return
+        self._data_version = version
+
+        generation = self._state("generation")
+        if generation != self._generation:
+            # Existing rows changed, so reload them all along with the centroids
+            self._generation = generation
+            self._size = 0
+            self._collection_of[:] = -1
+            self._list_of[:] = -1
+            self._alive[:] = False
+            centroids_path = self.path / "centroids.npy"
+            self._centroids = np.load(centroids_path) if centroids_path.exists() else None
+            self._trained_rows = self._state("trained_rows") if self._centroids is not None else 0
+
+        # Rows are only ever appended, so anything new sits past the known size
+        rows = self._conn.execute(
+            "SELECT row, collection, list_id, deleted FROM nodes WHERE row >= ? ORDER BY row", (self._size,)
+        ).fetchall()
+        if not rows:
+            return
+        self._grow(rows[-1][0] + 1)
+        for row, collection, list_id, deleted in rows:
+            self._collection_of[row] = self._collection_code(collection)
+            self._list_of[row] = list_id
+            self._alive[row] = not deleted
+        self._size = rows[-1][0] + 1
+
+    def _assign(self, vectors: np.ndarray) -> np.ndarray:
+        if self._centroids is None:
+            return np.full(len(vectors), -1, dtype=np.int32)
+        return np.argmax(vectors @ self._centroids.T, axis=1).astype(np.int32)
+
+    def add(self, collection: str, nodes: Sequence[BaseNode]) -> List[str]:
+        """Insert or overwrite nodes (by node ID) in a collection"""
+        if not nodes:
+            return []
+        vectors = normalize(np.asarray([node.get_embedding() for node in nodes], dtype=np.float32))
+        with self._writing():
+            self._refresh()
+            code = self._collection_code(collection)
+            existing = dict(
+                self._conn.execute(
+                    f"SELECT node_id, row FROM nodes WHERE collection = ? AND node_id IN ({','.join('?' * len(nodes))})",
+                    [collection, *[node.node_id for node in nodes]],
+                ).fetchall()
+            )
+            # Allocated inside the transaction, so no other process can hand out the same rows
+            next_row = self._conn.execute("SELECT COALESCE(MAX(row), -1) + 1 FROM nodes").fetchone()[0]
+            # Rewriting allocated rows (upserts, or re-adding deleted nodes) changes rows other
+            # processes have already loaded, so they must reload rather than only catch up
+            rewrites = bool(existing)
+            rows = []
+            for node in nodes:
+                if node.node_id not in existing:
+                    existing[node.node_id] = next_row
+                    next_row += 1
+                rows.append(existing[node.node_id])
+            self._grow(next_row, extend=True)
+
+            rows_array = np.asarray(rows)
+            lists = self._assign(vectors)
+            self._vectors[rows_array] = vectors
+            self._vectors.flush()
+
+            records = []
+            for row, list_id, node in zip(rows, lists, nodes):
+                stored = node.model_copy()
+                stored.embedding = None
+                records.append((row, collection, node.node_id, node.ref_doc_id, json.dumps(doc_to_json(stored)), int(list_id)))
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO nodes (row, collection, node_id, ref_doc_id, node, list_id, deleted) "
+                "VALUES (?, ?, ?, ?, ?, ?, 0)",
+                records,
+            )
+            if rewrites:
+                self._bump_generation()
+
+            self._collection_of[rows_array] = code
+            self._list_of[rows_array] = lists
+            self._alive[rows_array] = True
+            self._size = max(self._size, next_row)
+            self._maybe_train()
+        return [node.node_id for node in nodes]
+
+    def _maybe_train(self) -> None:
+        """(Re)build the IVF lists once the index has doubled in size since the last training"""
+        alive = int(self._alive[: self._size].sum())
+        if alive < self.min_train_rows or alive < 2 * self._trained_rows:
+            return
+
+        rows = np.flatnonzero(self._alive[: self._size])
+        clusters = int(np.clip(4 * np.sqrt(alive), 16, 4096))
+        rng = np.random.default_rng(0)
+        sample = rows if len(rows) <= 64 * clusters else rng.choice(rows, size=64 * clusters, replace=False)
+        self._centroids = kmeans(np.asarray(self._vectors[np.sort(sample)]), clusters)
+
+        for start in range(0, len(rows), 65536):
+            batch = rows[start:start + 65536]
+            self._list_of[batch] = self._assign(np.asarray(self._vectors[batch]))
+        self._conn.executemany(
+            "UPDATE nodes SET list_id = ? WHERE row = ?",
+            [(int(self._list_of[row]), int(row)) for row in rows],
+        )
+        # Other processes reload the centroids when they see the new generation
+        with open(self.path / "centroids.npy.tmp", "wb") as f:
+            np.save(f, self._centroids)
+        os.replace(self.path / "centroids.npy.tmp", self.path / "centroids.npy")
+        self._set_state("trained_rows", alive)
+        self._bump_generation()
+        self._trained_rows = alive
+        logger.info(f"Trained local vector index: {clusters} lists over {alive} vectors")
+
+    def delete(self, collection: str, ref_doc_id: str) -> None:
+        with self._writing():
+            self._refresh()
+            rows = [
+                row for (row,) in self._conn.execute(
+                    "SELECT row FROM nodes WHERE collection = ? AND ref_doc_id = ?", (collection, ref_doc_id)
+                )
+            ]
+            self._mark_deleted(rows)
+
+    def clear(self, collection: str) -> None:
+        with self._writing():
+            self._refresh()
+            rows = [row for (row,) in self._conn.execute("SELECT row FROM nodes WHERE collection = ?", (collection,))]
+            self._mark_deleted(rows)
+
+    def _mark_deleted(self, rows: List[int]) -> None:
+        if not rows:
+            return
+        self._conn.executemany("UPDATE nodes SET deleted = 1 WHERE row = ?", [(row,) for row in rows])
+        self._bump_generation()
+        self._alive[np.asarray(rows)] = False
+
+    def search(self, collection: str, query: Sequence[float], top_k: int, exact: bool = False) -> Tuple[List[int], np.ndarray]:
+        """Return (rows, similarities) of the top_k nearest live vectors in a collection"""
+        query_vector = normalize(np.asarray(query, dtype=np.float32))
+        with self._lock:
+            self._refresh()
+            code = self._collections.get(collection)
+            if code is None or self._size == 0:
+                return [], np.empty(0, dtype=np.float32)
+            mask = self._alive[: self._size] & (self._collection_of[: self._size] == code)
+
+            candidates = None
+            if self._centroids is not None and not exact:
+                probe = np.argsort(self._centroids @ query_vector)[-self.nprobe:]
+                candidates = np.flatnonzero(mask & np.isin(self._list_of[: self._size], probe))
+            if candidates is None or len(candidates) < top_k:
+                candidates = np.flatnonzero(mask)
+
+            similarities = np.asarray(self._vectors[candidates]) @ query_vector
+
+        if len(candidates) > top_k:
+            best = np.argpartition(-similarities, top_k)[:top_k]
+        else:
+            best = np.arange(len(candidates))
+        best = best[np.argsort(-similarities[best])]
+        return candidates[best].tolist(), similarities[best]
+
+    def get_nodes(self, rows: List[int]) -> List[BaseNode]:
+        if not rows:
+            return []
+        with self._lock:
+            stored = dict(
+                self._conn.execute(
+                    f"SELECT row, node FROM nodes WHERE row IN ({','.join('?' * len(rows))})", rows
+                ).fetchall()
+            )
+        return [json_to_doc(json.loads(stored[row])) for row in rows]
+
+
+def matches_filters(node: BaseNode, filters: Optional[MetadataFilters]) -> bool:
+    """Evaluate equality/membership metadata filters against a node"""
+    if filters is None:
+        return True
+    results = []
+    for metadata_filter in filters.filters:
+        if isinstance(metadata_filter, MetadataFilters):
+            results.append(matches_filters(node, metadata_filter))
+            continue
+        value = node.metadata.get(metadata_filter.key)
+        if metadata_filter.operator == FilterOperator.EQ:
+            results.append(value == metadata_filter.value)
+        elif metadata_filter.operator == FilterOperator.NE:
+            results.append(value != metadata_filter.value)
+        elif metadata_filter.operator == FilterOperator.IN:
+            results.append(value in metadata_filter.value)
+        elif metadata_filter.operator == FilterOperator.NIN:
+            results.append(value not in metadata_filter.value)
+        else:
+            raise NotImplementedError(f"Unsupported filter operator for local vector store: {metadata_filter.operator}")
+    return any(results) if filters.condition == "or" else all(results)
+
+
+_indexes: Dict[str, LocalVectorIndex] = {}
+_indexes_lock = threading.Lock()
+
+def get_local_index(path: str = LOCAL_VECTOR_STORE_PATH) -> LocalVectorIndex:
+    """One LocalVectorIndex per directory, shared by every collection view"""
+    with _indexes_lock:
+        if path not in _indexes:
+            _indexes[path] = LocalVectorIndex(
+                path, nprobe=LOCAL_VECTOR_NPROBE, min_train_rows=LOCAL_VECTOR_MIN_TRAIN_ROWS
+            )
+        return _indexes[path]
+
+
+class LocalVectorStore(BasePydanticVectorStore):
+    """llama-index vector store over one collection of a LocalVectorIndex"""
+
+    stores_text: bool = True
+    collection_name: str
+    _index: LocalVectorIndex = PrivateAttr()
+
+    def __init__(self, collection_name: str, index: Optional[LocalVectorIndex] = None, **kwargs: Any):
+        super().__init__(collection_name=collection_name, **kwargs)
+        self._index = index or get_local_index()
+
+    @classmethod
+    def class_name(cls) -> str:
+        return "LocalVectorStore"
+
+    @property
+    def client(self) -> LocalVectorIndex:
+        return self._index
+
+    def add(self, nodes: Sequence[BaseNode], **add_kwargs: Any) -> List[str]:
+        return self._index.add(self.collection_name, nodes)
+
+    def delete(self, ref_doc_id: str, **delete_kwargs: Any) -> None:
+        self._index.delete(self.collection_name, ref_doc_id)
+
+    def clear(self) -> None:
+        self._index.clear(self.collection_name)
+
+    def query(self, query: VectorStoreQuery, **kwargs: Any) -> VectorStoreQueryResult:
+        top_k = query.similarity_top_k
+        # Metadata filters are applied after the vector search, so over-fetch to compensate
+        fetch_k = top_k * 4 if query.filters is not None else top_k
+        rows, similarities = self._index.search(self.collection_name, query.query_embedding, fetch_k)
+
+        nodes, scores = [], []
+        for node, similarity in zip(self._index.get_nodes(rows), similarities):
+            if matches_filters(node, query.filters):
+                nodes.append(node)
+                scores.append(float(similarity))
+        nodes, scores = nodes[:top_k], scores[:top_k]
+        return VectorStoreQueryResult(nodes=nodes, similarities=scores, ids=[node.node_id for node in nodes])
+
+    async def async_add(self, nodes: Sequence[BaseNode], **add_kwargs: Any) -> List[str]:
+        return await run_blocking(self.add, nodes, **add_kwargs)
+
+    async def adelete(self, ref_doc_id: str, **delete_kwargs: Any) -> None:
+        await run_blocking(self.delete, ref_doc_id, **delete_kwargs)
+
+    async def aquery(self, query: VectorStoreQuery, **kwargs: Any) -> VectorStoreQueryResult:
+        return await run_blocking(self.query, query, **kwargs)
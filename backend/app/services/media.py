@@ -0,0 +1,269 @@
+"""
+Media preprocessing before uploads go to Gemini
+
+The MIME type is sniffed from the file's leading bytes instead of trusting the client.
+Large images are downscaled and re-encoded as JPEG. Audio is re-encoded to compact mono
+and long recordings are split into chunks that can be transcribed in parallel. Every
+derived file lives in a scratch directory removed by `PreparedMedia.remove`.
+"""
+import asyncio
+import mimetypes
+import shutil
+import tempfile
+import wave
+from pathlib import Path
+from typing import List, Optional
+import numpy as np
+from app.config import (
+    UPLOAD_SPOOL_DIR,
+    MEDIA_PREPROCESSING,
+    MEDIA_IMAGE_MAX_SIDE,
+    MEDIA_IMAGE_MAX_BYTES,
+    MEDIA_IMAGE_QUALITY,
+    MEDIA_AUDIO_SAMPLE_RATE,
+    MEDIA_AUDIO_BITRATE,
+    MEDIA_AUDIO_CHUNK_SECONDS,
+)
+from app.utils.concurrency import run_blocking
+from app.utils.logger import logger
+from app.utils.metrics import stage
+from app.utils.uploads import SpooledUpload
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:
+    Image = None
+
+FFMPEG = shutil.which("ffmpeg")
+
+# Image types Gemini accepts as-is; anything else is converted to JPEG
+GEMINI_IMAGE_TYPES = {"image/png", "image/jpeg", "image/webp", "image/heic", "image/heif"}
+
+
+def signature_mime(head: bytes) -> Optional[str]:
+    """MIME type from a file's magic bytes, for the image and audio formats clients send"""
+    if head.startswith(b"\xff\xd8\xff"):
+        return "image/jpeg"
+    if head.startswith(b"\x89PNG\r\n\x1a\n"):
+        return "image/png"
+    if head[:6] in (b"GIF87a", b"GIF89a"):
+        return "image/gif"
+    if head[:2] == b"BM":
+        return "image/bmp"
+    if head[:4] == b"RIFF":
+        return {b"WEBP": "image/webp", b"WAVE": "audio/wav"}.get(head[8:12])
+    if head[4:8] == b"ftyp":
+        brand = head[8:12]
+        if brand in (b"heic", b"heix", b"hevc", b"hevx"):
+            return "image/heic"
+        if brand in (b"mif1", b"msf1", b"heif"):
+            return "image/heif"
+        return "audio/mp4"
+    if head[:4] == b"fLaC":
+        return "audio/flac"
+    if head[:4] == b"OggS":
+        return "audio/ogg"
+    if head[:4] == b"FORM" and head[8:12] in (b"AIFF", b"AIFC"):
+        return "audio/aiff"
+    if head[:3] == b"ID3":
+        return "audio/mp3"
+    if len(head) > 1 and head[0] == 0xFF:
+        # MPEG frame sync: layer bits 00 mark AAC in an ADTS stream, anything else MP3
+        if head[1] & 0xF6 == 0xF0:
+            return "audio/aac"
+        if head[1] & 0xE0 == 0xE0:
+            return "audio/mp3"
+    return None
+
+
+def sniff_mime(upload: SpooledUpload, kind: str, default: str) -> str:
+    """
+    MIME type of an image or audio upload: its magic bytes, else the declared content type
+    or the filename's extension when they are of the right kind, else `default`
+    """
+    with open(upload.path, "rb") as f:
+        head = f.read(16)
+    for candidate in (signature_mime(head), upload.content_type, mimetypes.guess_type(upload.filename)[0]):
+        if candidate and candidate.startswith(f"{kind}/"):
+            return candidate
+    logger.warning(f"Could not tell the type of {kind} upload {upload.filename!r}, assuming {default}")
+    return default
+
+
+def with_type(upload: SpooledUpload, mime_type: str) -> SpooledUpload:
+    return SpooledUpload(upload.path, upload.size, upload.sha256, upload.filename, mime_type)
+
+
+class PreparedMedia:
+    """The parts to send to Gemini for one upload, and the scratch directory holding derived files"""
+
+    def __init__(self, parts: List[SpooledUpload], scratch: Optional[Path] = None):
+        self.parts = parts
+        self.scratch = scratch
+
+    def remove(self) -> None:
+        if self.scratch is not None:
+            shutil.rmtree(self.scratch, ignore_errors=True)
+
+
+def scratch_dir() -> Path:
+    Path(UPLOAD_SPOOL_DIR).mkdir(parents=True, exist_ok=True)
+    return Path(tempfile.mkdtemp(prefix="media-", dir=UPLOAD_SPOOL_DIR))
+
+
+def flatten(image):
+    """RGB copy of an image, with any transparency composited onto white"""
+    if image.mode in ("RGBA", "LA") or (image.mode == "P" and "transparency" in image.info):
+        rgba = image.convert("RGBA")
+        background = Image.new("RGB", rgba.size, "white")
+        background.paste(rgba, mask=rgba.getchannel("A"))
+        return background
+    return image.convert("RGB") if image.mode != "RGB" else image
+
+
+def downscale_image(upload: SpooledUpload, scratch: Path) -> Optional[SpooledUpload]:
+    """
+    JPEG re-encoding of an image that is too large or of a type Gemini does not take,
+    or None when the original is fine as it is (or Pillow cannot read it)
+    """
+    if Image is None:
+        return None
+    path = scratch / "image.jpg"
+    try:
+        with Image.open(upload.path) as image:
+            supported = upload.content_type in GEMINI_IMAGE_TYPES
+            if supported and max(image.size) <= MEDIA_IMAGE_MAX_SIDE and upload.size <= MEDIA_IMAGE_MAX_BYTES:
+                return None
+            original_size = image.size
+            # JPEGs decode straight at a reduced scale, which is much cheaper than a full decode
+            image.draft("RGB", (MEDIA_IMAGE_MAX_SIDE, MEDIA_IMAGE_MAX_SIDE))
+            image = ImageOps.exif_transpose(image)
+            image.thumbnail((MEDIA_IMAGE_MAX_SIDE, MEDIA_IMAGE_MAX_SIDE), Image.Resampling.LANCZOS)
+            flatten(image).save(path, "JPEG", quality=MEDIA_IMAGE_QUALITY, optimize=True)
+    except (OSError, ValueError, Image.DecompressionBombError) as e:
+        logger.warning(f"Could not re-encode image {upload.filename!r}, sending the original: {str(e)}")
+        return None
+
+    size = path.stat().st_size
+    if supported and size >= upload.size:
+        return None
+    logger.info(f"Re-encoded image {original_size} -> {image.size}, {upload.size} -> {size} bytes")
+    return SpooledUpload(str(path), size, upload.sha256, upload.filename, "image/jpeg")
+
+
+async def prepare_image(upload: SpooledUpload) -> PreparedMedia:
+    """The image to send to Gemini: the upload with its sniffed type, downscaled when worthwhile"""
+    original = with_type(upload, await run_blocking(sniff_mime, upload, "image", "image/jpeg"))
+    if not MEDIA_PREPROCESSING:
+        return PreparedMedia([original])
+
+    scratch = await run_blocking(scratch_dir)
+    with stage("media_preprocess"):
+        downscaled = await run_blocking(downscale_image, original, scratch)
+    if downscaled is None:
+        await run_blocking(shutil.rmtree, scratch, True)
+        return PreparedMedia([original])
+    return PreparedMedia([downscaled], scratch)
+
+
+def downmix(block: bytes, channels: int, rate: int, out_rate: int) -> bytes:
+    """16-bit PCM frames mixed down to mono and resampled to `out_rate`"""
+    samples = np.frombuffer(block, dtype="<i2").reshape(-1, channels).astype(np.float32).mean(axis=1)
+    if out_rate != rate:
+        if rate % out_rate == 0:
+            # Integer ratio: average each group of samples, which also filters what would alias
+            factor = rate // out_rate
+            samples = samples[:len(samples) - len(samples) % factor].reshape(-1, factor).mean(axis=1)
+        else:
+            count = int(round(len(samples) * out_rate / rate))
+            samples = np.interp(np.arange(count) * (rate / out_rate), np.arange(len(samples)), samples)
+    return np.clip(np.round(samples), -32768, 32767).astype("<i2").tobytes()
+
+
+def reencode_wav(upload: SpooledUpload, scratch: Path) -> List[SpooledUpload]:
+    """
+    A WAV file as mono 16-bit chunks at MEDIA_AUDIO_SAMPLE_RATE, MEDIA_AUDIO_CHUNK_SECONDS
+    long, converted a few seconds at a time; other sample widths are only split
+    """
+    with wave.open(upload.path, "rb") as source:
+        channels, width, rate, frames = (
+            source.getnchannels(), source.getsampwidth(), source.getframerate(), source.getnframes()
+        )
+        reduce = width == 2 and (channels > 1 or rate > MEDIA_AUDIO_SAMPLE_RATE)
+        chunk_frames = MEDIA_AUDIO_CHUNK_SECONDS * rate
+        if not reduce and frames <= chunk_frames:
+            return [upload]
+
+        out_rate = min(rate, MEDIA_AUDIO_SAMPLE_RATE) if reduce else rate
+        parts: List[SpooledUpload] = []
+        remaining = frames
+        while remaining > 0:
+            path = scratch / f"part{len(parts):04d}.wav"
+            with wave.open(str(path), "wb") as target:
+                target.setnchannels(1 if reduce else channels)
+                target.setsampwidth(width)
+                target.setframerate(out_rate)
+                left = min(chunk_frames, remaining)
+                while left > 0:
+                    block = source.readframes(min(left, rate * 10))
+                    count = len(block) // (width * channels)
+                    if count == 0:
+                        # Header claims more frames than the file holds
+                        remaining = 0
+                        break
+                    left -= count
+                    remaining -= count
+                    target.writeframes(downmix(block, channels, rate, out_rate) if reduce else block)
+            parts.append(SpooledUpload(str(path), path.stat().st_size, upload.sha256, upload.filename, "audio/wav"))
+    return parts
+
+
+async def transcode_audio(upload: SpooledUpload, scratch: Path) -> List[SpooledUpload]:
+    """Any audio ffmpeg can read, as mono MP3 chunks at MEDIA_AUDIO_SAMPLE_RATE and MEDIA_AUDIO_BITRATE"""
+    process = await asyncio.create_subprocess_exec(
+        FFMPEG, "-nostdin", "-v", "error", "-i", upload.path,
+        "-vn", "-ac", "1", "-ar", str(MEDIA_AUDIO_SAMPLE_RATE), "-c:a", "libmp3lame", "-b:a", MEDIA_AUDIO_BITRATE,
+        "-f", "segment", "-segment_time", str(MEDIA_AUDIO_CHUNK_SECONDS), "-reset_timestamps", "1",
+        str(scratch / "part%04d.mp3"),
+        stdout=asyncio.subprocess.DEVNULL,
+        stderr=asyncio.subprocess.PIPE,
+    )
+    try:
+        _, stderr = await process.communicate()
+    except BaseException:
+        process.kill()
+        raise
+    if process.returncode != 0:
+        raise RuntimeError(f"ffmpeg exited with {process.returncode}: {stderr.decode(errors='replace')[-500:]}")
+    return [
+        SpooledUpload(str(path), path.stat().st_size, upload.sha256, upload.filename, "audio/mp3")
+        for path in sorted(scratch.glob("part*.mp3"))
+    ]
+
+
+async def prepare_audio(upload: SpooledUpload) -> PreparedMedia:
+    """
+    The audio parts to transcribe: the upload re-encoded to compact mono and split into chunks
+    when long (any format with ffmpeg, WAV without it), or the upload itself with its sniffed type
+    """
+    original = with_type(upload, await run_blocking(sniff_mime, upload, "audio", "audio/mpeg"))
+    if not MEDIA_PREPROCESSING or (FFMPEG is None and original.content_type != "audio/wav"):
+        return PreparedMedia([original])
+
+    scratch = await run_blocking(scratch_dir)
+    try:
+        with stage("media_preprocess"):
+            if FFMPEG is not None:
+                parts = await transcode_audio(original, scratch)
+            else:
+                parts = await run_blocking(reencode_wav, original, scratch)
+    except Exception as e:
+        logger.warning(f"Could not re-encode audio {upload.filename!r}, sending the original: {str(e)}")
+        parts = []
+
+    # A single part no smaller than the original gains nothing
+    if not parts or (len(parts) == 1 and parts[0].size >= upload.size):
+        await run_blocking(shutil.rmtree, scratch, True)
+        return PreparedMedia([original])
+    logger.info(f"Re-encoded audio {upload.size} -> {sum(part.size for part in parts)} bytes in {len(parts)} parts")
+    return PreparedMedia(parts, scratch)
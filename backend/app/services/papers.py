@@ -1,10 +1,13 @@
 from llama_index.readers.papers import ArxivReader, PubmedReader
-from llama_index.core import VectorStoreIndex, StorageContext
-from app.config import ASTRA_DB_APPLICATION_TOKEN, ASTRA_DB_API_ENDPOINT
-from llama_index.vector_stores.astra_db import AstraDBVectorStore
-from llama_index.core.tools import FunctionTool
-from app.services.vector_store import vector_stores, embed_model
+from llama_index.core import VectorStoreIndex
+from typing import Optional
+from app.services.file_processing import ProgressCallback
+from app.services.vector_store import index_registry, get_vector_store, index_documents
+from app.config import PAPER_CACHE_TTL, PAPER_CACHE_MAX_ENTRIES
+from app.services.response_cache import response_cache, InMemoryCacheBackend
+from app.utils.concurrency import run_blocking, SingleFlight
 from app.utils.logger import logger
+from app.utils.metrics import stage
 from fastapi import HTTPException
 
 def paper_loader(category: str):
@@ -12,36 +15,57 @@ def paper_loader(category: str):
         loader = ArxivReader()
     elif category == "medical":
         loader = PubmedReader()
+    else:
+        raise HTTPException(status_code=400, detail="Papers are only available for tech and medical categories")
     return loader
 
-def process_papers(category: str, paper: str, loader) -> tuple[int, VectorStoreIndex]:
-    """Process PDF and add to vector store"""
+# Concurrent requests for the same paper share one fetch and ingest
+paper_flights = SingleFlight("papers")
+fetched_papers = InMemoryCacheBackend(PAPER_CACHE_MAX_ENTRIES)
+
+def paper_key(category: str, paper: str) -> str:
+    return f"{category}:{' '.join(paper.lower().split())}"
+
+async def index_papers(key: str, category: str, paper: str, loader, on_progress: Optional[ProgressCallback] = None) -> VectorStoreIndex:
+    """Fetch papers matching a title and add them to the category's vector store"""
+    with stage("paper_fetch"):
+        documents = await run_blocking(loader.load_data, search_query=f"ti:{paper}")
+    if on_progress is not None:
+        await on_progress(0.5, f"Fetched {len(documents)} documents")
+            
+    # Reuse the registry's store so repeat fetches keep its open connection
+    astra_db_store = (await run_blocking(get_vector_store, category)).vector_store
+    
+    # Create or update index
+    index = await index_documents(documents, astra_db_store, category)
+    
+    # Update cache
+    index_registry.put(category, index)
+    await fetched_papers.set(key, documents, PAPER_CACHE_TTL)
+
+    # Cached answers for this category no longer reflect the indexed documents
+    await response_cache.invalidate(category)
+
+    if on_progress is not None:
+        await on_progress(1.0, f"Indexed {len(documents)} documents")
+    
+    return index
+
+async def process_papers(category: str, paper: str, loader, on_progress: Optional[ProgressCallback] = None) -> VectorStoreIndex:
+    """Fetch research papers and add them to the category's vector store"""
     try:
+        key = paper_key(category, paper)
+
+        # Fetched and indexed recently: nothing new to add
+        documents = await fetched_papers.get(key)
+        if documents is not None:
+            logger.info(f"Papers for {key} already indexed, skipping fetch")
+            if on_progress is not None:
+                await on_progress(1.0, f"Already indexed {len(documents)} documents")
+            return await run_blocking(get_vector_store, category)
 
-        documents = loader.load_data(search_query=f"ti:{paper}")
-                
-        # Get vector store for category
-        astra_db_store = AstraDBVectorStore(
-            token=ASTRA_DB_APPLICATION_TOKEN,
-            api_endpoint=ASTRA_DB_API_ENDPOINT,
-            collection_name=f"{category}_collections",
-            embedding_dimension=768
-        )
-
-        storage_context = StorageContext.from_defaults(vector_store=astra_db_store)
-        
-        # Create or update index
-        index = VectorStoreIndex.from_documents(
-            documents,
-            storage_context=storage_context,
-            embed_model=embed_model
-        )
-        
-        # Update cache
-        vector_stores[category] = index
-        
-        return index
+        return await paper_flights.do(key, index_papers, key, category, paper, loader, on_progress)
     
     except Exception as e:
-        logger.error(f"Error processing PDF: {str(e)}")
-        raise HTTPException(status_code=500, detail=f"PDF processing failed: {str(e)}")
\ No newline at end of file
+        logger.error(f"Error fetching papers: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Paper fetching failed: {str(e)}")
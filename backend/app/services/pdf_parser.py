@@ -0,0 +1,92 @@
+import asyncio
+import multiprocessing
+from concurrent.futures import Future, ProcessPoolExecutor
+from pathlib import Path
+from typing import AsyncIterator, Iterator, List, Optional, Tuple
+from pypdf import PdfReader
+from llama_index.core import Document
+from llama_index.core.readers.file.base import default_file_metadata_func
+from app.config import PDF_PARSE_WORKERS, PDF_PAGES_PER_TASK
+from app.utils.concurrency import run_blocking
+from app.utils.metrics import stage
+
+# Same exclusions SimpleDirectoryReader applies, so chunks embed identically
+EXCLUDED_METADATA_KEYS = [
+    "file_name",
+    "file_type",
+    "file_size",
+    "creation_date",
+    "last_modified_date",
+    "last_accessed_date",
+]
+
+_pdf_pool: Optional[ProcessPoolExecutor] = None
+
+
+def get_pdf_pool() -> ProcessPoolExecutor:
+    """Shared process pool for PDF text extraction, started on first use"""
+    global _pdf_pool
+    if _pdf_pool is None:
+        # Spawn rather than fork: the parent runs an event loop and client threads
+        _pdf_pool = ProcessPoolExecutor(
+            max_workers=PDF_PARSE_WORKERS,
+            mp_context=multiprocessing.get_context("spawn"),
+        )
+    return _pdf_pool
+
+
+def parse_page_range(path: str, start: int, end: int) -> List[Tuple[int, str, str]]:
+    """Extract (page index, page label, text) for pages [start, end) of a PDF; runs in a worker process"""
+    reader = PdfReader(path)
+    # page_labels recomputes the label of every page in the document on each access
+    labels = reader.page_labels
+    return [(page, labels[page], reader.pages[page].extract_text()) for page in range(start, end)]
+
+
+def count_pdf_pages(path: str) -> int:
+    return len(PdfReader(path).pages)
+
+
+def submit_page_ranges(path: str, pool: ProcessPoolExecutor, pages_per_task: int) -> List[Future]:
+    """Split a PDF into page ranges and queue each range on the pool"""
+    page_count = count_pdf_pages(path)
+    return [
+        pool.submit(parse_page_range, path, start, min(start + pages_per_task, page_count))
+        for start in range(0, page_count, pages_per_task)
+    ]
+
+
+def to_documents(path: str, pages: List[Tuple[int, str, str]]) -> List[Document]:
+    """Build per-page documents shaped like SimpleDirectoryReader(filename_as_id=True) output"""
+    file_metadata = default_file_metadata_func(path)
+    documents = []
+    for page, label, text in pages:
+        document = Document(
+            text=text,
+            id_=f"{Path(path)!s}_part_{page}",
+            metadata={"page_label": label, **file_metadata},
+            excluded_embed_metadata_keys=list(EXCLUDED_METADATA_KEYS),
+            excluded_llm_metadata_keys=list(EXCLUDED_METADATA_KEYS),
+        )
+        documents.append(document)
+    return documents
+
+
+def iter_pdf_pages(
+    path: str, pool: Optional[ProcessPoolExecutor] = None, pages_per_task: int = PDF_PAGES_PER_TASK
+) -> Iterator[List[Document]]:
+    """Parse a PDF across the process pool, yielding each page range's documents in page order"""
+    for future in submit_page_ranges(path, pool or get_pdf_pool(), pages_per_task):
+        yield to_documents(path, future.result())
+
+
+async def aiter_pdf_pages(
+    path: str, pool: Optional[ProcessPoolExecutor] = None, pages_per_task: int = PDF_PAGES_PER_TASK
+) -> AsyncIterator[List[Document]]:
+    """Async variant of iter_pdf_pages; the event loop stays free while workers parse"""
+    futures = await run_blocking(submit_page_ranges, path, pool or get_pdf_pool(), pages_per_task)
+    for future in futures:
+        # Time spent waiting on the workers, i.e. parsing not hidden behind indexing
+        with stage("pdf_parse"):
+            pages = await asyncio.wrap_future(future)
+        yield to_documents(path, pages)
@@ -0,0 +1,149 @@
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, List, Optional
+import numpy as np
+from llama_index.core import QueryBundle
+from llama_index.core.async_utils import asyncio_run
+from llama_index.core.base.base_retriever import BaseRetriever
+from llama_index.core.schema import MetadataMode, NodeWithScore
+from app.config import RERANK_MODEL, RERANK_BATCH_SIZE, RERANK_CACHE_MAX_ENTRIES
+from app.utils.concurrency import run_blocking
+from app.utils.logger import logger
+from app.utils.metrics import stage
+
+try:
+    from sentence_transformers import CrossEncoder
+except ImportError:
+    CrossEncoder = None
+
+
+class ScoreCache:
+    """Bounded LRU of rerank scores per (scorer, query, node)"""
+
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self._scores: OrderedDict[str, float] = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key(scorer: str, query: str, node_id: str) -> str:
+        return hashlib.sha256(f"{scorer}\0{query}\0{node_id}".encode("utf-8")).hexdigest()
+
+    def get_many(self, keys: List[str]) -> Dict[str, float]:
+        with self._lock:
+            found = {}
+            for key in keys:
+                if key in self._scores:
+                    self._scores.move_to_end(key)
+                    found[key] = self._scores[key]
+            return found
+
+    def set_many(self, scores: Dict[str, float]) -> None:
+        with self._lock:
+            for key, score in scores.items():
+                self._scores[key] = score
+                self._scores.move_to_end(key)
+            while len(self._scores) > self.max_entries:
+                self._scores.popitem(last=False)
+
+
+score_cache = ScoreCache(RERANK_CACHE_MAX_ENTRIES)
+
+
+def node_text(node: NodeWithScore) -> str:
+    return node.node.get_content(metadata_mode=MetadataMode.NONE)
+
+
+class CrossEncoderScorer:
+    """Small cross-encoder scoring (query, chunk) pairs on the CPU in batches"""
+
+    name = "cross-encoder"
+
+    def __init__(self, model_name: str, batch_size: int):
+        self.model_name = model_name
+        self.batch_size = batch_size
+        self._model = None
+        self._lock = threading.Lock()
+
+    def _load(self):
+        with self._lock:
+            if self._model is None:
+                if CrossEncoder is None:
+                    raise RuntimeError("The sentence-transformers package is required for cross-encoder reranking")
+                self._model = CrossEncoder(self.model_name, device="cpu")
+                logger.info(f"Loaded rerank model {self.model_name}")
+            return self._model
+
+    def _predict(self, query: str, texts: List[str]) -> np.ndarray:
+        model = self._load()
+        return np.asarray(
+            model.predict([(query, text) for text in texts], batch_size=self.batch_size, convert_to_numpy=True)
+        )
+
+    async def score(self, query_bundle: QueryBundle, nodes: List[NodeWithScore]) -> np.ndarray:
+        return await run_blocking(self._predict, query_bundle.query_str, [node_text(node) for node in nodes])
+
+
+_scorers: Dict[str, object] = {}
+
+def get_scorer(mode: str):
+    """Shared scorer per mode, so the cross-encoder is loaded once"""
+    if mode not in _scorers:
+        if mode != "cross-encoder":
+            raise ValueError(f"Unknown rerank mode: {mode}")
+        _scorers[mode] = CrossEncoderScorer(RERANK_MODEL, RERANK_BATCH_SIZE)
+    return _scorers[mode]
+
+
+class RerankingRetriever(BaseRetriever):
+    """
+    Rescores over-fetched candidates and keeps the best `top_n`
+    Only candidates without a cached score for this query are sent to the scorer
+    """
+
+    def __init__(self, retriever: BaseRetriever, scorer, top_n: int, cache: Optional[ScoreCache] = None):
+        super().__init__()
+        self._retriever = retriever
+        self._scorer = scorer
+        self._top_n = top_n
+        self._cache = cache or score_cache
+
+    async def _rerank(self, query_bundle: QueryBundle, candidates: List[NodeWithScore]) -> List[NodeWithScore]:
+        with stage("rerank"):
+            return await self._score_and_rank(query_bundle, candidates)
+
+    async def _score_and_rank(self, query_bundle: QueryBundle, candidates: List[NodeWithScore]) -> List[NodeWithScore]:
+        start = time.perf_counter()
+        keys = [self._cache.key(self._scorer.name, query_bundle.query_str, node.node.node_id) for node in candidates]
+        cached = self._cache.get_many(keys)
+        missing = [i for i, key in enumerate(keys) if key not in cached]
+        if missing:
+            scores = await self._scorer.score(query_bundle, [candidates[i] for i in missing])
+            fresh = {keys[i]: float(score) for i, score in zip(missing, scores)}
+            self._cache.set_many(fresh)
+            cached.update(fresh)
+
+        ranked = sorted(
+            (NodeWithScore(node=node.node, score=cached[key]) for node, key in zip(candidates, keys)),
+            key=lambda node: node.score,
+            reverse=True,
+        )[: self._top_n]
+        logger.info(
+            f"Reranked {len(candidates)} candidates to {len(ranked)} with {self._scorer.name} "
+            f"({len(missing)} scored, {len(candidates) - len(missing)} cached) in {time.perf_counter() - start:.3f}s"
+        )
+        return ranked
+
+    async def _aretrieve(self, query_bundle: QueryBundle) -> List[NodeWithScore]:
+        candidates = await self._retriever.aretrieve(query_bundle)
+        if not candidates:
+            return candidates
+        return await self._rerank(query_bundle, candidates)
+
+    def _retrieve(self, query_bundle: QueryBundle) -> List[NodeWithScore]:
+        candidates = self._retriever.retrieve(query_bundle)
+        if not candidates:
+            return candidates
+        return asyncio_run(self._rerank(query_bundle, candidates))
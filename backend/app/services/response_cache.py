@@ -0,0 +1,254 @@
+import hashlib
+import json
+import re
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+import numpy as np
+from app.config import (
+    RESPONSE_CACHE_URL,
+    RESPONSE_CACHE_TTL,
+    RESPONSE_CACHE_MAX_ENTRIES,
+    RESPONSE_CACHE_SIMILARITY,
+    RESPONSE_CACHE_SEMANTIC_ENTRIES,
+)
+from app.utils.logger import logger
+
+try:
+    from redis import asyncio as redis_asyncio
+except ImportError:
+    redis_asyncio = None
+
+
+# Namespaces keep RAG answers apart from web search answers for the same prompt
+RAG_NAMESPACE = "rag"
+SEARCH_NAMESPACE = "search"
+
+
+class InMemoryCacheBackend:
+    """Process-local LRU cache with per-entry TTL, also the stand-in for Redis in dev and tests"""
+
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self._entries: OrderedDict[str, Tuple[float, Any]] = OrderedDict()
+
+    async def get(self, key: str) -> Optional[Any]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        expires_at, value = entry
+        if expires_at < time.monotonic():
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return value
+
+    async def set(self, key: str, value: Any, ttl: int) -> None:
+        self._entries[key] = (time.monotonic() + ttl, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    async def items(self, prefix: str) -> List[Tuple[str, Any]]:
+        now = time.monotonic()
+        return [
+            (key, value) for key, (expires_at, value) in list(self._entries.items())
+            if key.startswith(prefix) and expires_at >= now
+        ]
+
+    async def delete_prefix(self, prefix: str) -> int:
+        keys = [key for key in self._entries if key.startswith(prefix)]
+        for key in keys:
+            del self._entries[key]
+        return len(keys)
+
+
+class RedisCacheBackend:
+    """Cache stored in Redis (or any server speaking its protocol); eviction follows the server's maxmemory-policy"""
+
+    def __init__(self, url: str):
+        if redis_asyncio is None:
+            raise RuntimeError("The redis package is required for a redis:// response cache")
+        self._client = redis_asyncio.Redis.from_url(url)
+
+    async def get(self, key: str) -> Optional[Any]:
+        value = await self._client.get(key)
+        return None if value is None else json.loads(value)
+
+    async def set(self, key: str, value: Any, ttl: int) -> None:
+        await self._client.set(key, json.dumps(value), ex=ttl)
+
+    async def items(self, prefix: str) -> List[Tuple[str, Any]]:
+        keys = [key async for key in self._client.scan_iter(match=f"{prefix}*")]
+        if not keys:
+            return []
+        values = await self._client.mget(keys)
+        return [(key.decode(), json.loads(value)) for key, value in zip(keys, values) if value is not None]
+
+    async def delete_prefix(self, prefix: str) -> int:
+        keys = [key async for key in self._client.scan_iter(match=f"{prefix}*")]
+        if keys:
+            await self._client.delete(*keys)
+        return len(keys)
+
+
+def create_cache_backend(url: str):
+    """Pick a cache backend from a URL: memory:// or redis://host:port/db"""
+    if url.startswith(("redis://", "rediss://", "unix://")):
+        return RedisCacheBackend(url)
+    return InMemoryCacheBackend(RESPONSE_CACHE_MAX_ENTRIES)
+
+
+def normalize_prompt(prompt: str) -> str:
+    """Lowercase, collapse whitespace and trim trailing punctuation so trivial variations share a key"""
+    return re.sub(r"\s+", " ", prompt.lower()).strip().rstrip("?!. ")
+
+
+class SemanticIndex:
+    """
+    Bounded in-memory matrix of unit query embeddings for one (namespace, category)
+    A lookup is one matrix-vector product rather than a scan of the cache backend; the least
+    recently used embedding is evicted when full, and a match is only served if the backend
+    still holds its entry
+    """
+
+    def __init__(self, capacity: int):
+        self.capacity = capacity
+        self._matrix: Optional[np.ndarray] = None
+        self._reset(0)
+
+    def _reset(self, dim: int) -> None:
+        self._rows: OrderedDict[str, int] = OrderedDict()
+        self._keys: List[Optional[str]] = [None] * self.capacity
+        self._free = list(range(self.capacity - 1, -1, -1))
+        self._expires = np.zeros(self.capacity)
+        self._matrix = np.zeros((self.capacity, dim), dtype=np.float32) if dim else None
+
+    def __len__(self) -> int:
+        return len(self._rows)
+
+    def add(self, key: str, embedding: List[float], ttl: int) -> None:
+        vector = np.asarray(embedding, dtype=np.float32)
+        vector /= np.linalg.norm(vector) + 1e-10
+        if self._matrix is None or self._matrix.shape[1] != len(vector):
+            # First entry, or the embedding model changed and older vectors no longer compare
+            self._reset(len(vector))
+
+        row = self._rows.pop(key, None)
+        if row is None:
+            row = self._free.pop() if self._free else self._rows.pop(next(iter(self._rows)))
+        self._rows[key] = row
+        self._keys[row] = key
+        self._matrix[row] = vector
+        self._expires[row] = time.monotonic() + ttl
+
+    def discard(self, key: str) -> None:
+        row = self._rows.pop(key, None)
+        if row is not None:
+            self._keys[row] = None
+            self._expires[row] = 0
+            self._free.append(row)
+
+    def best(self, embedding: List[float]) -> Optional[Tuple[str, float]]:
+        """Key and cosine similarity of the closest live embedding"""
+        if not self._rows or self._matrix is None or self._matrix.shape[1] != len(embedding):
+            return None
+        query = np.asarray(embedding, dtype=np.float32)
+        scores = self._matrix @ query / (np.linalg.norm(query) + 1e-10)
+        # Free and expired rows never match
+        scores[self._expires < time.monotonic()] = -np.inf
+        row = int(np.argmax(scores))
+        if not np.isfinite(scores[row]):
+            return None
+        key = self._keys[row]
+        self._rows.move_to_end(key)
+        return key, float(scores[row])
+
+
+class ResponseCache:
+    """
+    Two-tier response cache per (namespace, category)
+    The exact tier matches the normalized prompt; the semantic tier matches
+    query embeddings by cosine similarity above a threshold, against a bounded
+    per-category SemanticIndex kept in process memory
+    """
+
+    def __init__(self, backend, ttl: int, similarity_threshold: float, semantic_entries: int):
+        self.backend = backend
+        self.ttl = ttl
+        self.similarity_threshold = similarity_threshold
+        self.semantic_entries = semantic_entries
+        self.stats = {"exact_hits": 0, "semantic_hits": 0, "misses": 0}
+        self._semantic: Dict[str, SemanticIndex] = {}
+
+    @staticmethod
+    def _prefix(namespace: str, category: str) -> str:
+        return f"rag-cache:{namespace}:{category}:"
+
+    def _key(self, namespace: str, category: str, prompt: str) -> str:
+        digest = hashlib.sha256(normalize_prompt(prompt).encode()).hexdigest()
+        return self._prefix(namespace, category) + digest
+
+    async def _semantic_index(self, prefix: str) -> SemanticIndex:
+        index = self._semantic.get(prefix)
+        if index is None:
+            index = self._semantic[prefix] = SemanticIndex(self.semantic_entries)
+            # Seeded from the backend once per process, so entries cached before a restart or by
+            # other workers sharing Redis can still match; later lookups never scan the backend
+            for key, value in await self.backend.items(prefix):
+                if value.get("embedding") is not None:
+                    index.add(key, value["embedding"], self.ttl)
+        return index
+
+    async def get(
+        self, namespace: str, category: str, prompt: str, embedding: Optional[List[float]] = None
+    ) -> Optional[str]:
+        """Look up a cached response, trying the exact tier before the semantic tier"""
+        entry = await self.backend.get(self._key(namespace, category, prompt))
+        if entry is not None:
+            self.stats["exact_hits"] += 1
+            logger.info(f"Response cache exact hit for {namespace}/{category}")
+            return entry["response"]
+
+        if embedding is not None:
+            index = await self._semantic_index(self._prefix(namespace, category))
+            match = index.best(embedding)
+            if match is not None and match[1] >= self.similarity_threshold:
+                key, similarity = match
+                entry = await self.backend.get(key)
+                if entry is not None:
+                    self.stats["semantic_hits"] += 1
+                    logger.info(f"Response cache semantic hit for {namespace}/{category} (similarity {similarity:.3f})")
+                    return entry["response"]
+                # Expired or evicted by the backend
+                index.discard(key)
+
+        self.stats["misses"] += 1
+        return None
+
+    async def set(
+        self, namespace: str, category: str, prompt: str, response: str, embedding: Optional[List[float]] = None
+    ) -> None:
+        """Store a response along with the query embedding used for semantic matching"""
+        # Entries without an embedding can only serve exact matches
+        entry = {"response": response, "embedding": list(embedding) if embedding is not None else None}
+        key = self._key(namespace, category, prompt)
+        await self.backend.set(key, entry, self.ttl)
+        if embedding is not None:
+            index = await self._semantic_index(self._prefix(namespace, category))
+            index.add(key, embedding, self.ttl)
+
+    async def invalidate(self, category: str) -> None:
+        """Drop cached RAG responses for a category after new documents are indexed"""
+        prefix = self._prefix(RAG_NAMESPACE, category)
+        self._semantic.pop(prefix, None)
+        removed = await self.backend.delete_prefix(prefix)
+        logger.info(f"Invalidated {removed} cached responses after update to category: {category}")
+
+
+response_cache = ResponseCache(
+    create_cache_backend(RESPONSE_CACHE_URL),
+    ttl=RESPONSE_CACHE_TTL,
+    similarity_threshold=RESPONSE_CACHE_SIMILARITY,
+    semantic_entries=RESPONSE_CACHE_SEMANTIC_ENTRIES,
+)
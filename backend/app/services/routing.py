@@ -0,0 +1,174 @@
+"""
+Model routing for RAG answers
+
+Retrieval runs first; the query and what it retrieved then decide which model writes the
+answer. Short factual lookups with confident retrieval go to the small fast model, while
+long or analytical questions and weakly supported ones go to the 70B reasoning model. A
+fast answer that gives up on the context is regenerated by the reasoning model.
+Reasoning models think out loud in <think> blocks, which are stripped unless asked for.
+"""
+import re
+import time
+from typing import AsyncIterator, Dict, List, Optional, Tuple
+from llama_index.core import QueryBundle, VectorStoreIndex
+from llama_index.core.base.response.schema import RESPONSE_TYPE
+from llama_index.core.schema import NodeWithScore
+from app.config import ROUTING_MODE, ROUTING_MAX_FAST_WORDS, ROUTING_MIN_CONFIDENCE
+from app.services.compression import QUERY_SIMILARITY_KEY
+from app.services.hybrid import build_query_engine
+from app.services.sessions import strip_reasoning
+from app.services.vector_store import doc_llm, fast_llm, embed_model
+from app.utils.logger import logger
+from app.utils.metrics import record_stage, routing_decisions, stage
+
+# Questions that need reasoning over the context rather than a lookup
+ANALYTICAL_QUERY = re.compile(
+    r"\b(why|how (?:does|do|did|would|could|can|is|are)|explain|compare|contrast|differences?|analy[sz]e|"
+    r"evaluate|assess|justify|derive|prove|pros and cons|trade-?offs?|step by step|implications?|recommend)\b",
+    re.IGNORECASE,
+)
+# Answers in which the fast model gives up on the context
+GAVE_UP = re.compile(
+    r"\b(i (?:don't|do not) know|not (?:enough|sufficient) (?:information|context)|"
+    r"(?:context|information|text) (?:does not|doesn't) (?:contain|mention|provide|say)|cannot (?:answer|determine))\b",
+    re.IGNORECASE,
+)
+THINK_OPEN, THINK_CLOSE = "<think>", "</think>"
+
+
+def tier_llms() -> Dict[str, object]:
+    return {"fast": fast_llm, "strong": doc_llm}
+
+
+def retrieval_confidence(nodes: List[NodeWithScore]) -> Optional[float]:
+    """
+    Best cosine similarity between the query and a sentence of the retrieved context
+    Comparable across retrieval modes, unlike node scores (cosine, RRF or reranker). Context
+    compression scored every sentence already and records each chunk's best; without
+    compression there is no score (None)
+    """
+    scores = [node.node.metadata.get(QUERY_SIMILARITY_KEY) for node in nodes]
+    scores = [score for score in scores if score is not None]
+    return max(scores) if scores else None
+
+
+async def choose_tier(query_bundle: QueryBundle, nodes: List[NodeWithScore]) -> Tuple[str, str]:
+    """Model tier ("fast" or "strong") for a query and its retrieved context, with the reason"""
+    if ROUTING_MODE in ("fast", "strong"):
+        return ROUTING_MODE, "pinned"
+
+    query = query_bundle.query_str
+    if len(query.split()) > ROUTING_MAX_FAST_WORDS:
+        return "strong", "long_query"
+    if ANALYTICAL_QUERY.search(query):
+        return "strong", "analytical_query"
+
+    confidence = retrieval_confidence(nodes)
+    if confidence is None:
+        return "strong", "unscored"
+    logger.info(f"Retrieval confidence {confidence:.3f} over {len(nodes)} chunks")
+    if confidence < ROUTING_MIN_CONFIDENCE:
+        return "strong", "low_confidence"
+    return "fast", "confident"
+
+
+def record_decision(tier: str, reason: str) -> None:
+    routing_decisions.inc(1, tier, reason)
+    logger.info(f"Routed query to the {tier} tier ({getattr(tier_llms()[tier], 'model', tier)}): {reason}")
+
+
+async def synthesize(
+    index: VectorStoreIndex, category: str, tier: str, query_bundle: QueryBundle, nodes: List[NodeWithScore], streaming: bool
+) -> RESPONSE_TYPE:
+    query_engine = build_query_engine(index, category, tier_llms()[tier], streaming=streaming)
+    if streaming:
+        return await query_engine.asynthesize(query_bundle, nodes)
+    with stage(f"generation_{tier}"):
+        return await query_engine.asynthesize(query_bundle, nodes)
+
+
+async def routed_query(
+    index: VectorStoreIndex, category: str, query_bundle: QueryBundle, streaming: bool = False
+) -> Tuple[RESPONSE_TYPE, str]:
+    """
+    Retrieve context for a query, then answer it with the model tier the routing picks
+    Returns the response and its tier; streamed answers cannot be escalated once started
+    """
+    if query_bundle.embedding is None:
+        query_bundle.embedding = await embed_model.aget_query_embedding(query_bundle.query_str)
+
+    # Compression is sized for the strong tier, so the context fits whichever model answers
+    nodes = await build_query_engine(index, category, doc_llm).aretrieve(query_bundle)
+    tier, reason = await choose_tier(query_bundle, nodes)
+    record_decision(tier, reason)
+    response = await synthesize(index, category, tier, query_bundle, nodes, streaming)
+
+    if not streaming and tier == "fast" and (not str(response.response).strip() or GAVE_UP.search(str(response.response))):
+        tier = "strong"
+        record_decision(tier, "escalated")
+        response = await synthesize(index, category, tier, query_bundle, nodes, streaming)
+    return response, tier
+
+
+async def timed_stream(tokens: AsyncIterator[str], tier: str) -> AsyncIterator[str]:
+    """Pass a streamed answer through, recording its generation time under its tier"""
+    start = time.perf_counter()
+    try:
+        async for token in tokens:
+            yield token
+    finally:
+        record_stage(f"generation_{tier}", time.perf_counter() - start)
+
+
+def partial_tag(text: str, tag: str) -> int:
+    """Length of the longest prefix of `tag` that `text` ends with"""
+    for length in range(min(len(tag) - 1, len(text)), 0, -1):
+        if text.endswith(tag[:length]):
+            return length
+    return 0
+
+
+async def without_reasoning(tokens: AsyncIterator[str]) -> AsyncIterator[str]:
+    """Streaming counterpart of strip_reasoning; tags may be split across tokens"""
+    buffer, thinking, after_think = "", False, False
+    async for token in tokens:
+        buffer += token
+        while buffer:
+            if thinking:
+                end = buffer.find(THINK_CLOSE)
+                if end < 0:
+                    buffer = buffer[len(buffer) - partial_tag(buffer, THINK_CLOSE):]
+                    break
+                buffer, thinking, after_think = buffer[end + len(THINK_CLOSE):], False, True
+                continue
+
+            if after_think:
+                # Like strip_reasoning, drop the whitespace the reasoning block leaves behind
+                buffer = buffer.lstrip()
+                if not buffer:
+                    break
+                after_think = False
+
+            start = buffer.find(THINK_OPEN)
+            if start >= 0:
+                if start:
+                    yield buffer[:start]
+                buffer, thinking = buffer[start + len(THINK_OPEN):], True
+                continue
+
+            held = partial_tag(buffer, THINK_OPEN)
+            if len(buffer) > held:
+                yield buffer[:len(buffer) - held]
+            buffer = buffer[len(buffer) - held:]
+            break
+
+    if buffer and not thinking:
+        yield buffer
+
+
+def visible_answer(text: str, reasoning: bool) -> str:
+    return text if reasoning else strip_reasoning(text)
+
+
+def visible_stream(tokens: AsyncIterator[str], reasoning: bool) -> AsyncIterator[str]:
+    return tokens if reasoning else without_reasoning(tokens)
@@ -0,0 +1,205 @@
+import json
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+from llama_index.core.llms import ChatMessage, MessageRole
+from llama_index.core.memory import ChatMemoryBuffer
+from app.config import (
+    SESSION_STORE_URL,
+    SESSION_TTL,
+    SESSION_MAX_ACTIVE,
+    SESSION_IDLE_SECONDS,
+    SESSION_TOKEN_LIMIT,
+)
+from app.services.vector_store import condense_llm
+from app.utils.concurrency import run_blocking
+from app.utils.logger import logger
+
+try:
+    from redis import asyncio as redis_asyncio
+except ImportError:
+    redis_asyncio = None
+
+
+CONDENSE_PROMPT = (
+    "Given the conversation below and a follow-up question, rewrite the follow-up as a single "
+    "standalone question that can be understood without the conversation. "
+    "Reply with the question only.\n\n"
+    "Conversation:\n{chat_history}\n\n"
+    "Follow-up question: {question}\n"
+    "Standalone question:"
+)
+
+
+def strip_reasoning(text: str) -> str:
+    """Drop <think>...</think> blocks emitted by reasoning models"""
+    return re.sub(r"<think>.*?(</think>|$)", "", text, flags=re.DOTALL).strip()
+
+
+class SqliteSessionBackend:
+    """Session histories persisted to a local SQLite file"""
+
+    def __init__(self, path: str):
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS sessions (
+                session_id TEXT PRIMARY KEY,
+                messages TEXT NOT NULL,
+                updated_at REAL NOT NULL
+            )
+            """
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS sessions_updated ON sessions (updated_at)")
+        self._conn.commit()
+
+    def _load(self, session_id: str, ttl: int) -> Optional[List[dict]]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT messages FROM sessions WHERE session_id = ? AND updated_at >= ?",
+                (session_id, time.time() - ttl),
+            ).fetchone()
+        return None if row is None else json.loads(row[0])
+
+    def _save(self, session_id: str, messages: List[dict], ttl: int) -> None:
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO sessions (session_id, messages, updated_at) VALUES (?, ?, ?)",
+                (session_id, json.dumps(messages), now),
+            )
+            self._conn.execute("DELETE FROM sessions WHERE updated_at < ?", (now - ttl,))
+            self._conn.commit()
+
+    def _delete(self, session_id: str) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM sessions WHERE session_id = ?", (session_id,))
+            self._conn.commit()
+
+    async def load(self, session_id: str, ttl: int) -> Optional[List[dict]]:
+        return await run_blocking(self._load, session_id, ttl)
+
+    async def save(self, session_id: str, messages: List[dict], ttl: int) -> None:
+        await run_blocking(self._save, session_id, messages, ttl)
+
+    async def delete(self, session_id: str) -> None:
+        await run_blocking(self._delete, session_id)
+
+
+class RedisSessionBackend:
+    """Session histories stored in Redis, shared by every API worker"""
+
+    def __init__(self, url: str):
+        if redis_asyncio is None:
+            raise RuntimeError("The redis package is required for a redis:// session store")
+        self._client = redis_asyncio.Redis.from_url(url)
+
+    @staticmethod
+    def _key(session_id: str) -> str:
+        return f"rag-session:{session_id}"
+
+    async def load(self, session_id: str, ttl: int) -> Optional[List[dict]]:
+        value = await self._client.get(self._key(session_id))
+        return None if value is None else json.loads(value)
+
+    async def save(self, session_id: str, messages: List[dict], ttl: int) -> None:
+        await self._client.set(self._key(session_id), json.dumps(messages), ex=ttl)
+
+    async def delete(self, session_id: str) -> None:
+        await self._client.delete(self._key(session_id))
+
+
+def create_session_backend(url: str):
+    """Pick a session backend from a URL: redis://host:port/db, otherwise a SQLite file path"""
+    if url.startswith(("redis://", "rediss://", "unix://")):
+        return RedisSessionBackend(url)
+    return SqliteSessionBackend(url)
+
+
+class SessionMemoryStore:
+    """
+    Chat memory per session ID
+    Recently used sessions stay in a bounded in-process LRU; every turn is written
+    through to the backend, so sessions evicted for size or idleness reload on demand
+    """
+
+    def __init__(self, backend, max_active: int, idle_seconds: int, ttl: int, token_limit: int):
+        self.backend = backend
+        self.max_active = max_active
+        self.idle_seconds = idle_seconds
+        self.ttl = ttl
+        self.token_limit = token_limit
+        self._active: OrderedDict[str, Tuple[float, ChatMemoryBuffer]] = OrderedDict()
+
+    def _evict(self) -> None:
+        cutoff = time.monotonic() - self.idle_seconds
+        while self._active:
+            session_id, (last_used, _) = next(iter(self._active.items()))
+            if len(self._active) <= self.max_active and last_used >= cutoff:
+                break
+            del self._active[session_id]
+
+    async def get(self, session_id: str) -> ChatMemoryBuffer:
+        """Return the memory for a session, loading it from the backend if it is not active"""
+        entry = self._active.get(session_id)
+        if entry is None:
+            messages = await self.backend.load(session_id, self.ttl) or []
+            memory = ChatMemoryBuffer.from_defaults(
+                chat_history=[ChatMessage(role=MessageRole(m["role"]), content=m["content"]) for m in messages],
+                token_limit=self.token_limit,
+            )
+        else:
+            memory = entry[1]
+        self._active[session_id] = (time.monotonic(), memory)
+        self._active.move_to_end(session_id)
+        self._evict()
+        return memory
+
+    async def add_turn(self, session_id: str, question: str, answer: str) -> None:
+        """Append a question/answer pair, keep only the window within the token limit, and persist it"""
+        memory = await self.get(session_id)
+        memory.put(ChatMessage(role=MessageRole.USER, content=question))
+        memory.put(ChatMessage(role=MessageRole.ASSISTANT, content=strip_reasoning(answer)))
+        window = memory.get()
+        memory.set(window)
+        await self.backend.save(
+            session_id,
+            [{"role": message.role.value, "content": message.content} for message in window],
+            self.ttl,
+        )
+
+    async def clear(self, session_id: str) -> None:
+        self._active.pop(session_id, None)
+        await self.backend.delete(session_id)
+
+    def stats(self) -> Dict[str, int]:
+        return {"active_sessions": len(self._active)}
+
+
+async def condense_question(memory: ChatMemoryBuffer, question: str) -> str:
+    """Rewrite a follow-up question into a standalone one so retrieval only embeds the question"""
+    history = memory.get()
+    if not history:
+        return question
+
+    transcript = "\n".join(f"{message.role.value}: {message.content}" for message in history)
+    response = await condense_llm.acomplete(CONDENSE_PROMPT.format(chat_history=transcript, question=question))
+    condensed = strip_reasoning(response.text)
+    logger.info(f"Condensed {len(history)} history messages into standalone question: {condensed!r}")
+    return condensed or question
+
+
+session_store = SessionMemoryStore(
+    create_session_backend(SESSION_STORE_URL),
+    max_active=SESSION_MAX_ACTIVE,
+    idle_seconds=SESSION_IDLE_SECONDS,
+    ttl=SESSION_TTL,
+    token_limit=SESSION_TOKEN_LIMIT,
+)
@@ -1,34 +1,206 @@
-from llama_index.vector_stores.astra_db import AstraDBVectorStore
-from llama_index.embeddings.ollama import OllamaEmbedding
-from llama_index.core import VectorStoreIndex
-from llama_index.llms.groq import Groq
-from app.config import ASTRA_DB_APPLICATION_TOKEN, ASTRA_DB_API_ENDPOINT, OLLAMA_BASE_URL, GROQ_API_KEY
-from llama_index.core.memory import ChatMemoryBuffer
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+from llama_index.core import Document, Settings, VectorStoreIndex
+from llama_index.core.schema import BaseNode, MetadataMode, NodeRelationship
+from llama_index.core.vector_stores.types import BasePydanticVectorStore
+from app.config import ASTRA_DB_APPLICATION_TOKEN, ASTRA_DB_API_ENDPOINT, EMBEDDING_CACHE_PATH, VECTOR_STORE_BACKEND, CONDENSE_MODEL, FAST_MODEL, INDEX_CACHE_MAX_ENTRIES
+from app.services.bm25 import keyword_index
+from app.services.clients import AsyncAstraDBVectorStore, create_groq, create_ollama_embedding
+from app.services.embedding_cache import CachedEmbedding, EmbeddingStore
+from app.services.local_vector_store import LocalVectorStore
+from app.utils.concurrency import run_blocking
+from app.utils.logger import logger
 
-# Initialize chat memory (adjust token limit as needed)
-chat_memory = ChatMemoryBuffer(token_limit=8000)
+embed_model = CachedEmbedding(
+    create_ollama_embedding(model_name="nomic-embed-text", embed_batch_size=64),
+    EmbeddingStore(EMBEDDING_CACHE_PATH)
+)
 
-vector_stores = {}
+doc_llm = create_groq("deepseek-r1-distill-llama-70b")
 
-embed_model = OllamaEmbedding(
-    model_name="nomic-embed-text",
-    base_url=OLLAMA_BASE_URL
-)
+# Small model for simple queries; see app.services.routing
+fast_llm = create_groq(FAST_MODEL)
+
+condense_llm = create_groq(CONDENSE_MODEL)
+
+
+def create_vector_store(collection_name: str) -> BasePydanticVectorStore:
+    """Create a vector store for a collection on the configured backend"""
+    if VECTOR_STORE_BACKEND == "local":
+        return LocalVectorStore(collection_name)
+
+    return AsyncAstraDBVectorStore(
+        token=ASTRA_DB_APPLICATION_TOKEN,
+        api_endpoint=ASTRA_DB_API_ENDPOINT,
+        collection_name=collection_name,
+        embedding_dimension=768
+    )
+
+class IndexRegistry:
+    """
+    Bounded LRU of per-category indexes
+    Construction is single-flight per category, so concurrent first requests share one
+    client; a build lock only exists while callers are building or waiting, so memory
+    stays bounded however many categories are requested. Health checks drop indexes
+    whose store stopped answering so the next request reconnects
+    """
+
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self._indexes: OrderedDict[str, VectorStoreIndex] = OrderedDict()
+        self._lock = threading.Lock()
+        # category -> (build lock, callers holding or waiting for it)
+        self._build_locks: Dict[str, Tuple[threading.Lock, int]] = {}
+        self._stats = {"hits": 0, "misses": 0, "evictions": 0, "reconnects": 0}
+        self._cold_starts: Dict[str, float] = {}
+
+    def _lookup(self, category: str):
+        with self._lock:
+            index = self._indexes.get(category)
+            if index is not None:
+                self._indexes.move_to_end(category)
+                self._stats["hits"] += 1
+            return index
+
+    def _insert(self, category: str, index: VectorStoreIndex) -> None:
+        with self._lock:
+            self._indexes[category] = index
+            self._indexes.move_to_end(category)
+            while len(self._indexes) > self.max_entries:
+                evicted, _ = self._indexes.popitem(last=False)
+                self._cold_starts.pop(evicted, None)
+                self._stats["evictions"] += 1
+                logger.info(f"Evicted index for category {evicted} from the registry")
+
+    @contextmanager
+    def _building(self, category: str) -> Iterator[threading.Lock]:
+        """The category's build lock, dropped once no caller holds or waits for it"""
+        with self._lock:
+            build_lock, callers = self._build_locks.get(category, (threading.Lock(), 0))
+            self._build_locks[category] = (build_lock, callers + 1)
+        try:
+            yield build_lock
+        finally:
+            with self._lock:
+                build_lock, callers = self._build_locks[category]
+                if callers > 1:
+                    self._build_locks[category] = (build_lock, callers - 1)
+                else:
+                    del self._build_locks[category]
+
+    def get(self, category: str) -> VectorStoreIndex:
+        """Return the index for a category, building it at most once across concurrent callers"""
+        index = self._lookup(category)
+        if index is not None:
+            return index
+
+        with self._building(category) as build_lock, build_lock:
+            # Another caller may have finished building while we waited
+            index = self._lookup(category)
+            if index is not None:
+                return index
+
+            with self._lock:
+                self._stats["misses"] += 1
+            start = time.perf_counter()
+            index = VectorStoreIndex.from_vector_store(
+                vector_store=create_vector_store(f"{category}_collections"),
+                embed_model=embed_model
+            )
+            self._cold_starts[category] = time.perf_counter() - start
+            logger.info(f"Built index for category {category} in {self._cold_starts[category]:.2f}s")
+            self._insert(category, index)
+            return index
 
-doc_llm = Groq(model="deepseek-r1-distill-llama-70b", api_key=GROQ_API_KEY)
+    def put(self, category: str, index: VectorStoreIndex) -> None:
+        """Replace the index for a category, e.g. after ingestion"""
+        self._insert(category, index)
+
+    def pop(self, category: str) -> None:
+        with self._lock:
+            self._indexes.pop(category, None)
+            self._cold_starts.pop(category, None)
+
+    def prewarm(self, categories: Iterable[str]) -> None:
+        for category in categories:
+            try:
+                self.get(category)
+            except Exception as e:
+                logger.error(f"Failed to prewarm index for category {category}: {str(e)}")
+
+    def check_health(self) -> None:
+        """Ping every cached store; unhealthy ones are dropped and rebuilt with a fresh client"""
+        with self._lock:
+            entries: List[Tuple[str, VectorStoreIndex]] = list(self._indexes.items())
+
+        for category, index in entries:
+            ping = getattr(index.vector_store, "ping", None)
+            if ping is None:
+                continue
+            try:
+                ping()
+            except Exception as e:
+                logger.warning(f"Index for category {category} failed its health check, reconnecting: {str(e)}")
+                with self._lock:
+                    if self._indexes.get(category) is index:
+                        del self._indexes[category]
+                        self._cold_starts.pop(category, None)
+                    self._stats["reconnects"] += 1
+                self.prewarm([category])
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            cached = list(self._indexes)
+        return {**self._stats, "cached": cached, "cold_start_seconds": dict(self._cold_starts)}
+
+
+index_registry = IndexRegistry(INDEX_CACHE_MAX_ENTRIES)
 
 def get_vector_store(category: str) -> VectorStoreIndex:
     """Get or create vector store for a category"""
-    if category not in vector_stores:
-        astra_db_store = AstraDBVectorStore(
-            token=ASTRA_DB_APPLICATION_TOKEN,
-            api_endpoint=ASTRA_DB_API_ENDPOINT,
-            collection_name=f"{category}_collections",
-            embedding_dimension=768
-        )
-
-        vector_stores[category] = VectorStoreIndex.from_vector_store(
-            vector_store=astra_db_store,
-            embed_model=embed_model
-        )
-    return vector_stores[category]
+    return index_registry.get(category)
+
+def chunk_id(node: BaseNode) -> str:
+    """Content-derived node ID, so identical chunks overwrite each other instead of piling up"""
+    return hashlib.sha256(node.get_content(metadata_mode=MetadataMode.NONE).encode("utf-8")).hexdigest()
+
+async def index_documents(
+    documents: List[Document], vector_store: BasePydanticVectorStore, category: Optional[str] = None
+) -> VectorStoreIndex:
+    """
+    Split, embed and insert documents into a vector store without blocking the event loop
+    With a category, the chunks are also added to that category's BM25 keyword index
+    """
+    split_nodes = await run_blocking(Settings.node_parser.get_nodes_from_documents, documents)
+
+    # Chunk-level dedup: repeated chunks collapse onto one ID, which the store upserts
+    new_ids = {node.node_id: chunk_id(node) for node in split_nodes}
+    unique_nodes = {}
+    for node in split_nodes:
+        node.id_ = new_ids[node.node_id]
+        for relation in (NodeRelationship.PREVIOUS, NodeRelationship.NEXT):
+            related = node.relationships.get(relation)
+            if related is not None:
+                related.node_id = new_ids.get(related.node_id, related.node_id)
+        unique_nodes.setdefault(node.id_, node)
+    nodes = list(unique_nodes.values())
+
+    embeddings = await embed_model.aget_text_embedding_batch(
+        [node.get_content(metadata_mode=MetadataMode.EMBED) for node in nodes]
+    )
+    for node, embedding in zip(nodes, embeddings):
+        node.embedding = embedding
+
+    await vector_store.async_add(nodes)
+    if category is not None:
+        await run_blocking(keyword_index.add, category, nodes)
+    embed_model.log_stats()
+
+    return VectorStoreIndex.from_vector_store(
+        vector_store=vector_store,
+        embed_model=embed_model
+    )
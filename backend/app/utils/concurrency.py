@@ -0,0 +1,81 @@
+import asyncio
+import contextvars
+import functools
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Awaitable, Callable, Dict, Hashable, TypeVar
+from app.config import BLOCKING_POOL_SIZE
+from app.utils.logger import logger
+
+T = TypeVar("T")
+
+# Shared, bounded pool for sync-only clients (PDF parsing, Astra, paper loaders)
+blocking_pool = ThreadPoolExecutor(max_workers=BLOCKING_POOL_SIZE, thread_name_prefix="blocking")
+
+
+async def run_blocking(func: Callable[..., T], *args: Any, **kwargs: Any) -> T:
+    """Run a blocking call on the bounded thread pool without stalling the event loop"""
+    loop = asyncio.get_running_loop()
+    # Carry the request context (request ID, stage timings) into the worker thread
+    context = contextvars.copy_context()
+    return await loop.run_in_executor(blocking_pool, functools.partial(context.run, func, *args, **kwargs))
+
+
+class TokenBucket:
+    """Async token bucket: refills `rate` tokens per second up to `capacity`, callers wait for a token"""
+
+    def __init__(self, rate: float, capacity: float):
+        if rate <= 0 or capacity <= 0:
+            raise ValueError(f"Token bucket rate and capacity must be positive, got rate={rate}, capacity={capacity}")
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    async def acquire(self, tokens: float = 1.0) -> None:
+        # Waiters queue on the lock, so tokens are handed out in arrival order
+        async with self._lock:
+            self._refill()
+            while self._tokens < tokens:
+                await asyncio.sleep((tokens - self._tokens) / self.rate)
+                self._refill()
+            self._tokens -= tokens
+
+
+class SingleFlight:
+    """
+    Coalesces concurrent calls with the same key into one execution whose result (or
+    exception) every caller receives
+    The execution runs as its own task, so a caller that goes away does not cancel it for
+    the others; the key is released as soon as it finishes, so later calls run afresh
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self._calls: Dict[Hashable, asyncio.Task] = {}
+        self.stats = {"executions": 0, "coalesced": 0}
+
+    def _release(self, key: Hashable, task: asyncio.Task) -> None:
+        if self._calls.get(key) is task:
+            del self._calls[key]
+        if not task.cancelled():
+            # Mark the exception retrieved even if every caller went away
+            task.exception()
+
+    async def do(self, key: Hashable, func: Callable[..., Awaitable[T]], *args: Any, **kwargs: Any) -> T:
+        task = self._calls.get(key)
+        if task is None:
+            self.stats["executions"] += 1
+            task = asyncio.create_task(func(*args, **kwargs))
+            self._calls[key] = task
+            task.add_done_callback(functools.partial(self._release, key))
+        else:
+            self.stats["coalesced"] += 1
+            logger.info(f"Joined in-flight {self.name} call for {key}")
+        return await asyncio.shield(task)
@@ -1,13 +1,47 @@
+import json
 import logging
 import sys
+from contextvars import ContextVar
+from app.config import LOG_FORMAT
+
+# ID of the request being handled, attached to every log line emitted while handling it
+request_id_var: ContextVar[str] = ContextVar("request_id", default="-")
+
+
+class RequestIdFilter(logging.Filter):
+    def filter(self, record: logging.LogRecord) -> bool:
+        record.request_id = request_id_var.get()
+        return True
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line; fields passed as `extra={"fields": {...}}` are merged in"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "time": self.formatTime(record, self.datefmt),
+            "level": record.levelname,
+            "request_id": getattr(record, "request_id", "-"),
+            "message": record.getMessage(),
+        }
+        entry.update(getattr(record, "fields", {}))
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
 
 def setup_logger():
     logger = logging.getLogger('rag_logger')
-    formatter = logging.Formatter('%(levelname)s - [%(asctime)s] - %(message)s', datefmt='%d/%b/%Y %H:%M:%S')
+    logger.setLevel(logging.INFO)
+    if LOG_FORMAT == "json":
+        formatter = JsonFormatter(datefmt='%Y-%m-%dT%H:%M:%S%z')
+    else:
+        formatter = logging.Formatter('%(levelname)s - [%(asctime)s] - [%(request_id)s] - %(message)s', datefmt='%d/%b/%Y %H:%M:%S')
     
     stream_handler = logging.StreamHandler(sys.stdout)
     stream_handler.setLevel(logging.INFO)
     stream_handler.setFormatter(formatter)
+    stream_handler.addFilter(RequestIdFilter())
     logger.addHandler(stream_handler)
 
     return logger
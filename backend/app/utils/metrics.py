@@ -0,0 +1,277 @@
+"""
+Per-stage latency histograms, request tracing and the Prometheus /metrics exposition
+
+Stages (embedding, retrieval, generation, upstream calls, PDF parsing, ...) are timed with
+`stage()` or picked up from llama-index's instrumentation spans, recorded into histograms,
+and summed per request so each finished request logs where its time went.
+"""
+import cProfile
+import io
+import pstats
+import threading
+import time
+import uuid
+from bisect import bisect_left
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+from llama_index.core.instrumentation import get_dispatcher
+from llama_index.core.instrumentation.span_handlers import BaseSpanHandler
+from app.config import PROFILING_ENABLED, PROFILE_TOP_N
+from app.utils.logger import logger, request_id_var
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+
+
+class Histogram:
+    """Cumulative-bucket latency histogram with labels, rendered in the Prometheus text format"""
+
+    def __init__(self, name: str, help: str, labelnames: Tuple[str, ...], buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labelnames = labelnames
+        self.buckets = buckets
+        self._lock = threading.Lock()
+        # label values -> (per-bucket counts, sum, count)
+        self._series: Dict[Tuple[str, ...], List[Any]] = {}
+
+    def observe(self, value: float, *labels: str) -> None:
+        with self._lock:
+            series = self._series.setdefault(labels, [[0] * len(self.buckets), 0.0, 0])
+            index = bisect_left(self.buckets, value)
+            if index < len(self.buckets):
+                series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            series = {labels: (list(counts), total, count) for labels, (counts, total, count) in self._series.items()}
+        for labels, (counts, total, count) in sorted(series.items()):
+            label_text = ",".join(f'{name}="{value}"' for name, value in zip(self.labelnames, labels))
+            prefix = f"{label_text}," if label_text else ""
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                lines.append(f'{self.name}_bucket{{{prefix}le="{bound}"}} {cumulative}')
+            lines.append(f'{self.name}_bucket{{{prefix}le="+Inf"}} {count}')
+            lines.append(f"{self.name}_sum{{{label_text}}} {total}")
+            lines.append(f"{self.name}_count{{{label_text}}} {count}")
+        return lines
+
+
+class Gauge:
+    """Labelled value that can go up and down, e.g. a queue depth"""
+
+    kind = "gauge"
+
+    def __init__(self, name: str, help: str, labelnames: Tuple[str, ...]):
+        self.name = name
+        self.help = help
+        self.labelnames = labelnames
+        self._lock = threading.Lock()
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def set(self, value: float, *labels: str) -> None:
+        with self._lock:
+            self._values[labels] = value
+
+    def inc(self, value: float = 1.0, *labels: str) -> None:
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0.0) + value
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        with self._lock:
+            values = dict(self._values)
+        for labels, value in sorted(values.items()):
+            label_text = ",".join(f'{name}="{label}"' for name, label in zip(self.labelnames, labels))
+            lines.append(f"{self.name}{{{label_text}}} {value}")
+        return lines
+
+
+class Counter(Gauge):
+    """Labelled monotonically increasing count"""
+
+    kind = "counter"
+
+
+stage_seconds = Histogram("rag_stage_seconds", "Time spent in each processing stage", ("stage",))
+request_seconds = Histogram(
+    "rag_http_request_seconds", "HTTP request latency until the last body byte", ("method", "route", "status")
+)
+admission_wait_seconds = Histogram(
+    "rag_admission_wait_seconds", "Time upstream calls waited for admission", ("upstream", "priority")
+)
+admission_queue_depth = Gauge("rag_admission_queue_depth", "Upstream calls waiting for admission", ("upstream",))
+admission_in_flight = Gauge("rag_admission_in_flight", "Upstream calls in flight", ("upstream",))
+admission_limit = Gauge("rag_admission_limit", "Adaptive concurrency limit per upstream", ("upstream",))
+admission_rejections = Counter(
+    "rag_admission_rejections_total", "Upstream calls rejected by admission control", ("upstream", "priority", "reason")
+)
+routing_decisions = Counter(
+    "rag_routing_decisions_total", "RAG answers by model tier and routing reason", ("tier", "reason")
+)
+registry: List[Any] = [
+    request_seconds, stage_seconds, admission_wait_seconds,
+    admission_queue_depth, admission_in_flight, admission_limit, admission_rejections, routing_decisions,
+]
+
+
+def render_metrics() -> str:
+    return "\n".join(line for histogram in registry for line in histogram.render()) + "\n"
+
+
+# Seconds per stage for the request being handled, summed over concurrent work
+request_stages: ContextVar[Optional[Dict[str, float]]] = ContextVar("request_stages", default=None)
+
+def record_stage(name: str, seconds: float) -> None:
+    stage_seconds.observe(seconds, name)
+    stages = request_stages.get()
+    if stages is not None:
+        stages[name] = stages.get(name, 0.0) + seconds
+
+@contextmanager
+def stage(name: str) -> Iterator[None]:
+    """Time a block as a stage, whether or not it raises"""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_stage(name, time.perf_counter() - start)
+
+
+# llama-index span (qualified method name) -> stage
+SPAN_STAGES = {
+    "BaseEmbedding.get_query_embedding": "embedding",
+    "BaseEmbedding.aget_query_embedding": "embedding",
+    "BaseEmbedding.get_text_embedding_batch": "embedding",
+    "BaseEmbedding.aget_text_embedding_batch": "embedding",
+    "BaseRetriever.retrieve": "retrieval",
+    "BaseRetriever.aretrieve": "retrieval",
+    "BaseSynthesizer.synthesize": "synthesis",
+    "BaseSynthesizer.asynthesize": "synthesis",
+    "LLM.predict": "generation",
+    "LLM.apredict": "generation",
+    "LLM.stream": "generation",
+    "LLM.astream": "generation",
+}
+
+
+class StageSpanHandler(BaseSpanHandler[Any]):
+    """
+    Records llama-index spans as stages
+    Only the outermost span of a stage counts, so a retriever wrapping another
+    retriever is not timed twice
+    """
+
+    @classmethod
+    def class_name(cls) -> str:
+        return "StageSpanHandler"
+
+    def _stage_of(self, id_: str) -> Optional[str]:
+        return SPAN_STAGES.get(id_.split("-", 1)[0])
+
+    def _nested(self, stage_name: str, parent_id: Optional[str]) -> bool:
+        while parent_id is not None:
+            parent = self.open_spans.get(parent_id)
+            if parent is None:
+                return False
+            if parent[0] == stage_name:
+                return True
+            parent_id = parent[2]
+        return False
+
+    def new_span(self, id_: str, bound_args, instance=None, parent_span_id: Optional[str] = None, tags=None, **kwargs: Any):
+        stage_name = self._stage_of(id_)
+        if stage_name is not None and self._nested(stage_name, parent_span_id):
+            stage_name = None
+        # Every span is tracked so nesting can be resolved through unmapped spans
+        return (stage_name, time.perf_counter(), parent_span_id)
+
+    def _close(self, id_: str):
+        span = self.open_spans.get(id_)
+        if span is not None and span[0] is not None:
+            record_stage(span[0], time.perf_counter() - span[1])
+        return span
+
+    def prepare_to_exit_span(self, id_: str, bound_args, instance=None, result=None, **kwargs: Any):
+        return self._close(id_)
+
+    def prepare_to_drop_span(self, id_: str, bound_args, instance=None, err=None, **kwargs: Any):
+        return self._close(id_)
+
+
+def install_span_handler() -> None:
+    dispatcher = get_dispatcher()
+    if not any(isinstance(handler, StageSpanHandler) for handler in dispatcher.span_handlers):
+        dispatcher.add_span_handler(StageSpanHandler())
+
+
+def profile_report(profiler: cProfile.Profile) -> str:
+    output = io.StringIO()
+    pstats.Stats(profiler, stream=output).sort_stats("cumulative").print_stats(PROFILE_TOP_N)
+    return output.getvalue()
+
+
+class MetricsMiddleware:
+    """
+    Gives each request an ID (from X-Request-ID or a new one), times it until the last
+    body byte so streamed responses count in full, and logs a per-stage breakdown
+    With PROFILING_ENABLED, a request sent with `X-Profile: 1` is run under cProfile and
+    its hottest functions are logged; other requests interleaved on the event loop show
+    up in that profile too
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        headers = dict(scope["headers"])
+        request_id = headers.get(b"x-request-id", b"").decode() or uuid.uuid4().hex
+        id_token = request_id_var.set(request_id)
+        stages: Dict[str, float] = {}
+        stages_token = request_stages.set(stages)
+        status = {"code": 500}
+
+        async def send_with_request_id(message):
+            if message["type"] == "http.response.start":
+                status["code"] = message["status"]
+                message.setdefault("headers", [])
+                message["headers"] = list(message["headers"]) + [(b"x-request-id", request_id.encode())]
+            await send(message)
+
+        profiler = None
+        if PROFILING_ENABLED and headers.get(b"x-profile") == b"1":
+            profiler = cProfile.Profile()
+            profiler.enable()
+
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_request_id)
+        finally:
+            duration = time.perf_counter() - start
+            if profiler is not None:
+                profiler.disable()
+            # Route template rather than the raw path, so IDs in paths don't explode label cardinality
+            route = getattr(scope.get("route"), "path", "unmatched")
+            request_seconds.observe(duration, scope["method"], route, str(status["code"]))
+            logger.info(
+                f"{scope['method']} {route} {status['code']} in {duration:.3f}s",
+                extra={"fields": {
+                    "method": scope["method"],
+                    "route": route,
+                    "status": status["code"],
+                    "duration": round(duration, 6),
+                    "stages": {name: round(seconds, 6) for name, seconds in stages.items()},
+                }},
+            )
+            if profiler is not None:
+                logger.info(f"Profile for request {request_id}:\n{profile_report(profiler)}")
+            request_stages.reset(stages_token)
+            request_id_var.reset(id_token)
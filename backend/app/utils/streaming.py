@@ -0,0 +1,19 @@
+import json
+from typing import AsyncIterator
+from app.utils.logger import logger
+
+
+async def to_sse(tokens: AsyncIterator[str]) -> AsyncIterator[str]:
+    """
+    Wrap a token generator as Server-Sent Events
+    Each token is sent as a `data:` event, followed by a final `done` event
+    """
+    try:
+        async for token in tokens:
+            if token:
+                yield f"data: {json.dumps({'token': token})}\n\n"
+        yield "event: done\ndata: {}\n\n"
+    except Exception as e:
+        # Headers are already sent at this point, so report the failure in-band
+        logger.error(f"Error while streaming response: {str(e)}")
+        yield f"event: error\ndata: {json.dumps({'detail': str(e)})}\n\n"
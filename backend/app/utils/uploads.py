@@ -0,0 +1,202 @@
+import hashlib
+import os
+import uuid
+from pathlib import Path
+from typing import Awaitable, Callable, Dict, List, Optional
+from fastapi import HTTPException, Request
+from app.config import UPLOAD_SPOOL_DIR, UPLOAD_CHUNK_SIZE
+from app.utils.concurrency import run_blocking
+from app.utils.logger import logger
+
+try:
+    import python_multipart as multipart
+    from python_multipart.multipart import parse_options_header
+except ModuleNotFoundError:
+    import multipart
+    from multipart.multipart import parse_options_header
+
+# Room for the multipart boundaries, part headers and small fields around the file itself
+FORM_OVERHEAD_BYTES = 64 * 1024
+
+# OpenAPI request body of routes that receive their upload through receive_upload
+UPLOAD_OPENAPI = {
+    "requestBody": {
+        "required": True,
+        "content": {
+            "multipart/form-data": {
+                "schema": {
+                    "type": "object",
+                    "required": ["file"],
+                    "properties": {"file": {"type": "string", "format": "binary"}},
+                }
+            }
+        },
+    }
+}
+
+
+class SpooledUpload:
+    """An upload written to a spool file, with its size and SHA-256 computed while streaming"""
+
+    def __init__(self, path: str, size: int, sha256: str, filename: str, content_type: str):
+        self.path = path
+        self.size = size
+        self.sha256 = sha256
+        self.filename = filename
+        self.content_type = content_type
+
+    def read_bytes(self) -> bytes:
+        with open(self.path, "rb") as f:
+            return f.read()
+
+    def remove(self) -> None:
+        Path(self.path).unlink(missing_ok=True)
+
+
+class FilePartReader:
+    """multipart/form-data parser callbacks that pick out the data of one file field"""
+
+    def __init__(self, field: str):
+        self.field = field
+        self.filename: Optional[str] = None
+        self.content_type = ""
+        self.complete = False
+        self.chunks: List[bytes] = []
+        self.pending_bytes = 0
+        self._headers: Dict[bytes, bytes] = {}
+        self._header_name = b""
+        self._header_value = b""
+        self._in_field = False
+
+    def callbacks(self) -> Dict[str, Callable]:
+        return {
+            "on_part_begin": self.on_part_begin,
+            "on_header_field": self.on_header_field,
+            "on_header_value": self.on_header_value,
+            "on_header_end": self.on_header_end,
+            "on_headers_finished": self.on_headers_finished,
+            "on_part_data": self.on_part_data,
+            "on_part_end": self.on_part_end,
+        }
+
+    def on_part_begin(self) -> None:
+        self._headers = {}
+
+    def on_header_field(self, data: bytes, start: int, end: int) -> None:
+        self._header_name += data[start:end]
+
+    def on_header_value(self, data: bytes, start: int, end: int) -> None:
+        self._header_value += data[start:end]
+
+    def on_header_end(self) -> None:
+        self._headers[self._header_name.lower()] = self._header_value
+        self._header_name, self._header_value = b"", b""
+
+    def on_headers_finished(self) -> None:
+        _, options = parse_options_header(self._headers.get(b"content-disposition", b""))
+        name = options.get(b"name", b"").decode("utf-8", errors="replace")
+        # Only the first file sent under the field name is kept
+        self._in_field = name == self.field and b"filename" in options and self.filename is None
+        if self._in_field:
+            self.filename = options[b"filename"].decode("utf-8", errors="replace")
+            self.content_type = self._headers.get(b"content-type", b"").decode("latin-1")
+
+    def on_part_data(self, data: bytes, start: int, end: int) -> None:
+        if self._in_field:
+            self.chunks.append(data[start:end])
+            self.pending_bytes += end - start
+
+    def on_part_end(self) -> None:
+        if self._in_field:
+            self.complete = True
+            self._in_field = False
+
+    def take(self) -> List[bytes]:
+        """The file data received since the last call"""
+        chunks, self.chunks, self.pending_bytes = self.chunks, [], 0
+        return chunks
+
+
+def too_large(max_bytes: int) -> HTTPException:
+    return HTTPException(status_code=413, detail=f"Upload exceeds the limit of {max_bytes} bytes")
+
+
+def write_chunks(handle, digest, chunks: List[bytes]) -> None:
+    for chunk in chunks:
+        digest.update(chunk)
+        handle.write(chunk)
+
+
+def feed(parser, chunk: Optional[bytes]) -> None:
+    """Feed a chunk of the body to the multipart parser, or finalize it when `chunk` is None"""
+    try:
+        if chunk is None:
+            parser.finalize()
+        else:
+            parser.write(chunk)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=f"Malformed multipart body: {str(e)}")
+
+
+async def receive_upload(request: Request, max_bytes: int, suffix: str = "", field: str = "file") -> SpooledUpload:
+    """
+    Stream the `field` file of a multipart/form-data body to a spool file, hashing it on the way
+    FastAPI's form parsing would first copy the whole body to a temporary file, whatever its size;
+    here a Content-Length over the limit is rejected with 413 before anything is read, and any
+    other upload as soon as it passes `max_bytes`. File data is written UPLOAD_CHUNK_SIZE bytes
+    at a time. When `suffix` is given, a filename without it is rejected with 400 before its data
+    """
+    content_length = request.headers.get("content-length", "")
+    if content_length.isdigit() and int(content_length) > max_bytes + FORM_OVERHEAD_BYTES:
+        raise too_large(max_bytes)
+    content_type, options = parse_options_header(request.headers.get("content-type", ""))
+    if content_type != b"multipart/form-data" or b"boundary" not in options:
+        raise HTTPException(status_code=400, detail=f"Expected a multipart/form-data body with a file in the '{field}' field")
+
+    reader = FilePartReader(field)
+    parser = multipart.MultipartParser(options[b"boundary"], reader.callbacks())
+
+    Path(UPLOAD_SPOOL_DIR).mkdir(parents=True, exist_ok=True)
+    path = str(Path(UPLOAD_SPOOL_DIR) / f"{uuid.uuid4().hex}.upload")
+    digest = hashlib.sha256()
+    size = received = 0
+    handle = await run_blocking(open, path, "wb")
+    try:
+        async for chunk in request.stream():
+            # Bounds chunked bodies, which carry no Content-Length, including ones without the file
+            received += len(chunk)
+            if received > max_bytes + FORM_OVERHEAD_BYTES:
+                raise too_large(max_bytes)
+            feed(parser, chunk)
+            if suffix and reader.filename is not None and not reader.filename.lower().endswith(suffix):
+                raise HTTPException(status_code=400, detail=f"File must be a {suffix.lstrip('.').upper()}")
+            if size + reader.pending_bytes > max_bytes:
+                raise too_large(max_bytes)
+            if reader.pending_bytes >= UPLOAD_CHUNK_SIZE:
+                size += reader.pending_bytes
+                await run_blocking(write_chunks, handle, digest, reader.take())
+        feed(parser, None)
+        if not reader.complete:
+            raise HTTPException(status_code=400, detail=f"No file in the '{field}' field of the upload")
+        size += reader.pending_bytes
+        await run_blocking(write_chunks, handle, digest, reader.take())
+    except BaseException:
+        await run_blocking(handle.close)
+        await run_blocking(os.remove, path)
+        raise
+    await run_blocking(handle.close)
+
+    logger.info(f"Spooled upload {reader.filename} ({size} bytes) to {path}")
+    return SpooledUpload(path, size, digest.hexdigest(), reader.filename or "", reader.content_type)
+
+
+def upload_file(max_bytes: int, suffix: str = "") -> Callable[[Request], Awaitable[SpooledUpload]]:
+    """
+    Route dependency receiving the `file` of a multipart upload with receive_upload
+    Declare it after the API key check so unauthenticated bodies are never read
+    """
+
+    async def dependency(request: Request) -> SpooledUpload:
+        return await receive_upload(request, max_bytes, suffix)
+
+    return dependency
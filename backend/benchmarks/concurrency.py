@@ -0,0 +1,110 @@
+"""
+Concurrency benchmark for the completion routes under mixed load
+
+Runs the FastAPI app in-process against fake upstreams with fixed latencies and reports
+per-route p50/p99. With a non-blocking request path, /text latency stays close to the
+fake LLM latency even while PDF uploads and Gemini calls are in flight.
+
+Usage (from backend/):
+    python -m benchmarks.concurrency --clients 32 --requests 400
+"""
+import os
+
+os.environ.setdefault("GEMINI_API_KEY", "benchmark")
+os.environ.setdefault("GROQ_API_KEY", "benchmark")
+os.environ.setdefault("API_KEY", "benchmark")
+
+import argparse
+import asyncio
+import random
+import statistics
+import time
+from collections import defaultdict
+
+import httpx
+
+from app.app import create_app
+from benchmarks.fakes import install_fakes, make_pdf
+
+HEADERS = {"X-API-Key": os.environ["API_KEY"]}
+ROUTES = {
+    "text": 0.5,
+    "search": 0.15,
+    "image": 0.1,
+    "audio": 0.1,
+    "pdfs": 0.15,
+}
+
+
+async def send(client: httpx.AsyncClient, route: str, pdf: bytes, number: int) -> None:
+    # Distinct prompts so the response cache does not short-circuit the request path
+    params = {"category": "tech", "prompt": f"What is a vertebral column? (request {number})"}
+    if route in ("text", "search"):
+        response = await client.post(f"/openai/v1/completions/{route}", params=params, headers=HEADERS)
+    elif route == "pdfs":
+        files = {"file": ("bench.pdf", pdf, "application/pdf")}
+        response = await client.post("/openai/v1/completions/pdfs", params=params, files=files, headers=HEADERS)
+    else:
+        if route == "audio":
+            params.pop("prompt")
+        files = {"file": (f"bench.{route}", b"\0" * 1024, "application/octet-stream")}
+        response = await client.post(f"/openai/v1/completions/{route}", params=params, files=files, headers=HEADERS)
+    response.raise_for_status()
+
+
+async def run(args: argparse.Namespace) -> None:
+    install_fakes(args.embed_latency, args.llm_latency, args.gemini_latency, args.store_latency)
+    app = create_app()
+    pdf = make_pdf(args.pdf_pages)
+    rng = random.Random(args.seed)
+    plan = rng.choices(list(ROUTES), weights=list(ROUTES.values()), k=args.requests)
+    latencies = defaultdict(list)
+    queue: asyncio.Queue = asyncio.Queue()
+    for number, route in enumerate(plan):
+        queue.put_nowait((number, route))
+
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+
+        async def worker() -> None:
+            while not queue.empty():
+                number, route = queue.get_nowait()
+                start = time.perf_counter()
+                await send(client, route, pdf, number)
+                latencies[route].append(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(args.clients)))
+        elapsed = time.perf_counter() - start
+
+    report(latencies, elapsed)
+
+
+def percentile(samples: list[float], pct: float) -> float:
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))]
+
+
+def report(latencies: dict[str, list[float]], elapsed: float) -> None:
+    total = sum(len(samples) for samples in latencies.values())
+    print(f"{total} requests in {elapsed:.2f}s ({total / elapsed:.1f} req/s)")
+    print(f"{'route':<8}{'count':>7}{'p50 ms':>10}{'p99 ms':>10}{'mean ms':>10}")
+    everything = [sample for samples in latencies.values() for sample in samples]
+    for route, samples in sorted(latencies.items()) + [("all", everything)]:
+        print(
+            f"{route:<8}{len(samples):>7}{percentile(samples, 50) * 1000:>10.1f}"
+            f"{percentile(samples, 99) * 1000:>10.1f}{statistics.mean(samples) * 1000:>10.1f}"
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Mixed-load concurrency benchmark")
+    parser.add_argument("--clients", type=int, default=32, help="concurrent clients")
+    parser.add_argument("--requests", type=int, default=400, help="total requests")
+    parser.add_argument("--embed-latency", type=float, default=0.02)
+    parser.add_argument("--llm-latency", type=float, default=0.5)
+    parser.add_argument("--gemini-latency", type=float, default=0.3)
+    parser.add_argument("--store-latency", type=float, default=0.05)
+    parser.add_argument("--pdf-pages", type=int, default=20)
+    parser.add_argument("--seed", type=int, default=0)
+    asyncio.run(run(parser.parse_args()))
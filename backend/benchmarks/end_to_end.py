@@ -0,0 +1,236 @@
+"""
+End-to-end benchmark of the whole app against local stand-ins for every upstream
+
+Starts the app from `create_app` with fake embedder, LLM, Gemini, paper loader and
+in-memory vector stores (each with configurable latency), drives a mixed workload over
+the completion routes from concurrent clients, and reports throughput, p50/p95/p99 per
+route and process memory. Every on-disk store goes to a temporary directory.
+
+Results can be saved as JSON and compared with an earlier run; the exit status is 1 when
+throughput drops or any route's p95 grows by more than --max-regression.
+
+Usage (from backend/):
+    python -m benchmarks.end_to_end --workload mixed --clients 32 --requests 500 --json-out run.json
+    python -m benchmarks.end_to_end --workload mixed --baseline run.json
+"""
+import os
+import tempfile
+
+BENCH_DIR = tempfile.mkdtemp(prefix="bench-")
+for name, value in {
+    "GEMINI_API_KEY": "benchmark",
+    "GROQ_API_KEY": "benchmark",
+    "API_KEY": "benchmark",
+    "LOG_FORMAT": "text",
+    "EMBEDDING_CACHE_PATH": f"{BENCH_DIR}/embeddings.sqlite3",
+    "PDF_INDEX_PATH": f"{BENCH_DIR}/pdf_index.sqlite3",
+    "BM25_INDEX_PATH": f"{BENCH_DIR}/bm25.sqlite3",
+    "SESSION_STORE_URL": f"{BENCH_DIR}/sessions.sqlite3",
+    "JOBS_DB_PATH": f"{BENCH_DIR}/jobs.sqlite3",
+    "BATCH_DB_PATH": f"{BENCH_DIR}/batches.sqlite3",
+    "UPLOAD_SPOOL_DIR": f"{BENCH_DIR}/uploads",
+    "PDF_STORAGE_DIR": f"{BENCH_DIR}/pdfs",
+}.items():
+    os.environ.setdefault(name, value)
+
+import argparse
+import asyncio
+import json
+import logging
+import random
+import resource
+import sys
+import time
+import tracemalloc
+from collections import defaultdict
+from typing import Dict, List, Optional
+
+import httpx
+
+from app.app import create_app
+from app.utils.logger import logger
+from benchmarks.fakes import install_fakes, make_pdf
+
+HEADERS = {"X-API-Key": os.environ["API_KEY"]}
+WORKLOADS = {
+    "mixed": {"text": 0.35, "text-stream": 0.1, "pdfs": 0.15, "image": 0.1, "audio": 0.1, "papers": 0.1, "search": 0.1},
+    "chat": {"text": 0.7, "text-stream": 0.3},
+    "ingest": {"pdfs": 0.6, "papers": 0.4},
+    "media": {"image": 0.5, "audio": 0.5},
+}
+
+
+def parse_mix(value: str) -> Dict[str, float]:
+    """A workload name or route=weight pairs, e.g. "text=0.8,pdfs=0.2" """
+    if value in WORKLOADS:
+        return WORKLOADS[value]
+    return {route: float(weight) for route, weight in (pair.split("=") for pair in value.split(","))}
+
+
+async def send(client: httpx.AsyncClient, route: str, number: int, pdf_pages: int, media_bytes: int) -> None:
+    # Distinct prompts, PDFs and media so the response, upload and media caches don't short-circuit the request path
+    params = {"category": "tech", "prompt": f"What is a vertebral column? (request {number})"}
+    path = f"/openai/v1/completions/{route}"
+    files = None
+    if route == "text-stream":
+        path, params["stream"] = "/openai/v1/completions/text", "true"
+    elif route == "pdfs":
+        files = {"file": ("bench.pdf", make_pdf(pdf_pages, tag=str(number)), "application/pdf")}
+    elif route == "papers":
+        params["paper"] = f"vertebral column {number}"
+    elif route in ("image", "audio"):
+        if route == "audio":
+            params.pop("prompt")
+        media = str(number).encode().rjust(media_bytes, b"\0")
+        files = {"file": (f"bench.{route}", media, "application/octet-stream")}
+    response = await client.post(path, params=params, files=files, headers=HEADERS)
+    response.raise_for_status()
+
+
+def rss_bytes() -> int:
+    with open("/proc/self/statm") as statm:
+        return int(statm.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+
+
+async def sample_memory(samples: List[int], interval: float = 0.05) -> None:
+    while True:
+        samples.append(rss_bytes())
+        await asyncio.sleep(interval)
+
+
+def percentile(samples: List[float], pct: float) -> float:
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))]
+
+
+async def run(args: argparse.Namespace) -> Dict:
+    install_fakes(
+        args.embed_latency, args.llm_latency, args.gemini_latency, args.store_latency, args.paper_latency,
+        args.fast_llm_latency,
+    )
+    app = create_app()
+    mix = parse_mix(args.workload)
+    rng = random.Random(args.seed)
+    plan = rng.choices(list(mix), weights=list(mix.values()), k=args.requests)
+    latencies: Dict[str, List[float]] = defaultdict(list)
+    errors: Dict[str, int] = defaultdict(int)
+    queue: asyncio.Queue = asyncio.Queue()
+    for number, route in enumerate(plan):
+        queue.put_nowait((number, route))
+
+    if args.tracemalloc:
+        tracemalloc.start()
+    rss_start = rss_bytes()
+    rss_samples: List[int] = []
+    sampler = asyncio.create_task(sample_memory(rss_samples))
+
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+
+        async def worker() -> None:
+            while not queue.empty():
+                number, route = queue.get_nowait()
+                start = time.perf_counter()
+                try:
+                    await send(client, route, number, args.pdf_pages, args.media_bytes)
+                except Exception as e:
+                    errors[route] += 1
+                    logger.warning(f"Benchmark request {number} ({route}) failed: {str(e)}")
+                    continue
+                latencies[route].append(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(args.clients)))
+        elapsed = time.perf_counter() - start
+
+    sampler.cancel()
+    memory = {
+        "rss_start_mb": rss_start / 2**20,
+        "rss_peak_mb": max(rss_samples + [rss_bytes()]) / 2**20,
+        "rss_end_mb": rss_bytes() / 2**20,
+        "max_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+    }
+    if args.tracemalloc:
+        memory["python_heap_peak_mb"] = tracemalloc.get_traced_memory()[1] / 2**20
+        tracemalloc.stop()
+
+    completed = sum(len(samples) for samples in latencies.values())
+    everything = [sample for samples in latencies.values() for sample in samples]
+    routes = {}
+    for route, samples in sorted(latencies.items()) + [("all", everything)]:
+        if not samples:
+            continue
+        routes[route] = {
+            "count": len(samples),
+            "errors": errors[route] if route != "all" else sum(errors.values()),
+            **{f"p{pct}_ms": percentile(samples, pct) * 1000 for pct in (50, 95, 99)},
+        }
+    return {
+        "workload": mix,
+        "settings": {key: value for key, value in vars(args).items() if key not in ("json_out", "baseline")},
+        "elapsed_s": elapsed,
+        "throughput_rps": completed / elapsed,
+        "routes": routes,
+        "memory": memory,
+    }
+
+
+def report(result: Dict) -> None:
+    print(f"{result['routes'].get('all', {}).get('count', 0)} requests in {result['elapsed_s']:.2f}s "
+          f"({result['throughput_rps']:.1f} req/s)")
+    print(f"{'route':<12}{'count':>7}{'errors':>8}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+    for route, stats in result["routes"].items():
+        print(
+            f"{route:<12}{stats['count']:>7}{stats['errors']:>8}{stats['p50_ms']:>10.1f}"
+            f"{stats['p95_ms']:>10.1f}{stats['p99_ms']:>10.1f}"
+        )
+    print("memory: " + ", ".join(f"{name} {value:.1f}" for name, value in result["memory"].items()))
+
+
+def regressions(result: Dict, baseline: Dict, tolerance: float) -> List[str]:
+    """Routes whose p95 grew, or overall throughput that fell, by more than the tolerance"""
+    found = []
+    if result["throughput_rps"] < baseline["throughput_rps"] * (1 - tolerance):
+        found.append(f"throughput {baseline['throughput_rps']:.1f} -> {result['throughput_rps']:.1f} req/s")
+    for route, stats in result["routes"].items():
+        before: Optional[Dict] = baseline["routes"].get(route)
+        if before is not None and stats["p95_ms"] > before["p95_ms"] * (1 + tolerance):
+            found.append(f"{route} p95 {before['p95_ms']:.1f} -> {stats['p95_ms']:.1f} ms")
+    return found
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="End-to-end benchmark with local stand-ins for all upstreams")
+    parser.add_argument("--workload", default="mixed", help=f"one of {', '.join(WORKLOADS)} or route=weight pairs")
+    parser.add_argument("--clients", type=int, default=32, help="concurrent clients")
+    parser.add_argument("--requests", type=int, default=500, help="total requests")
+    parser.add_argument("--embed-latency", type=float, default=0.02)
+    parser.add_argument("--llm-latency", type=float, default=0.5)
+    parser.add_argument("--fast-llm-latency", type=float, default=0.1)
+    parser.add_argument("--gemini-latency", type=float, default=0.3)
+    parser.add_argument("--store-latency", type=float, default=0.05)
+    parser.add_argument("--paper-latency", type=float, default=0.5)
+    parser.add_argument("--pdf-pages", type=int, default=10)
+    parser.add_argument("--media-bytes", type=int, default=1024, help="size of each image/audio upload")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--tracemalloc", action="store_true", help="also report the Python heap peak (slower)")
+    parser.add_argument("--verbose", action="store_true", help="keep the app's per-request logs")
+    parser.add_argument("--json-out", help="write the results to this file")
+    parser.add_argument("--baseline", help="results file from an earlier run to compare against")
+    parser.add_argument("--max-regression", type=float, default=0.2, help="tolerated relative slowdown")
+    args = parser.parse_args()
+
+    if not args.verbose:
+        logger.setLevel(logging.WARNING)
+    result = asyncio.run(run(args))
+    report(result)
+
+    if args.json_out:
+        with open(args.json_out, "w") as output:
+            json.dump(result, output, indent=2)
+    if args.baseline:
+        with open(args.baseline) as baseline_file:
+            found = regressions(result, json.load(baseline_file), args.max_regression)
+        for regression in found:
+            print(f"REGRESSION: {regression}")
+        sys.exit(1 if found else 0)
@@ -0,0 +1,263 @@
+"""
+Local stand-ins for the upstream services used by the backend
+Each fake sleeps for a configurable latency so benchmarks exercise the real request path
+"""
+import asyncio
+import hashlib
+import time
+from types import SimpleNamespace
+from typing import Any, Dict, List, Sequence
+
+from llama_index.core import Document, VectorStoreIndex
+from llama_index.core.base.embeddings.base import BaseEmbedding
+from llama_index.core.llms import CompletionResponse, CompletionResponseGen, CustomLLM, LLMMetadata
+from llama_index.core.llms.callbacks import llm_completion_callback
+from llama_index.core.bridge.pydantic import PrivateAttr
+from llama_index.core.schema import BaseNode, TextNode
+from llama_index.core.vector_stores.types import BasePydanticVectorStore, VectorStoreQuery, VectorStoreQueryResult
+
+from app.utils.concurrency import run_blocking
+
+
+def fake_vector(text: str, dim: int = 768) -> List[float]:
+    """Deterministic pseudo-embedding derived from the text hash"""
+    digest = hashlib.sha256(text.encode()).digest()
+    return [(digest[i % len(digest)] - 128) / 128 for i in range(dim)]
+
+
+class FakeEmbedding(BaseEmbedding):
+    """Embedding model that sleeps like a remote Ollama call"""
+
+    latency: float = 0.02
+    dim: int = 768
+
+    def _get_query_embedding(self, query: str) -> List[float]:
+        time.sleep(self.latency)
+        return fake_vector(query, self.dim)
+
+    def _get_text_embedding(self, text: str) -> List[float]:
+        time.sleep(self.latency)
+        return fake_vector(text, self.dim)
+
+    async def _aget_query_embedding(self, query: str) -> List[float]:
+        await asyncio.sleep(self.latency)
+        return fake_vector(query, self.dim)
+
+    async def _aget_text_embedding(self, text: str) -> List[float]:
+        await asyncio.sleep(self.latency)
+        return fake_vector(text, self.dim)
+
+
+class FakeLLM(CustomLLM):
+    """LLM that emits a fixed answer token by token after a fixed delay"""
+
+    latency: float = 0.5
+    tokens: int = 20
+
+    @property
+    def metadata(self) -> LLMMetadata:
+        return LLMMetadata(model_name="fake-llm")
+
+    def _answer(self) -> List[str]:
+        return ["token "] * self.tokens
+
+    @llm_completion_callback()
+    def complete(self, prompt: str, formatted: bool = False, **kwargs: Any) -> CompletionResponse:
+        time.sleep(self.latency)
+        return CompletionResponse(text="".join(self._answer()))
+
+    @llm_completion_callback()
+    def stream_complete(self, prompt: str, formatted: bool = False, **kwargs: Any) -> CompletionResponseGen:
+        time.sleep(self.latency)
+        text = ""
+        for token in self._answer():
+            text += token
+            yield CompletionResponse(text=text, delta=token)
+
+    @llm_completion_callback()
+    async def acomplete(self, prompt: str, formatted: bool = False, **kwargs: Any) -> CompletionResponse:
+        await asyncio.sleep(self.latency)
+        return CompletionResponse(text="".join(self._answer()))
+
+    @llm_completion_callback()
+    async def astream_complete(self, prompt: str, formatted: bool = False, **kwargs: Any):
+        async def gen():
+            await asyncio.sleep(self.latency)
+            text = ""
+            for token in self._answer():
+                text += token
+                yield CompletionResponse(text=text, delta=token)
+
+        return gen()
+
+
+class FakeRemoteVectorStore(BasePydanticVectorStore):
+    """In-memory, text-storing vector store whose sync calls block like the AstraDB client"""
+
+    stores_text: bool = True
+    latency: float = 0.05
+    _nodes: Dict[str, BaseNode] = PrivateAttr(default_factory=dict)
+
+    @property
+    def client(self) -> None:
+        return None
+
+    def add(self, nodes: Sequence[BaseNode], **add_kwargs: Any) -> List[str]:
+        time.sleep(self.latency)
+        for node in nodes:
+            self._nodes[node.node_id] = node
+        return [node.node_id for node in nodes]
+
+    def delete(self, ref_doc_id: str, **delete_kwargs: Any) -> None:
+        self._nodes = {
+            node_id: node for node_id, node in self._nodes.items() if node.ref_doc_id != ref_doc_id
+        }
+
+    def query(self, query: VectorStoreQuery, **kwargs: Any) -> VectorStoreQueryResult:
+        time.sleep(self.latency)
+        nodes = list(self._nodes.values())
+        scores = [
+            sum(a * b for a, b in zip(query.query_embedding, node.embedding)) for node in nodes
+        ]
+        ranked = sorted(zip(scores, nodes), key=lambda pair: pair[0], reverse=True)[: query.similarity_top_k]
+        return VectorStoreQueryResult(
+            nodes=[node for _, node in ranked],
+            similarities=[score for score, _ in ranked],
+            ids=[node.node_id for _, node in ranked],
+        )
+
+    async def async_add(self, nodes: Sequence[BaseNode], **add_kwargs: Any) -> List[str]:
+        return await run_blocking(self.add, nodes, **add_kwargs)
+
+    async def aquery(self, query: VectorStoreQuery, **kwargs: Any) -> VectorStoreQueryResult:
+        return await run_blocking(self.query, query, **kwargs)
+
+
+class FakeGeminiClient:
+    """Mimics `google.genai.Client` for generate_content on both sync and async surfaces"""
+
+    def __init__(self, latency: float = 0.3):
+        self.latency = latency
+        self.models = SimpleNamespace(generate_content=self._generate)
+        self.aio = SimpleNamespace(
+            models=SimpleNamespace(generate_content=self._agenerate),
+            files=SimpleNamespace(upload=self._aupload, get=self._aget_file, delete=self._adelete_file),
+        )
+
+    def _generate(self, **kwargs: Any) -> SimpleNamespace:
+        time.sleep(self.latency)
+        return SimpleNamespace(text="A fake Gemini answer.")
+
+    async def _agenerate(self, **kwargs: Any) -> SimpleNamespace:
+        await asyncio.sleep(self.latency)
+        return SimpleNamespace(text="A fake Gemini answer.")
+
+    async def _aupload(self, file: str, config: Dict[str, Any]) -> SimpleNamespace:
+        await asyncio.sleep(self.latency)
+        return SimpleNamespace(name="files/fake", uri="https://files.invalid/fake", state="ACTIVE")
+
+    async def _aget_file(self, name: str) -> SimpleNamespace:
+        return SimpleNamespace(name=name, uri="https://files.invalid/fake", state="ACTIVE")
+
+    async def _adelete_file(self, name: str) -> None:
+        return None
+
+
+class FakePaperLoader:
+    """Mimics the Arxiv/PubMed readers: returns a few documents about the query after a delay"""
+
+    def __init__(self, latency: float = 0.5, documents: int = 3):
+        self.latency = latency
+        self.documents = documents
+
+    def load_data(self, search_query: str, **kwargs: Any) -> List[Document]:
+        time.sleep(self.latency)
+        return [
+            Document(text=f"Paper {i} matching {search_query}: an overview of vertebral column anatomy.")
+            for i in range(self.documents)
+        ]
+
+
+def make_pdf(pages: int, lines_per_page: int = 40, tag: str = "") -> bytes:
+    """Build a minimal text PDF with the given number of pages; a distinct tag gives distinct content"""
+    objects = [b"<< /Type /Catalog /Pages 2 0 R >>", None, b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>"]
+    kids = []
+    for page in range(pages):
+        lines = "".join(
+            f"(Page {page} line {line} about vertebral column anatomy {tag}) Tj T* "
+            for line in range(lines_per_page)
+        )
+        stream = f"BT /F1 10 Tf 12 TL 40 780 Td {lines}ET".encode()
+        objects.append(b"<< /Length %d >>\nstream\n%s\nendstream" % (len(stream), stream))
+        content_id = len(objects)
+        objects.append(
+            b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] "
+            b"/Resources << /Font << /F1 3 0 R >> >> /Contents %d 0 R >>" % content_id
+        )
+        kids.append(len(objects))
+    objects[1] = b"<< /Type /Pages /Kids [%s] /Count %d >>" % (
+        b" ".join(b"%d 0 R" % kid for kid in kids), pages
+    )
+
+    out = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for number, body in enumerate(objects, start=1):
+        offsets.append(len(out))
+        out += b"%d 0 obj\n%s\nendobj\n" % (number, body)
+    xref = len(out)
+    out += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+    out += b"".join(b"%010d 00000 n \n" % offset for offset in offsets)
+    out += b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, xref)
+    return bytes(out)
+
+
+def seeded_store(category: str, documents: int = 20, latency: float = 0.05) -> FakeRemoteVectorStore:
+    """Fake vector store pre-filled with a handful of embedded nodes"""
+    store = FakeRemoteVectorStore(latency=0)
+    texts = [f"{category} document {i}" for i in range(documents)]
+    store.add([TextNode(text=text, embedding=fake_vector(text)) for text in texts])
+    store.latency = latency
+    return store
+
+
+def install_fakes(
+    embed_latency: float = 0.02,
+    llm_latency: float = 0.5,
+    gemini_latency: float = 0.3,
+    store_latency: float = 0.05,
+    paper_latency: float = 0.5,
+    fast_llm_latency: float = 0.1,
+) -> None:
+    """
+    Swap every upstream client the app holds for a local fake with the given latency
+    Stores are seeded for the tech, medical and pdf categories; any other category
+    gets an empty fake store
+    """
+    import tempfile
+    from app.routes import completions
+    from app.services import batch, compression, fanout, file_processing, handlers, jobs, routing, sessions, vector_store
+    from app.services.embedding_cache import CachedEmbedding, EmbeddingStore
+
+    cache_dir = tempfile.mkdtemp(prefix="bench-cache-")
+    embed_model = CachedEmbedding(FakeEmbedding(latency=embed_latency), EmbeddingStore(f"{cache_dir}/embeddings.sqlite3"))
+    llm = FakeLLM(latency=llm_latency)
+
+    for module in (vector_store, handlers, compression, fanout, batch, routing):
+        module.embed_model = embed_model
+    for module in (vector_store, fanout, batch, routing):
+        module.doc_llm = llm
+    for module in (vector_store, routing):
+        module.fast_llm = FakeLLM(latency=fast_llm_latency)
+    for module in (vector_store, sessions):
+        module.condense_llm = llm
+    handlers.gemini_client = FakeGeminiClient(latency=gemini_latency)
+    file_processing.PDF_STORAGE_DIR = tempfile.mkdtemp(prefix="bench-pdfs-")
+
+    loader = FakePaperLoader(latency=paper_latency)
+    for module in (completions, jobs):
+        module.paper_loader = lambda category: loader
+
+    vector_store.create_vector_store = lambda collection_name: FakeRemoteVectorStore(latency=store_latency)
+    for category in ("tech", "medical", "pdf"):
+        store = seeded_store(category, latency=store_latency)
+        vector_store.index_registry.put(category, VectorStoreIndex.from_vector_store(store, embed_model=embed_model))
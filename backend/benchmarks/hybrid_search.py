@@ -0,0 +1,143 @@
+"""
+Hybrid retrieval: recall@k and latency of dense, BM25 and fused (RRF) retrieval
+
+The synthetic corpus gives each chunk a topic, a few concepts and a part number.
+The stand-in dense model embeds concepts by meaning (both spellings of a concept
+map to the same vector) but ignores tokens containing digits, the way real
+embedding models blur identifiers. Two query types are mixed:
+  - identifier queries name the part number; keyword search should win
+  - paraphrase queries use the other spelling of each concept; dense search should win
+
+Usage (from backend/):
+    python -m benchmarks.hybrid_search --chunks 5000 --queries 400
+"""
+import argparse
+import hashlib
+import os
+import tempfile
+import time
+from typing import List
+
+import numpy as np
+from llama_index.core import QueryBundle, VectorStoreIndex
+from llama_index.core.base.embeddings.base import BaseEmbedding
+from llama_index.core.schema import TextNode
+
+from app.services.bm25 import BM25Index, tokenize
+from app.services.hybrid import reciprocal_rank_fusion
+
+
+def word_vector(word: str, dim: int) -> np.ndarray:
+    seed = int.from_bytes(hashlib.sha256(word.encode()).digest()[:8], "little")
+    return np.random.default_rng(seed).standard_normal(dim)
+
+
+class ConceptEmbedding(BaseEmbedding):
+    """Bag-of-concepts embedding: spellings "a<n>" and "b<n>" share a vector, tokens with digits are dropped"""
+
+    dim: int = 256
+
+    def _embed(self, text: str) -> List[float]:
+        vector = np.zeros(self.dim)
+        for token in tokenize(text):
+            if token[0] in "ab" and token[1:].isdigit():
+                token = f"concept{token[1:]}"
+            elif any(char.isdigit() for char in token):
+                continue
+            vector += word_vector(token, self.dim)
+        return (vector / max(np.linalg.norm(vector), 1e-12)).tolist()
+
+    def _get_query_embedding(self, query: str) -> List[float]:
+        return self._embed(query)
+
+    def _get_text_embedding(self, text: str) -> List[float]:
+        return self._embed(text)
+
+    async def _aget_query_embedding(self, query: str) -> List[float]:
+        return self._embed(query)
+
+
+def build_corpus(args: argparse.Namespace, rng: np.random.Generator):
+    topics = [f"topic{index}" for index in range(args.topics)]
+    chunks = []
+    for index in range(args.chunks):
+        concepts = rng.choice(args.concepts, size=3, replace=False)
+        part_number = f"px-{rng.integers(10000, 99999)}{index}"
+        text = (
+            f"Maintenance notes for the {topics[index % args.topics]} assembly. "
+            f"Covers {' '.join(f'a{concept}' for concept in concepts)}. Part number {part_number}."
+        )
+        chunks.append((TextNode(id_=str(index), text=text), concepts, part_number))
+    return chunks
+
+
+def build_queries(chunks, count: int, rng: np.random.Generator):
+    queries = []
+    for position, target in enumerate(rng.choice(len(chunks), size=count, replace=False)):
+        node, concepts, part_number = chunks[target]
+        if position % 2 == 0:
+            queries.append(("identifier", f"Which assembly uses part {part_number}?", node.node_id))
+        else:
+            queries.append(("paraphrase", f"Notes about {' '.join(f'b{concept}' for concept in concepts)}", node.node_id))
+    return queries
+
+
+def main(args: argparse.Namespace) -> None:
+    rng = np.random.default_rng(args.seed)
+    chunks = build_corpus(args, rng)
+    queries = build_queries(chunks, args.queries, rng)
+    nodes = [node for node, _, _ in chunks]
+    embed_model = ConceptEmbedding()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        keyword_index = BM25Index(os.path.join(tmp, "bm25.sqlite3"))
+        start = time.perf_counter()
+        keyword_index.add("bench", nodes)
+        print(f"BM25-indexed {len(nodes)} chunks in {time.perf_counter() - start:.1f}s")
+        dense_retriever = VectorStoreIndex(nodes, embed_model=embed_model).as_retriever(
+            similarity_top_k=args.candidates
+        )
+
+        hits = {name: {"identifier": [], "paraphrase": []} for name in ("dense", "bm25", "hybrid")}
+        times = {name: [] for name in hits}
+        for kind, query, target in queries:
+            bundle = QueryBundle(query_str=query, embedding=embed_model.get_query_embedding(query))
+
+            start = time.perf_counter()
+            dense = [result.node for result in dense_retriever.retrieve(bundle)]
+            times["dense"].append(time.perf_counter() - start)
+
+            start = time.perf_counter()
+            sparse = [node for node, _ in keyword_index.search("bench", query, args.candidates)]
+            times["bm25"].append(time.perf_counter() - start)
+
+            start = time.perf_counter()
+            fused = [result.node for result in reciprocal_rank_fusion([dense, sparse], args.top_k, args.rrf_k)]
+            # Fusion runs after both retrievers, which the app runs concurrently
+            times["hybrid"].append(max(times["dense"][-1], times["bm25"][-1]) + time.perf_counter() - start)
+
+            for name, ranking in (("dense", dense), ("bm25", sparse), ("hybrid", fused)):
+                hits[name][kind].append(target in {node.node_id for node in ranking[: args.top_k]})
+
+    print(f"{'method':<8}{'identifier':>12}{'paraphrase':>12}{'overall':>10}{'p50 ms':>10}{'p99 ms':>10}")
+    for name in hits:
+        overall = hits[name]["identifier"] + hits[name]["paraphrase"]
+        print(
+            f"{name:<8}{np.mean(hits[name]['identifier']):>12.3f}{np.mean(hits[name]['paraphrase']):>12.3f}"
+            f"{np.mean(overall):>10.3f}{np.percentile(times[name], 50) * 1000:>10.2f}"
+            f"{np.percentile(times[name], 99) * 1000:>10.2f}"
+        )
+    print(f"recall@{args.top_k}, {args.candidates} candidates per retriever, rrf_k={args.rrf_k}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Recall@k and latency of dense vs BM25 vs hybrid retrieval")
+    parser.add_argument("--chunks", type=int, default=5000)
+    parser.add_argument("--queries", type=int, default=400)
+    parser.add_argument("--topics", type=int, default=20)
+    parser.add_argument("--concepts", type=int, default=300, help="distinct concepts shared across chunks")
+    parser.add_argument("--top-k", type=int, default=2)
+    parser.add_argument("--candidates", type=int, default=10)
+    parser.add_argument("--rrf-k", type=int, default=60)
+    parser.add_argument("--seed", type=int, default=0)
+    main(parser.parse_args())
@@ -0,0 +1,58 @@
+"""
+PDF parsing throughput: pages/s for the process pool at increasing worker counts
+
+The baseline is SimpleDirectoryReader parsing the same file in a single thread,
+which is what process_pdf did before the pool existed.
+
+Usage (from backend/):
+    python -m benchmarks.pdf_parsing --pages 400
+"""
+import argparse
+import multiprocessing
+import os
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from llama_index.core import SimpleDirectoryReader
+
+from app.services.pdf_parser import iter_pdf_pages, parse_page_range
+from benchmarks.fakes import make_pdf
+
+
+def time_pool(path: str, workers: int, pages_per_task: int) -> tuple[float, int]:
+    context = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=workers, mp_context=context) as pool:
+        # Start the workers before timing so spawn cost is not counted
+        list(pool.map(parse_page_range, [path] * workers, [0] * workers, [1] * workers))
+        start = time.perf_counter()
+        pages = sum(len(documents) for documents in iter_pdf_pages(path, pool, pages_per_task))
+        return time.perf_counter() - start, pages
+
+
+def main(args: argparse.Namespace) -> None:
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "bench.pdf")
+        with open(path, "wb") as f:
+            f.write(make_pdf(args.pages, args.lines))
+
+        start = time.perf_counter()
+        pages = len(SimpleDirectoryReader(input_files=[path]).load_data())
+        baseline = time.perf_counter() - start
+        print(f"{'workers':<10}{'seconds':>10}{'pages/s':>10}{'speedup':>10}")
+        print(f"{'baseline':<10}{baseline:>10.2f}{pages / baseline:>10.1f}{1:>10.2f}")
+
+        workers = 1
+        while workers <= args.max_workers:
+            elapsed, pages = time_pool(path, workers, args.pages_per_task)
+            print(f"{workers:<10}{elapsed:>10.2f}{pages / elapsed:>10.1f}{baseline / elapsed:>10.2f}")
+            workers *= 2
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="PDF parsing throughput vs worker count")
+    parser.add_argument("--pages", type=int, default=400)
+    parser.add_argument("--lines", type=int, default=60, help="text lines per page")
+    parser.add_argument("--pages-per-task", type=int, default=16)
+    parser.add_argument("--max-workers", type=int, default=os.cpu_count() or 1)
+    main(parser.parse_args())
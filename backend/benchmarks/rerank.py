@@ -0,0 +1,155 @@
+"""
+Reranking: answer-context precision and added latency on CPU
+
+The synthetic corpus plants, for every query, a few relevant chunks that mention all of
+the query's concepts and several near-misses that mention only some of them, among
+background chunks. The first stage is a deliberately coarse dense retriever (a
+low-dimensional hashed bag of words), standing in for approximate vector search; it
+over-fetches candidates and the reranker keeps the best top-k. Precision@k is the share
+of the final context that is relevant. Latency is the time the rerank stage adds, with a
+cold and a warm (query, node) score cache.
+
+--scorer cross-encoder runs RERANK_MODEL on the CPU (needs sentence-transformers);
+--scorer stand-in rescores with a sharper hashed bag of words, to exercise the rerank
+stage and its score cache without the model.
+
+Usage (from backend/):
+    python -m benchmarks.rerank --queries 200 --candidates 20 --top-k 3
+"""
+import os
+import tempfile
+
+# Keep the app's on-disk stores out of the working tree
+BENCH_DIR = tempfile.mkdtemp(prefix="bench-")
+os.environ.setdefault("EMBEDDING_CACHE_PATH", f"{BENCH_DIR}/embeddings.sqlite3")
+os.environ.setdefault("BM25_INDEX_PATH", f"{BENCH_DIR}/bm25.sqlite3")
+
+import argparse
+import asyncio
+import hashlib
+import logging
+import time
+from typing import List
+
+import numpy as np
+from llama_index.core import QueryBundle, VectorStoreIndex
+from llama_index.core.base.embeddings.base import BaseEmbedding
+from llama_index.core.schema import TextNode
+
+from app.services.compression import normalized
+from app.services.rerank import CrossEncoderScorer, RerankingRetriever, ScoreCache, node_text
+from app.config import RERANK_MODEL, RERANK_BATCH_SIZE
+from app.utils.logger import logger
+
+
+class HashedBagEmbedding(BaseEmbedding):
+    """Sum of per-word pseudo-random vectors; a small `dim` makes it coarse, a large one sharp"""
+
+    dim: int = 32
+
+    def _embed(self, text: str) -> List[float]:
+        vector = np.zeros(self.dim)
+        for word in text.lower().replace(".", " ").split():
+            seed = int.from_bytes(hashlib.sha256(word.encode()).digest()[:8], "little")
+            vector += np.random.default_rng(seed).standard_normal(self.dim)
+        return (vector / max(np.linalg.norm(vector), 1e-12)).tolist()
+
+    def _get_query_embedding(self, query: str) -> List[float]:
+        return self._embed(query)
+
+    def _get_text_embedding(self, text: str) -> List[float]:
+        return self._embed(text)
+
+    async def _aget_query_embedding(self, query: str) -> List[float]:
+        return self._embed(query)
+
+
+class StandInScorer:
+    """Cosine similarity under a sharp HashedBagEmbedding, in place of the cross-encoder"""
+
+    name = "stand-in"
+
+    def __init__(self, dim: int = 1024):
+        self.model = HashedBagEmbedding(dim=dim)
+
+    async def score(self, query_bundle: QueryBundle, nodes) -> np.ndarray:
+        query_embedding = self.model.get_query_embedding(query_bundle.query_str)
+        node_embeddings = [self.model.get_text_embedding(node_text(node)) for node in nodes]
+        return normalized(node_embeddings) @ normalized(query_embedding)
+
+
+def build_corpus(args: argparse.Namespace, rng: np.random.Generator):
+    concepts = [f"c{index}" for index in range(args.concepts)]
+
+    def chunk_text(words) -> str:
+        return "Notes on " + " ".join(rng.permutation(list(words))) + "."
+
+    nodes, queries = [], []
+    for query_index in range(args.queries):
+        wanted = list(rng.choice(concepts, size=3, replace=False))
+        relevant = set()
+        for _ in range(args.relevant):
+            node = TextNode(id_=f"q{query_index}-r{len(relevant)}", text=chunk_text(wanted + list(rng.choice(concepts, 2))))
+            nodes.append(node)
+            relevant.add(node.node_id)
+        for near in range(args.near_misses):
+            partial = list(rng.choice(wanted, size=2, replace=False))
+            nodes.append(TextNode(id_=f"q{query_index}-n{near}", text=chunk_text(partial + list(rng.choice(concepts, 3)))))
+        queries.append((f"Notes on {' '.join(wanted)}", relevant))
+    for index in range(args.background):
+        nodes.append(TextNode(id_=f"b{index}", text=chunk_text(rng.choice(concepts, size=5, replace=False))))
+    return nodes, queries
+
+
+def precision(nodes, relevant, top_k: int) -> float:
+    return sum(node.node.node_id in relevant for node in nodes[:top_k]) / top_k
+
+
+async def run(args: argparse.Namespace) -> None:
+    rng = np.random.default_rng(args.seed)
+    nodes, queries = build_corpus(args, rng)
+    coarse = HashedBagEmbedding(dim=args.first_stage_dim)
+    first_stage = VectorStoreIndex(nodes, embed_model=coarse).as_retriever(similarity_top_k=args.candidates)
+    if args.scorer == "stand-in":
+        scorer = StandInScorer()
+    else:
+        scorer = CrossEncoderScorer(RERANK_MODEL, RERANK_BATCH_SIZE)
+    reranker = RerankingRetriever(first_stage, scorer, args.top_k, cache=ScoreCache(len(queries) * args.candidates))
+    print(f"{len(nodes)} chunks, {len(queries)} queries, {args.candidates} candidates -> top {args.top_k}")
+
+    results = {"first stage": [], "reranked (cold)": [], "reranked (warm)": []}
+    added = {"reranked (cold)": [], "reranked (warm)": []}
+    for name in ("reranked (cold)", "reranked (warm)"):
+        for query, relevant in queries:
+            bundle = QueryBundle(query_str=query, embedding=coarse.get_query_embedding(query))
+            candidates = await first_stage.aretrieve(bundle)
+            if name == "reranked (cold)":
+                results["first stage"].append(precision(candidates, relevant, args.top_k))
+
+            start = time.perf_counter()
+            reranked = await reranker._rerank(bundle, candidates)
+            added[name].append(time.perf_counter() - start)
+            results[name].append(precision(reranked, relevant, args.top_k))
+
+    print(f"{'context':<18}{f'precision@{args.top_k}':>14}{'added p50 ms':>14}{'added p99 ms':>14}")
+    for name, scores in results.items():
+        latency = added.get(name)
+        p50 = f"{np.percentile(latency, 50) * 1000:>14.2f}" if latency else f"{'-':>14}"
+        p99 = f"{np.percentile(latency, 99) * 1000:>14.2f}" if latency else f"{'-':>14}"
+        print(f"{name:<18}{np.mean(scores):>14.3f}{p50}{p99}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Answer-context precision and latency of reranking on CPU")
+    parser.add_argument("--scorer", choices=("cross-encoder", "stand-in"), default="cross-encoder")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--concepts", type=int, default=400)
+    parser.add_argument("--relevant", type=int, default=3, help="relevant chunks planted per query")
+    parser.add_argument("--near-misses", type=int, default=8, help="chunks sharing only part of a query")
+    parser.add_argument("--background", type=int, default=2000)
+    parser.add_argument("--first-stage-dim", type=int, default=24)
+    parser.add_argument("--candidates", type=int, default=20)
+    parser.add_argument("--top-k", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=0)
+    logger.setLevel(logging.WARNING)
+    asyncio.run(run(parser.parse_args()))
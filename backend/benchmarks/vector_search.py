@@ -0,0 +1,73 @@
+"""
+Local vector store: IVF recall and latency against brute-force NumPy search
+
+Builds a LocalVectorIndex over clustered synthetic vectors and compares its
+top-k results with an exact dot-product search over the same matrix.
+
+Usage (from backend/):
+    python -m benchmarks.vector_search --vectors 100000 --queries 200
+"""
+import argparse
+import tempfile
+import time
+
+import numpy as np
+from llama_index.core.schema import TextNode
+
+from app.services.local_vector_store import LocalVectorIndex, normalize
+
+
+def synthetic_vectors(count: int, dim: int, clusters: int, noise: float, rng: np.random.Generator) -> np.ndarray:
+    """Unit vectors scattered around random cluster centers, like topic-grouped chunks"""
+    centers = normalize(rng.standard_normal((clusters, dim)).astype(np.float32))
+    labels = rng.integers(clusters, size=count)
+    jitter = rng.standard_normal((count, dim)).astype(np.float32) / np.sqrt(dim)
+    return normalize(centers[labels] + noise * jitter)
+
+
+def main(args: argparse.Namespace) -> None:
+    rng = np.random.default_rng(args.seed)
+    vectors = synthetic_vectors(args.vectors, args.dim, args.clusters, args.noise, rng)
+    queries = synthetic_vectors(args.queries, args.dim, args.clusters, args.noise, rng)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        index = LocalVectorIndex(tmp, dim=args.dim, nprobe=args.nprobe, min_train_rows=args.min_train_rows)
+        start = time.perf_counter()
+        for begin in range(0, args.vectors, 5000):
+            batch = vectors[begin:begin + 5000]
+            nodes = [
+                TextNode(id_=str(begin + offset), text=f"chunk {begin + offset}", embedding=vector.tolist())
+                for offset, vector in enumerate(batch)
+            ]
+            index.add("bench_collections", nodes)
+        print(f"Indexed {args.vectors} vectors in {time.perf_counter() - start:.1f}s")
+
+        brute_times, ivf_times, recalls = [], [], []
+        for query in queries:
+            start = time.perf_counter()
+            scores = vectors @ query
+            exact = set(np.argpartition(-scores, args.top_k)[: args.top_k].tolist())
+            brute_times.append(time.perf_counter() - start)
+
+            start = time.perf_counter()
+            rows, _ = index.search("bench_collections", query, args.top_k)
+            ivf_times.append(time.perf_counter() - start)
+            recalls.append(len(exact & set(rows)) / args.top_k)
+
+    print(f"{'method':<14}{'recall@' + str(args.top_k):>10}{'p50 ms':>10}{'p99 ms':>10}")
+    for name, times, recall in (("brute-force", brute_times, 1.0), (f"ivf nprobe={args.nprobe}", ivf_times, np.mean(recalls))):
+        print(f"{name:<14}{recall:>10.3f}{np.percentile(times, 50) * 1000:>10.2f}{np.percentile(times, 99) * 1000:>10.2f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Local vector store recall/latency benchmark")
+    parser.add_argument("--vectors", type=int, default=100_000)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--dim", type=int, default=768)
+    parser.add_argument("--clusters", type=int, default=200, help="topic clusters in the synthetic data")
+    parser.add_argument("--noise", type=float, default=1.0, help="spread of vectors around their cluster")
+    parser.add_argument("--top-k", type=int, default=10)
+    parser.add_argument("--nprobe", type=int, default=32)
+    parser.add_argument("--min-train-rows", type=int, default=4096)
+    parser.add_argument("--seed", type=int, default=0)
+    main(parser.parse_args())
@@ -0,0 +1,21 @@
+import os
+import tempfile
+
+# Settings are read when app.config is imported: keep every on-disk store out of the working tree
+TEST_DIR = tempfile.mkdtemp(prefix="rag-tests-")
+for name, value in {
+    "GEMINI_API_KEY": "test",
+    "GROQ_API_KEY": "test",
+    "API_KEY": "test",
+    "LOG_FORMAT": "text",
+    "EMBEDDING_CACHE_PATH": f"{TEST_DIR}/embeddings.sqlite3",
+    "PDF_INDEX_PATH": f"{TEST_DIR}/pdf_index.sqlite3",
+    "BM25_INDEX_PATH": f"{TEST_DIR}/bm25.sqlite3",
+    "SESSION_STORE_URL": f"{TEST_DIR}/sessions.sqlite3",
+    "JOBS_DB_PATH": f"{TEST_DIR}/jobs.sqlite3",
+    "BATCH_DB_PATH": f"{TEST_DIR}/batches.sqlite3",
+    "UPLOAD_SPOOL_DIR": f"{TEST_DIR}/uploads",
+    "PDF_STORAGE_DIR": f"{TEST_DIR}/pdfs",
+    "LOCAL_VECTOR_STORE_PATH": f"{TEST_DIR}/vectors",
+}.items():
+    os.environ.setdefault(name, value)
@@ -0,0 +1,146 @@
+import asyncio
+
+import pytest
+
+from app.services.admission import AdmissionController, Overloaded, find_overload
+
+
+class RateLimited(Exception):
+    status_code = 429
+
+
+def controller(max_limit=4, min_limit=1, queue_size=2, queue_timeout=1.0):
+    return AdmissionController(
+        "test", max_limit=max_limit, min_limit=min_limit, rate=0, backoff_ratio=0.5,
+        queue_size=queue_size, queue_timeout=queue_timeout,
+    )
+
+
+def test_limit_is_cut_multiplicatively_once_per_round_trip_and_grows_additively():
+    admission = controller(max_limit=8, min_limit=2)
+
+    async def main():
+        for _ in range(3):
+            await admission.acquire("standard")
+        # Calls in flight together fail together: only the first cuts the limit
+        admission.release(RateLimited())
+        admission.release(RateLimited())
+        assert admission.limit == 4
+        admission.release(latency=0.1)
+        assert admission.limit == pytest.approx(4.25)
+
+        # Another overload once a round trip has passed cuts again, down to the floor
+        admission._last_decrease = 0
+        for _ in range(2):
+            await admission.acquire("standard")
+            admission._last_decrease = 0
+            admission.release(RateLimited())
+        assert admission.limit == 2
+        assert admission.capacity == 2
+
+        # Each success adds 1 / limit, so the limit climbs back and stops at the maximum
+        for _ in range(40):
+            await admission.acquire("standard")
+            admission.release(latency=0.1)
+        assert admission.limit == 8
+
+    asyncio.run(main())
+
+
+def test_errors_that_are_not_overload_leave_the_limit_alone():
+    admission = controller()
+
+    async def main():
+        await admission.acquire("standard")
+        admission.release(ValueError("bad input"))
+
+    asyncio.run(main())
+    assert admission.limit == 4
+    assert admission.in_flight == 0
+
+
+def test_waiters_are_served_by_priority_then_arrival():
+    admission = controller(max_limit=1, queue_size=4)
+    served = []
+
+    async def call(name, priority):
+        await admission.acquire(priority)
+        served.append(name)
+        await asyncio.sleep(0.01)
+        admission.release(latency=0.01)
+
+    async def main():
+        await admission.acquire("standard")
+        tasks = [
+            asyncio.create_task(call("bulk", "bulk")),
+            asyncio.create_task(call("standard", "standard")),
+            asyncio.create_task(call("interactive-1", "interactive")),
+            asyncio.create_task(call("interactive-2", "interactive")),
+        ]
+        await asyncio.sleep(0.01)
+        admission.release(latency=0.01)
+        await asyncio.gather(*tasks)
+
+    asyncio.run(main())
+    assert served == ["interactive-1", "interactive-2", "standard", "bulk"]
+
+
+def test_a_full_queue_sheds_the_newest_lowest_priority_waiter():
+    admission = controller(max_limit=1, queue_size=2)
+
+    async def main():
+        await admission.acquire("standard")
+        older_bulk = asyncio.create_task(admission.acquire("bulk"))
+        newer_bulk = asyncio.create_task(admission.acquire("bulk"))
+        await asyncio.sleep(0)
+
+        # Same or lower priority than every waiter: rejected outright
+        with pytest.raises(Overloaded) as rejected:
+            admission.check("bulk")
+        assert rejected.value.reason == "queue_full"
+        with pytest.raises(Overloaded):
+            await admission.acquire("bulk")
+
+        # Higher priority: displaces the most recent bulk waiter
+        admission.check("interactive")
+        interactive = asyncio.create_task(admission.acquire("interactive"))
+        await asyncio.sleep(0)
+        with pytest.raises(Overloaded) as shed:
+            await newer_bulk
+        assert shed.value.reason == "shed"
+        assert shed.value.retry_after >= 1
+
+        admission.release(latency=0.01)
+        await interactive
+        assert not older_bulk.done()
+        admission.release(latency=0.01)
+        await older_bulk
+        admission.release(latency=0.01)
+
+    asyncio.run(main())
+    assert admission.in_flight == 0
+
+
+def test_a_waiter_past_its_deadline_is_rejected():
+    admission = controller(max_limit=1, queue_timeout=0.02)
+
+    async def main():
+        await admission.acquire("standard")
+        with pytest.raises(Overloaded) as rejected:
+            await admission.acquire("standard")
+        return rejected.value
+
+    assert asyncio.run(main()).reason == "timeout"
+    assert admission._waiters == []
+
+
+def test_find_overload_follows_reraised_errors():
+    overload = Overloaded("groq", 3, "queue_full")
+    try:
+        try:
+            raise overload
+        except Overloaded as e:
+            raise RuntimeError("query failed") from e
+    except RuntimeError as wrapped:
+        assert find_overload(wrapped) is overload
+    assert find_overload(ValueError("other")) is None
@@ -0,0 +1,67 @@
+import math
+
+import pytest
+from llama_index.core.schema import NodeRelationship, RelatedNodeInfo, TextNode
+
+from app.services.bm25 import BM25Index, tokenize
+
+
+@pytest.fixture
+def index(tmp_path):
+    return BM25Index(str(tmp_path / "bm25.sqlite3"))
+
+
+def node(node_id, text, ref_doc_id=None):
+    relationships = {NodeRelationship.SOURCE: RelatedNodeInfo(node_id=ref_doc_id)} if ref_doc_id else {}
+    return TextNode(id_=node_id, text=text, relationships=relationships)
+
+
+def test_tokenize_drops_stopwords_and_keeps_identifiers_with_their_parts():
+    assert tokenize("What is the ACE-inhibitor dose in 2301.01234?") == [
+        "ace-inhibitor", "ace", "inhibitor", "dose", "2301.01234", "2301", "01234",
+    ]
+
+
+def test_scores_match_the_bm25_formula(index):
+    index.add("tech", [
+        node("a", "kafka consumer groups"),
+        node("b", "kafka kafka partitions rebalance"),
+        node("c", "postgres vacuum tuning"),
+    ])
+    results = dict((result.node_id, score) for result, score in index.search("tech", "kafka", top_k=5))
+
+    k1, b, doc_count, df, avg_length = 1.2, 0.75, 3, 2, 10 / 3
+    idf = math.log(1 + (doc_count - df + 0.5) / (df + 0.5))
+
+    def expected(tf, length):
+        return idf * tf * (k1 + 1) / (tf + k1 * (1 - b + b * length / avg_length))
+
+    assert set(results) == {"a", "b"}
+    assert results["a"] == pytest.approx(expected(1, 3))
+    assert results["b"] == pytest.approx(expected(2, 4))
+    assert results["b"] > results["a"]
+
+
+def test_rare_terms_outrank_common_ones(index):
+    index.add("tech", [node(str(i), f"vertebral column part {i}") for i in range(5)] + [node("rare", "vertebral scoliosis")])
+    best, _ = index.search("tech", "vertebral scoliosis", top_k=1)[0]
+    assert best.node_id == "rare"
+
+
+def test_replaced_and_deleted_nodes_leave_the_index(index):
+    index.add("tech", [node("a", "kafka consumer"), node("b", "kafka streams", ref_doc_id="doc")])
+    index.add("tech", [node("a", "postgres replication")])
+    assert [result.node_id for result, _ in index.search("tech", "kafka", top_k=5)] == ["b"]
+    assert [result.node_id for result, _ in index.search("tech", "postgres", top_k=5)] == ["a"]
+
+    index.delete("tech", "doc")
+    assert index.search("tech", "kafka", top_k=5) == []
+
+    index.clear("tech")
+    assert index.search("tech", "postgres", top_k=5) == []
+
+
+def test_categories_are_separate(index):
+    index.add("tech", [node("a", "kafka consumer")])
+    index.add("medical", [node("b", "kafka syndrome")])
+    assert [result.node_id for result, _ in index.search("medical", "kafka", top_k=5)] == ["b"]
@@ -0,0 +1,77 @@
+import asyncio
+
+import pytest
+
+from app.utils.concurrency import SingleFlight
+
+
+def test_concurrent_calls_share_one_execution():
+    flights = SingleFlight("test")
+    calls = []
+
+    async def fetch(value):
+        calls.append(value)
+        await asyncio.sleep(0.01)
+        return value * 2
+
+    async def main():
+        return await asyncio.gather(*(flights.do("key", fetch, 21) for _ in range(5)))
+
+    assert asyncio.run(main()) == [42] * 5
+    assert calls == [21]
+    assert flights.stats == {"executions": 1, "coalesced": 4}
+
+
+def test_every_caller_receives_the_error_and_the_key_is_released():
+    flights = SingleFlight("test")
+    attempts = []
+
+    async def fail():
+        attempts.append(1)
+        await asyncio.sleep(0.01)
+        raise ValueError("upstream failed")
+
+    async def main():
+        results = await asyncio.gather(*(flights.do("key", fail) for _ in range(3)), return_exceptions=True)
+        # A failure is not cached: the next call runs afresh
+        with pytest.raises(ValueError):
+            await flights.do("key", fail)
+        return results
+
+    results = asyncio.run(main())
+    assert all(isinstance(result, ValueError) and str(result) == "upstream failed" for result in results)
+    assert len(attempts) == 2
+    assert flights._calls == {}
+
+
+def test_a_cancelled_caller_does_not_cancel_the_others():
+    flights = SingleFlight("test")
+
+    async def slow():
+        await asyncio.sleep(0.05)
+        return "done"
+
+    async def main():
+        first = asyncio.create_task(flights.do("key", slow))
+        second = asyncio.create_task(flights.do("key", slow))
+        await asyncio.sleep(0.01)
+        first.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await first
+        return await second
+
+    assert asyncio.run(main()) == "done"
+
+
+def test_different_keys_run_separately():
+    flights = SingleFlight("test")
+
+    async def echo(value):
+        await asyncio.sleep(0.01)
+        return value
+
+    async def main():
+        return await asyncio.gather(flights.do("a", echo, 1), flights.do("b", echo, 2))
+
+    assert asyncio.run(main()) == [1, 2]
+    assert flights.stats["executions"] == 2
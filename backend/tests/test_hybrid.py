@@ -0,0 +1,32 @@
+import pytest
+from llama_index.core.schema import TextNode
+
+from app.services.hybrid import reciprocal_rank_fusion
+
+
+def nodes(*ids):
+    return [TextNode(id_=node_id, text=node_id) for node_id in ids]
+
+
+def test_nodes_ranked_well_by_both_retrievers_come_first():
+    dense = nodes("a", "b", "c", "d")
+    sparse = nodes("c", "a", "e")
+    fused = reciprocal_rank_fusion([dense, sparse], top_k=3, rrf_k=60)
+
+    assert [result.node.node_id for result in fused] == ["a", "c", "b"]
+    assert fused[0].score == pytest.approx(1 / 61 + 1 / 62)
+    assert fused[1].score == pytest.approx(1 / 63 + 1 / 61)
+    assert fused[2].score == pytest.approx(1 / 62)
+
+
+def test_a_node_found_by_one_retriever_is_kept():
+    fused = reciprocal_rank_fusion([nodes("a", "b"), []], top_k=5, rrf_k=60)
+    assert [result.node.node_id for result in fused] == ["a", "b"]
+
+
+def test_small_rrf_k_favours_top_ranks():
+    dense = nodes("a", "b", "c")
+    sparse = nodes("d", "b", "c")
+    # With a small constant, a single first place beats two second places
+    assert reciprocal_rank_fusion([dense, sparse], top_k=1, rrf_k=0)[0].node.node_id in ("a", "d")
+    assert reciprocal_rank_fusion([dense, sparse], top_k=1, rrf_k=60)[0].node.node_id == "b"
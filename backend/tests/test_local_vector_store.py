@@ -0,0 +1,87 @@
+import numpy as np
+import pytest
+from llama_index.core.schema import TextNode
+
+from app.services.local_vector_store import LocalVectorIndex, normalize
+
+DIM = 32
+
+
+def clustered_vectors(count: int, centers: np.ndarray, rng: np.random.Generator) -> np.ndarray:
+    labels = rng.integers(len(centers), size=count)
+    return normalize(centers[labels] + 0.3 * rng.standard_normal((count, DIM)).astype(np.float32) / np.sqrt(DIM))
+
+
+def add_vectors(index: LocalVectorIndex, collection: str, vectors: np.ndarray, start: int = 0) -> None:
+    nodes = [
+        TextNode(id_=f"n{start + i}", text=f"node {start + i}", embedding=vector.tolist())
+        for i, vector in enumerate(vectors)
+    ]
+    index.add(collection, nodes)
+
+
+def test_ivf_search_recalls_the_exact_neighbours(tmp_path):
+    rng = np.random.default_rng(0)
+    centers = normalize(rng.standard_normal((40, DIM)).astype(np.float32))
+    index = LocalVectorIndex(str(tmp_path), dim=DIM, nprobe=8, min_train_rows=1000)
+    add_vectors(index, "tech", clustered_vectors(3000, centers, rng))
+    assert index._centroids is not None
+
+    recalls = []
+    for query in clustered_vectors(50, centers, rng):
+        approximate, _ = index.search("tech", query, top_k=10)
+        exact, _ = index.search("tech", query, top_k=10, exact=True)
+        recalls.append(len(set(approximate) & set(exact)) / 10)
+    assert np.mean(recalls) >= 0.9
+
+
+def test_search_is_exact_before_training(tmp_path):
+    rng = np.random.default_rng(1)
+    vectors = normalize(rng.standard_normal((200, DIM)).astype(np.float32))
+    index = LocalVectorIndex(str(tmp_path), dim=DIM, min_train_rows=1000)
+    add_vectors(index, "tech", vectors)
+
+    rows, similarities = index.search("tech", vectors[17], top_k=3)
+    assert index._centroids is None
+    assert index.get_nodes(rows[:1])[0].node_id == "n17"
+    assert similarities[0] == pytest.approx(1.0, abs=1e-5)
+
+
+def test_collections_and_deletes_are_respected(tmp_path):
+    rng = np.random.default_rng(2)
+    vectors = normalize(rng.standard_normal((20, DIM)).astype(np.float32))
+    index = LocalVectorIndex(str(tmp_path), dim=DIM)
+    add_vectors(index, "tech", vectors[:10])
+    add_vectors(index, "medical", vectors[10:], start=10)
+
+    rows, _ = index.search("tech", vectors[12], top_k=20)
+    assert {node.node_id for node in index.get_nodes(rows)} == {f"n{i}" for i in range(10)}
+
+    index.clear("medical")
+    assert index.search("medical", vectors[12], top_k=5)[0] == []
+
+
+def test_writes_from_another_instance_are_visible(tmp_path):
+    rng = np.random.default_rng(3)
+    vectors = normalize(rng.standard_normal((40, DIM)).astype(np.float32))
+    reader = LocalVectorIndex(str(tmp_path), dim=DIM)
+    writer = LocalVectorIndex(str(tmp_path), dim=DIM)
+    add_vectors(writer, "tech", vectors[:20])
+    add_vectors(reader, "tech", vectors[20:], start=20)
+
+    # Rows allocated by the two instances never collide
+    rows, _ = reader.search("tech", vectors[5], top_k=40)
+    assert sorted(node.node_id for node in reader.get_nodes(rows)) == sorted(f"n{i}" for i in range(40))
+
+    writer.clear("tech")
+    assert reader.search("tech", vectors[5], top_k=5)[0] == []
+
+    # Re-adding deleted nodes reuses their rows
+    add_vectors(writer, "tech", vectors[:5])
+    assert len(writer.search("tech", vectors[5], top_k=10)[0]) == 5
+    assert len(reader.search("tech", vectors[5], top_k=10)[0]) == 5
+
+    # So does an upsert, which moves the node
+    add_vectors(reader, "tech", vectors[30:31], start=0)
+    rows, _ = writer.search("tech", vectors[30], top_k=1)
+    assert writer.get_nodes(rows)[0].node_id == "n0"
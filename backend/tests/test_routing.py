@@ -0,0 +1,72 @@
+import asyncio
+
+import numpy as np
+import pytest
+from llama_index.core import QueryBundle
+from llama_index.core.schema import MetadataMode, NodeWithScore, TextNode
+
+from app.services.compression import QUERY_SIMILARITY_KEY, pack
+from app.services.routing import choose_tier, retrieval_confidence, visible_answer, visible_stream
+from app.services.sessions import strip_reasoning
+
+ANSWERS = [
+    "<think>\nThe user asks about X.\n</think>\n\nX is a letter.",
+    "No reasoning here, and 1 < 2 <thin ice.",
+    "<think>never closed",
+]
+
+
+async def tokens(chunks):
+    for chunk in chunks:
+        yield chunk
+
+
+async def collect(stream):
+    return "".join([token async for token in stream])
+
+
+def splits(text, size):
+    return [text[start:start + size] for start in range(0, len(text), size)]
+
+
+def test_non_streaming_answers_drop_reasoning_unless_asked():
+    text = ANSWERS[0]
+    assert visible_answer(text, reasoning=False) == "X is a letter."
+    assert visible_answer(text, reasoning=True) == text
+
+
+@pytest.mark.parametrize("text", ANSWERS)
+@pytest.mark.parametrize("size", [1, 2, 3, 5, 8, 1000])
+def test_streamed_answers_match_the_non_streaming_text_however_tags_are_split(text, size):
+    streamed = asyncio.run(collect(visible_stream(tokens(splits(text, size)), reasoning=False)))
+    assert streamed == strip_reasoning(text)
+
+
+def test_streamed_answers_keep_reasoning_when_asked():
+    text = ANSWERS[0]
+    streamed = asyncio.run(collect(visible_stream(tokens(splits(text, 3)), reasoning=True)))
+    assert streamed == text
+
+
+def test_visible_text_is_not_held_back_longer_than_a_possible_tag():
+    async def main():
+        stream = visible_stream(tokens(["Hello wor", "ld <th", "ink>hidden</think> done"]), reasoning=False)
+        return [token async for token in stream]
+
+    assert asyncio.run(main()) == ["Hello wor", "ld ", "done"]
+
+
+def test_confidence_is_the_best_sentence_score_recorded_by_compression():
+    node = NodeWithScore(node=TextNode(text="Kafka stores logs. Postgres vacuums tables."), score=0.1)
+    packed = pack([node], [["Kafka stores logs.", "Postgres vacuums tables."]], [np.array([0.82, 0.31])], 0.0, 100)
+
+    assert retrieval_confidence(packed) == pytest.approx(0.82)
+    assert QUERY_SIMILARITY_KEY not in packed[0].node.get_content(metadata_mode=MetadataMode.LLM)
+    assert QUERY_SIMILARITY_KEY not in node.node.metadata
+
+
+def test_uncompressed_context_is_routed_to_the_strong_tier():
+    node = NodeWithScore(node=TextNode(text="Kafka stores logs."), score=0.9)
+    bundle = QueryBundle(query_str="What does Kafka store?")
+    assert retrieval_confidence([node]) is None
+    assert asyncio.run(choose_tier(bundle, [node])) == ("strong", "unscored")
@@ -0,0 +1,49 @@
+import threading
+import time
+
+from app.services import vector_store
+from app.services.vector_store import IndexRegistry
+
+
+def test_concurrent_builds_share_one_index_and_leave_no_locks_behind(monkeypatch):
+    builds = []
+
+    def slow_store(collection_name):
+        builds.append(collection_name)
+        time.sleep(0.05)
+        return object()
+
+    monkeypatch.setattr(vector_store, "create_vector_store", slow_store)
+    monkeypatch.setattr(vector_store.VectorStoreIndex, "from_vector_store", classmethod(lambda cls, vector_store, embed_model: vector_store))
+    registry = IndexRegistry(max_entries=2)
+
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(registry.get("tech"))) for _ in range(5)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert builds == ["tech_collections"]
+    assert len({id(result) for result in results}) == 1
+    assert registry._build_locks == {}
+
+    for category in ("medical", "law", "pdf"):
+        registry.get(category)
+    assert registry.stats()["cached"] == ["law", "pdf"]
+    assert set(registry._cold_starts) == {"law", "pdf"}
+    assert registry._build_locks == {}
+
+
+def test_a_failed_build_releases_its_lock(monkeypatch):
+    def broken_store(collection_name):
+        raise ConnectionError("store unavailable")
+
+    monkeypatch.setattr(vector_store, "create_vector_store", broken_store)
+    registry = IndexRegistry(max_entries=2)
+    for _ in range(2):
+        try:
+            registry.get("tech")
+        except ConnectionError:
+            pass
+    assert registry._build_locks == {}
@@ -1,110 +1,204 @@
-from dotenv import load_dotenv
-import os
-
-os.environ["TRANSFORMERS_NO_ADVISORY_WARNINGS"] = "1"
-
-import argparse
-from llama_index.core import (
-    VectorStoreIndex,
-    SimpleDirectoryReader,
-    StorageContext,
-)
-from llama_index.embeddings.ollama import OllamaEmbedding
-from llama_index.vector_stores.astra_db import AstraDBVectorStore
-from llama_index.llms.groq import Groq
-
-
-def load_environment_variables():
-    """Load and validate environment variables."""
-    load_dotenv()
-
-    required_vars = {
-        "ASTRA_DB_ENDPOINT": os.getenv("ASTRA_DB_ENDPOINT"),
-        "ASTRA_DB_TOKEN": os.getenv("ASTRA_DB_TOKEN"),
-        "GROQ_API_TOKEN": os.getenv("GROQ_API_TOKEN"),
-    }
-
-    missing_vars = [var for var, value in required_vars.items() if not value]
-    if missing_vars:
-        raise ValueError(
-            f"Missing required environment variables: {', '.join(missing_vars)}"
-        )
-
-    return required_vars
-
-
-def create_vector_store(category, astra_token, astra_endpoint):
-    """Create AstraDB vector store for the specified category."""
-    return AstraDBVectorStore(
-        token=astra_token,
-        api_endpoint=astra_endpoint,
-        collection_name=f"{category}_collections",
-        embedding_dimension=768,
-    )
-
-
-def load_documents(category_path):
-    """Load documents from the specified category directory."""
-    documents = SimpleDirectoryReader(category_path).load_data(num_workers=10)
-    print(f"Total documents loaded: {len(documents)}")
-    if documents:
-        print(f"First document ID: {documents[0].doc_id}")
-        print(f"First document hash: {documents[0].hash}")
-    return documents
-
-
-def create_index(documents, vector_store):
-    """Create vector store index with the specified documents."""
-    embed_model = OllamaEmbedding(model_name="nomic-embed-text")
-    storage_context = StorageContext.from_defaults(vector_store=vector_store)
-    return VectorStoreIndex.from_documents(
-        documents, storage_context=storage_context, embed_model=embed_model
-    )
-
-
-def setup_query_engine(index, groq_token):
-    """Set up the query engine with Groq LLM."""
-    llm = Groq(model="deepseek-r1-distill-llama-70b", api_key=groq_token)
-    return index.as_query_engine(llm=llm)
-
-
-def main(category):
-    """Main function to process documents for a specific category."""
-    try:
-        # Load environment variables
-        env_vars = load_environment_variables()
-
-        # Construct category path
-        category_path = f"./data/{category}/"
-        if not os.path.exists(category_path):
-            raise ValueError(f"category directory not found: {category_path}")
-
-        # Create vector store
-        vector_store = create_vector_store(
-            category, env_vars["ASTRA_DB_TOKEN"], env_vars["ASTRA_DB_ENDPOINT"]
-        )
-
-        # Load and process documents
-        documents = load_documents(category_path)
-        if not documents:
-            raise ValueError(f"No documents found in {category_path}")
-
-        # Create index
-        index = create_index(documents, vector_store)
-        print(f"Successfully created index for {category} category")
-
-    except Exception as e:
-        print(f"Error processing {category} category: {str(e)}")
-        raise
-
-
-if __name__ == "__main__":
-    parser = argparse.ArgumentParser(
-        description="Process documents for a specific category"
-    )
-    parser.add_argument(
-        "category", help="category name (e.g., medical, tech, architectural)"
-    )
-    args = parser.parse_args()
-
-    main(args.category)
+from dotenv import load_dotenv
+import os
+import sys
+from pathlib import Path
+
+os.environ["TRANSFORMERS_NO_ADVISORY_WARNINGS"] = "1"
+
+# Reuse the backend's service modules so both sides share caches and on-disk formats.
+# Load .env first: the backend config reads its paths at import, resolving relative ones against backend/
+sys.path.append(str(Path(__file__).resolve().parent.parent / "backend"))
+load_dotenv()
+
+import argparse
+from app.config import EMBEDDING_CACHE_PATH
+from app.services.bm25 import keyword_index
+from app.services.clients import AsyncAstraDBVectorStore, create_groq, create_ollama_embedding
+from app.services.embedding_cache import CachedEmbedding, EmbeddingStore
+from app.services.local_vector_store import LocalVectorStore
+from manifest import IngestionManifest
+from pipeline import IngestionPipeline, PipelineConfig
+
+
+def load_environment_variables():
+    """Load and validate environment variables."""
+    load_dotenv()
+
+    required_vars = {"GROQ_API_TOKEN": os.getenv("GROQ_API_TOKEN")}
+    # The local vector store backend needs no AstraDB credentials
+    if os.getenv("VECTOR_STORE_BACKEND", "astra") != "local":
+        required_vars["ASTRA_DB_ENDPOINT"] = os.getenv("ASTRA_DB_ENDPOINT")
+        required_vars["ASTRA_DB_TOKEN"] = os.getenv("ASTRA_DB_TOKEN")
+
+    missing_vars = [var for var, value in required_vars.items() if not value]
+    if missing_vars:
+        raise ValueError(
+            f"Missing required environment variables: {', '.join(missing_vars)}"
+        )
+
+    return required_vars
+
+
+def create_vector_store(category, astra_token, astra_endpoint):
+    """Create the vector store for the specified category on the configured backend."""
+    if os.getenv("VECTOR_STORE_BACKEND", "astra") == "local":
+        return LocalVectorStore(f"{category}_collections")
+    # Inserts are retried on 429/5xx within the shared Astra concurrency limit
+    return AsyncAstraDBVectorStore(
+        token=astra_token,
+        api_endpoint=astra_endpoint,
+        collection_name=f"{category}_collections",
+        embedding_dimension=768,
+    )
+
+
+def create_embed_model():
+    """Create the pooled Ollama embedding model behind the shared on-disk embedding cache."""
+    return CachedEmbedding(
+        create_ollama_embedding(model_name="nomic-embed-text"), EmbeddingStore(EMBEDDING_CACHE_PATH)
+    )
+
+
+def print_embedding_stats(embed_model):
+    """Print embedding cache hit/miss counters."""
+    stats = embed_model.stats()
+    print(
+        f"Embedding cache: {stats['hits']} hits, {stats['misses']} misses "
+        f"({stats['hit_rate']:.1%} hit rate)"
+    )
+
+
+def iter_files(category_path):
+    """Yield the non-hidden files under a category directory."""
+    for path in sorted(Path(category_path).rglob("*")):
+        relative_parts = path.relative_to(category_path).parts
+        if path.is_file() and not any(part.startswith(".") for part in relative_parts):
+            yield str(path)
+
+
+def delete_file_documents(vector_store, entry, category):
+    """Delete every node previously inserted for a manifest entry."""
+    for doc_id in entry["doc_ids"]:
+        vector_store.delete(doc_id)
+        keyword_index.delete(category, doc_id)
+
+
+def changed_files(category_path, vector_store, manifest, category):
+    """
+    Yield only new or changed files, cleaning up the vector store as it goes.
+
+    Nodes of removed or half-ingested files are deleted up front, and nodes of
+    changed files are deleted right before the file is re-ingested.
+    """
+    files = list(iter_files(category_path))
+
+    stale = manifest.stale_files(set(files))
+    for file_path in stale:
+        delete_file_documents(vector_store, manifest.get(file_path), category)
+        manifest.remove(file_path)
+    print(f"Removed {len(stale)} deleted or partially ingested files")
+
+    skipped = 0
+    for file_path in files:
+        if manifest.is_current(file_path):
+            skipped += 1
+            continue
+        entry = manifest.get(file_path)
+        if entry is not None:
+            delete_file_documents(vector_store, entry, category)
+        yield file_path
+    print(f"Skipped {skipped} unchanged files")
+
+
+def ingest(category, category_path, vector_store, config, manifest=None):
+    """
+    Stream a category directory into the vector store and the BM25 keyword index.
+
+    With a manifest, only new or changed files are ingested and progress is
+    checkpointed per file, so an interrupted run resumes where it left off.
+    """
+    embed_model = create_embed_model()
+    pipeline = IngestionPipeline(vector_store, embed_model, config, manifest, keyword_index, category)
+
+    if manifest is None:
+        files = iter_files(category_path)
+    else:
+        files = changed_files(category_path, vector_store, manifest, category)
+
+    pipeline.run(files)
+    pipeline.report()
+    print_embedding_stats(embed_model)
+    return pipeline
+
+
+def setup_query_engine(index, groq_token):
+    """Set up the query engine with Groq LLM."""
+    llm = create_groq("deepseek-r1-distill-llama-70b", api_key=groq_token)
+    return index.as_query_engine(llm=llm)
+
+
+def main(category, incremental=False, config=None):
+    """Main function to process documents for a specific category."""
+    try:
+        # Load environment variables
+        env_vars = load_environment_variables()
+
+        # Construct category path
+        category_path = f"./data/{category}/"
+        if not os.path.exists(category_path):
+            raise ValueError(f"category directory not found: {category_path}")
+
+        # Create vector store
+        vector_store = create_vector_store(
+            category, env_vars.get("ASTRA_DB_TOKEN"), env_vars.get("ASTRA_DB_ENDPOINT")
+        )
+
+        manifest = None
+        if incremental:
+            manifest = IngestionManifest(f"./manifests/{category}.sqlite3")
+
+        # Stream documents through the ingestion pipeline
+        pipeline = ingest(category, category_path, vector_store, config, manifest)
+        if not incremental and not pipeline.stats["upsert"].items_in:
+            raise ValueError(f"No documents found in {category_path}")
+
+        print(f"Successfully indexed {category} category")
+
+    except Exception as e:
+        print(f"Error processing {category} category: {str(e)}")
+        raise
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Process documents for a specific category"
+    )
+    parser.add_argument(
+        "category", help="category name (e.g., medical, tech, architectural)"
+    )
+    parser.add_argument(
+        "--incremental",
+        action="store_true",
+        help="only ingest new or changed files, tracked in ./manifests/<category>.sqlite3",
+    )
+    parser.add_argument("--read-workers", type=int, default=4)
+    parser.add_argument("--split-workers", type=int, default=2)
+    parser.add_argument("--embed-workers", type=int, default=4)
+    parser.add_argument("--upsert-workers", type=int, default=2)
+    parser.add_argument("--embed-batch-size", type=int, default=32)
+    parser.add_argument("--upsert-batch-size", type=int, default=64)
+    parser.add_argument(
+        "--queue-size", type=int, default=8, help="items buffered between stages"
+    )
+    args = parser.parse_args()
+
+    config = PipelineConfig(
+        read_workers=args.read_workers,
+        split_workers=args.split_workers,
+        embed_workers=args.embed_workers,
+        upsert_workers=args.upsert_workers,
+        embed_batch_size=args.embed_batch_size,
+        upsert_batch_size=args.upsert_batch_size,
+        queue_size=args.queue_size,
+    )
+    main(args.category, incremental=args.incremental, config=config)
@@ -0,0 +1,118 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+from pathlib import Path
+
+
+def file_hash(path):
+    """Return the SHA-256 of a file's contents."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class IngestionManifest:
+    """
+    Local record of what has been ingested for a category.
+
+    Maps each file path to its mtime, size, content hash and the document and
+    node IDs inserted for it. Entries are written as "pending" before insertion
+    and "done" after, each in its own SQLite transaction, so an interrupted run
+    can clean up and resume from the last file it finished.
+    """
+
+    def __init__(self, path):
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        # Pipeline workers update entries concurrently with the file scan
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS files (
+                path TEXT PRIMARY KEY,
+                mtime REAL NOT NULL,
+                size INTEGER NOT NULL,
+                sha256 TEXT NOT NULL,
+                doc_ids TEXT NOT NULL,
+                node_ids TEXT NOT NULL,
+                status TEXT NOT NULL
+            )
+            """
+        )
+        self._conn.commit()
+
+    def _execute(self, sql, params=()):
+        with self._lock:
+            rows = self._conn.execute(sql, params).fetchall()
+            self._conn.commit()
+        return rows
+
+    def get(self, file_path):
+        rows = self._execute(
+            "SELECT mtime, size, sha256, doc_ids, node_ids, status FROM files WHERE path = ?",
+            (file_path,),
+        )
+        if not rows:
+            return None
+        mtime, size, sha256, doc_ids, node_ids, status = rows[0]
+        return {
+            "mtime": mtime,
+            "size": size,
+            "sha256": sha256,
+            "doc_ids": json.loads(doc_ids),
+            "node_ids": json.loads(node_ids),
+            "status": status,
+        }
+
+    def is_current(self, file_path):
+        """Check whether a file was fully ingested and has not changed since."""
+        entry = self.get(file_path)
+        if entry is None or entry["status"] != "done":
+            return False
+
+        stat = os.stat(file_path)
+        if entry["mtime"] == stat.st_mtime and entry["size"] == stat.st_size:
+            return True
+
+        # Touched but possibly unchanged: compare content before re-ingesting
+        if entry["sha256"] == file_hash(file_path):
+            self._execute(
+                "UPDATE files SET mtime = ?, size = ? WHERE path = ?",
+                (stat.st_mtime, stat.st_size, file_path),
+            )
+            return True
+        return False
+
+    def mark_pending(self, file_path, doc_ids, node_ids):
+        """Record the IDs about to be inserted for a file."""
+        stat = os.stat(file_path)
+        self._execute(
+            "INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?, ?, ?, 'pending')",
+            (
+                file_path,
+                stat.st_mtime,
+                stat.st_size,
+                file_hash(file_path),
+                json.dumps(doc_ids),
+                json.dumps(node_ids),
+            ),
+        )
+
+    def mark_done(self, file_path):
+        self._execute("UPDATE files SET status = 'done' WHERE path = ?", (file_path,))
+
+    def remove(self, file_path):
+        self._execute("DELETE FROM files WHERE path = ?", (file_path,))
+
+    def stale_files(self, current_files):
+        """Files in the manifest that are gone from disk or were left pending."""
+        rows = self._execute("SELECT path, status FROM files")
+        return [
+            path
+            for path, status in rows
+            if path not in current_files or status != "done"
+        ]
@@ -0,0 +1,239 @@
+import queue
+import threading
+import time
+from dataclasses import dataclass, field
+
+from llama_index.core import Settings, SimpleDirectoryReader
+from llama_index.core.schema import MetadataMode
+from app.services.pdf_parser import iter_pdf_pages
+
+# Marks the end of a stage's input
+_DONE = object()
+
+
+@dataclass
+class StageStats:
+    """Throughput and busy time for one pipeline stage."""
+
+    name: str
+    workers: int
+    items_in: int = 0
+    items_out: int = 0
+    busy_seconds: float = 0.0
+    lock: threading.Lock = field(default_factory=threading.Lock, repr=False)
+
+    def record(self, items_in, items_out, seconds):
+        with self.lock:
+            self.items_in += items_in
+            self.items_out += items_out
+            self.busy_seconds += seconds
+
+
+@dataclass
+class PipelineConfig:
+    """Concurrency and buffering knobs for the ingestion pipeline."""
+
+    read_workers: int = 4
+    split_workers: int = 2
+    embed_workers: int = 4
+    upsert_workers: int = 2
+    embed_batch_size: int = 32
+    upsert_batch_size: int = 64
+    queue_size: int = 8
+
+
+class IngestionPipeline:
+    """
+    Bounded-memory ingestion: read -> parse/split -> batch embed -> batch upsert.
+
+    Each stage runs on its own worker threads and hands work to the next through
+    a bounded queue, so a slow stage blocks the ones before it instead of letting
+    documents pile up in memory. Peak memory depends on queue sizes and batch
+    sizes, not on the size of the corpus.
+    """
+
+    def __init__(self, vector_store, embed_model, config=None, manifest=None, keyword_index=None, category=None):
+        self.vector_store = vector_store
+        self.keyword_index = keyword_index
+        self.category = category
+        self.embed_model = embed_model
+        self.config = config or PipelineConfig()
+        self.manifest = manifest
+        self.stats = {}
+        self._error = None
+        self._stop = threading.Event()
+        self._pending_nodes = {}
+        self._pending_lock = threading.Lock()
+        self.documents = 0
+
+    def run(self, files):
+        """Ingest an iterable of file paths and return the stage statistics."""
+        config = self.config
+        files_q = queue.Queue(maxsize=config.queue_size)
+        docs_q = queue.Queue(maxsize=config.queue_size)
+        nodes_q = queue.Queue(maxsize=config.queue_size * config.embed_batch_size)
+        embedded_q = queue.Queue(maxsize=config.queue_size * config.upsert_batch_size)
+
+        stages = [
+            ("read", config.read_workers, files_q, docs_q, self._read, 1),
+            ("split", config.split_workers, docs_q, nodes_q, self._split, 1),
+            ("embed", config.embed_workers, nodes_q, embedded_q, self._embed, config.embed_batch_size),
+            ("upsert", config.upsert_workers, embedded_q, None, self._upsert, config.upsert_batch_size),
+        ]
+
+        start = time.perf_counter()
+        threads = []
+        for index, (name, workers, in_q, out_q, func, batch_size) in enumerate(stages):
+            stats = self.stats[name] = StageStats(name, workers)
+            downstream = stages[index + 1][1] if index + 1 < len(stages) else 0
+            done_counter = [workers]
+            for _ in range(workers):
+                thread = threading.Thread(
+                    target=self._worker,
+                    args=(func, in_q, out_q, batch_size, stats, done_counter, downstream),
+                    daemon=True,
+                )
+                thread.start()
+                threads.append(thread)
+
+        # The file generator is the source stage; its pace is set by the read queue
+        for file_path in files:
+            if not self._put(files_q, file_path):
+                break
+        for _ in range(config.read_workers):
+            self._put(files_q, _DONE)
+
+        for thread in threads:
+            thread.join()
+        self.elapsed = time.perf_counter() - start
+
+        if self._error is not None:
+            raise self._error
+        return self.stats
+
+    def _put(self, q, item):
+        """Put with backpressure, giving up if the pipeline is stopping."""
+        while not self._stop.is_set():
+            try:
+                q.put(item, timeout=0.5)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _take(self, q, batch_size):
+        """Block for one item, then drain up to batch_size without waiting long."""
+        batch = []
+        while not self._stop.is_set():
+            try:
+                item = q.get(timeout=0.5 if not batch else 0.05)
+            except queue.Empty:
+                if batch:
+                    return batch, False
+                continue
+            if item is _DONE:
+                return batch, True
+            batch.append(item)
+            if len(batch) >= batch_size:
+                return batch, False
+        return batch, True
+
+    def _worker(self, func, in_q, out_q, batch_size, stats, done_counter, downstream):
+        try:
+            finished = False
+            while not finished:
+                batch, finished = self._take(in_q, batch_size)
+                if not batch:
+                    continue
+                started = time.perf_counter()
+                outputs = func(batch if batch_size > 1 else batch[0])
+                stats.record(len(batch), len(outputs), time.perf_counter() - started)
+                for output in outputs:
+                    if not self._put(out_q, output):
+                        return
+        except Exception as e:
+            self._error = self._error or e
+            self._stop.set()
+        finally:
+            with stats.lock:
+                done_counter[0] -= 1
+                last = done_counter[0] == 0
+            # The last worker of a stage signals every worker of the next one
+            if last and out_q is not None:
+                for _ in range(downstream):
+                    self._put(out_q, _DONE)
+
+    def _read(self, file_path):
+        if file_path.lower().endswith(".pdf"):
+            # PDFs are split by page range across the shared process pool
+            documents = [
+                document
+                for documents in iter_pdf_pages(file_path)
+                for document in documents
+            ]
+        else:
+            documents = SimpleDirectoryReader(
+                input_files=[file_path], filename_as_id=True
+            ).load_data()
+        with self._pending_lock:
+            self.documents += len(documents)
+        return [(file_path, documents)]
+
+    def _split(self, item):
+        file_path, documents = item
+        nodes = Settings.node_parser.get_nodes_from_documents(documents)
+
+        with self._pending_lock:
+            if not nodes:
+                # Nothing to insert, but remember the file so it is not re-read next run
+                if self.manifest is not None:
+                    self.manifest.mark_pending(file_path, [document.doc_id for document in documents], [])
+                    self.manifest.mark_done(file_path)
+                return []
+
+            self._pending_nodes[file_path] = len(nodes)
+            if self.manifest is not None:
+                self.manifest.mark_pending(
+                    file_path,
+                    [document.doc_id for document in documents],
+                    [node.node_id for node in nodes],
+                )
+        return [(file_path, node) for node in nodes]
+
+    def _embed(self, batch):
+        texts = [node.get_content(metadata_mode=MetadataMode.EMBED) for _, node in batch]
+        embeddings = self.embed_model.get_text_embedding_batch(texts)
+        for (_, node), embedding in zip(batch, embeddings):
+            node.embedding = embedding
+        return batch
+
+    def _upsert(self, batch):
+        nodes = [node for _, node in batch]
+        self.vector_store.add(nodes)
+        if self.keyword_index is not None:
+            self.keyword_index.add(self.category, nodes)
+
+        with self._pending_lock:
+            for file_path, _ in batch:
+                self._pending_nodes[file_path] -= 1
+                if self._pending_nodes[file_path] == 0:
+                    del self._pending_nodes[file_path]
+                    if self.manifest is not None:
+                        self.manifest.mark_done(file_path)
+        return []
+
+    def report(self):
+        """Print end-to-end throughput and per-stage utilization."""
+        read, upsert = self.stats["read"], self.stats["upsert"]
+        print(
+            f"Ingested {read.items_in} files, {self.documents} documents "
+            f"({self.documents / self.elapsed:.2f} docs/s), "
+            f"{upsert.items_in} chunks ({upsert.items_in / self.elapsed:.2f} chunks/s) "
+            f"in {self.elapsed:.1f}s"
+        )
+        for stats in self.stats.values():
+            utilization = stats.busy_seconds / (self.elapsed * stats.workers) if self.elapsed else 0.0
+            print(
+                f"  {stats.name:<7} workers={stats.workers:<3} in={stats.items_in:<7} "
+                f"out={stats.items_out:<7} utilization={utilization:.0%}"
+            )